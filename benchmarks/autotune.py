@@ -0,0 +1,69 @@
+"""Tunes the triangle size of every part of the bundled configuration with
+stok.meshing.tune_mesh and prints the chosen settings, the triangle count
+and chordal deviation they achieve against the limits, the number of
+meshes the search made and its time.
+
+    python benchmarks/autotune.py --budget 20000
+    python benchmarks/autotune.py --max-deviation 2 --components central_solenoid plasma_source
+
+Without --budget every part keeps to the triangle budget of its mesh
+policy. Exits with status 1 if a part misses a limit.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from typing import Optional, Sequence
+
+from stok import STOK, parameters_from_config
+from stok.meshing import BatchExporter
+from stok.stok_modules import named_parts
+
+DEFAULT_COMPONENTS = ("central_solenoid", "plasma_source", "containment_with_divertor_and_ports",
+                      "transformer_limbs", "divertor_firstwall", "divertor_backwall",
+                      "bounding_box")
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    """main : The command line entry point."""
+
+    parser = argparse.ArgumentParser(description="Tune the STOK mesh settings.")
+    parser.add_argument("--max-triangle-size", type=float, default=200.0,
+                        help="the size the search starts from")
+    parser.add_argument("--budget", type=int, default=None,
+                        help="the triangle budget of every part")
+    parser.add_argument("--max-deviation", type=float, default=None, help="in mm")
+    parser.add_argument("--components", nargs="+", default=list(DEFAULT_COMPONENTS))
+    args = parser.parse_args(argv)
+
+    reactor = STOK(parameters_from_config())
+    missed = 0
+    total = {"triangles": 0, "time": 0.0}
+    print(f"{'part':40s} {'size':>8s} {'curv':>4s} {'triangles':>10s} {'budget':>9s} "
+          f"{'deviation':>9s} {'meshes':>6s} {'time':>7s}")
+    with tempfile.TemporaryDirectory() as directory, \
+            BatchExporter(args.max_triangle_size, None, binary=True,
+                          chamber=reactor.chamber) as exporter:
+        for component in args.components:
+            for name, part in named_parts(component, getattr(reactor, component)()):
+                tic = time.perf_counter()
+                report = exporter.export_tuned(part, os.path.join(directory, name + ".stl"),
+                                               args.budget, args.max_deviation,
+                                               component=component)
+                elapsed = time.perf_counter() - tic
+                tuning = report["tuning"]
+                missed += not (tuning["within_budget"] and tuning["within_deviation"])
+                total["triangles"] += tuning["triangles"]
+                total["time"] += elapsed
+                print(f"{name:40s} {tuning['max_triangle_size']:8.1f} {tuning['curvature']:4d} "
+                      f"{tuning['triangles']:10d} {str(tuning['triangle_budget']):>9s} "
+                      f"{tuning['deviation']:9.3f} {len(tuning['meshes']):6d} {elapsed:6.2f}s")
+
+    print(f"{'total':40s} {'':8s} {'':4s} {total['triangles']:10d} {'':9s} {'':9s} "
+          f"{'':6s} {total['time']:6.2f}s")
+    return 1 if missed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,108 @@
+"""Times the analytic point classifier of stok.classify and, optionally,
+compares it with OCC point classification of the CAD components.
+
+    python benchmarks/classifier.py --points 10000000
+    python benchmarks/classifier.py --points 1000000 --check 2000
+
+Exits with status 1 if a checked point is classified differently.
+"""
+import argparse
+import sys
+import time
+from typing import Optional, Sequence
+
+import numpy as np
+
+from stok import parameters_from_config
+from stok.classify import COMPONENTS, VOID, PointClassifier
+
+# The reactor and the space around it, in mm.
+_EXTENT = np.array([14000.0, 14000.0, 7000.0])
+
+# The builders of every classified component, the containment is chosen
+# by the port and divertor options.
+_CONTAINMENT = {(True, True): "containment_with_divertor_and_ports",
+                (True, False): "containment_with_ports",
+                (False, True): "containment_with_divertor",
+                (False, False): "containment"}
+
+
+def cad_classify(points: np.ndarray, ports: bool, divertor: bool) -> np.ndarray:
+    """cad_classify : Classifies points with OCC, one point and solid at a
+    time, in the order of COMPONENTS.
+
+    Returns:
+        np.ndarray: the component and layer of every point, shape (N, 2).
+    """
+
+    # pylint: disable=import-outside-toplevel
+    import cadquery as cq
+
+    from stok import STOK
+
+    reactor = STOK(parameters_from_config())
+    solids = {}
+    for name in COMPONENTS:
+        builder = _CONTAINMENT[(ports, divertor)] if name == "containment" else name
+        result = getattr(reactor, builder)()
+        if name == "sphere_pair_array":
+            result = [sphere for pair in result for sphere in pair]
+        solids[name] = [item.val() for item in (result if isinstance(result, list) else [result])]
+
+    expected = np.full((len(points), 2), VOID)
+    for i, point in enumerate(points):
+        vector = cq.Vector(*point)
+        for index, name in enumerate(COMPONENTS):
+            layer = next((layer for layer, solid in enumerate(solids[name])
+                          if solid.isInside(vector, 1e-6)), None)
+            if layer is not None:
+                expected[i] = index, layer if name == "containment" else VOID
+                break
+    return expected
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    """main : The command line entry point."""
+
+    parser = argparse.ArgumentParser(description="Time the STOK point classifier.")
+    parser.add_argument("--points", type=int, default=10_000_000)
+    parser.add_argument("--check", type=int, default=0,
+                        help="the number of points compared with the CAD")
+    parser.add_argument("--no-ports", action="store_true")
+    parser.add_argument("--no-divertor", action="store_true")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    ports, divertor = not args.no_ports, not args.no_divertor
+    classifier = PointClassifier.from_parameters(parameters_from_config(), ports, divertor)
+    rng = np.random.default_rng(args.seed)
+    points = rng.uniform(-_EXTENT, _EXTENT, (args.points, 3))
+
+    best = float("inf")
+    for _ in range(3):
+        tic = time.perf_counter()
+        component, layer = classifier.classify(points)
+        best = min(best, time.perf_counter() - tic)
+    print(f"{args.points} points in {best:.3f} s, {args.points/best/1e6:.1f} M points/s")
+    for index, count in enumerate(np.bincount(component + 1, minlength=len(COMPONENTS) + 1)):
+        print(f"  {(('void',) + COMPONENTS)[index]:20s} {count}")
+
+    if not args.check:
+        return 0
+
+    # Most of the random points are far from the small components, so the
+    # checked points are mostly taken from inside the containment.
+    checked = np.concatenate([points[:args.check//4],
+                              rng.uniform(-_EXTENT*[0.37, 0.37, 0.5], _EXTENT*[0.37, 0.37, 0.5],
+                                          (args.check - args.check//4, 3))])
+    component, layer = classifier.classify(checked)
+    expected = cad_classify(checked, ports, divertor)
+    wrong = np.flatnonzero((component != expected[:, 0]) | (layer != expected[:, 1]))
+    for i in wrong[:10]:
+        print(f"  {checked[i]}: CAD {expected[i]}, classifier {component[i]}, {layer[i]}")
+    print(f"{len(wrong)} of {len(checked)} checked points differ from the CAD.")
+    return 1 if len(wrong) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
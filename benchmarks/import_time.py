@@ -0,0 +1,77 @@
+"""Checks that the parameter handling of STOK imports fast. Every snippet is
+run in a fresh interpreter, the best of a few runs is compared with the
+target and the heavy modules it must not load are checked.
+
+    python benchmarks/import_time.py --target 0.25
+
+Exits with status 1 if a snippet misses the target or loads cadquery or gmsh.
+"""
+import argparse
+import json
+import subprocess
+import sys
+from typing import Dict, List, Optional, Sequence
+
+# The snippets a sweep coordinator or validation script typically runs.
+SNIPPETS = {
+    "import stok": "import stok",
+    "parameters": "import stok; stok.parameters_from_config()",
+    "config": "from stok.config import load_config; load_config()",
+    "symmetry": "import stok; stok.symmetry_order(*stok.parameters_from_config()[2:4])",
+    "sweep grid": "from stok.sweep import grid; grid(nr_ports=[8, 16], nr_limbs=[8, 16])",
+}
+
+HEAVY_MODULES = ("cadquery", "gmsh", "OCP")
+
+# Runs a snippet and reports its time and the heavy modules it loaded.
+_PROBE = """
+import json, sys, time
+tic = time.perf_counter()
+exec({snippet!r})
+elapsed = time.perf_counter() - tic
+print(json.dumps({{"time": elapsed,
+                   "loaded": [name for name in {heavy!r} if name in sys.modules]}}))
+"""
+
+
+def measure(snippet: str, repeat: int = 5) -> Dict:
+    """measure : Runs a snippet in fresh interpreters.
+
+    Args:
+        snippet (str): the code to time.
+        repeat (int): the number of runs, the best one is kept.
+
+    Returns:
+        Dict: the best time in seconds and the heavy modules that were loaded.
+    """
+    runs: List[Dict] = []
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, "-c", _PROBE.format(snippet=snippet,
+                                                                     heavy=HEAVY_MODULES)],
+                                check=True, capture_output=True, text=True).stdout
+        runs.append(json.loads(output.strip().splitlines()[-1]))
+    return {"time": min(run["time"] for run in runs), "loaded": runs[0]["loaded"]}
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    """main : The command line entry point."""
+
+    parser = argparse.ArgumentParser(description="Check the STOK import time.")
+    parser.add_argument("--target", type=float, default=0.25,
+                        help="the slowest allowed time in seconds")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    failed = 0
+    for name, snippet in SNIPPETS.items():
+        result = measure(snippet, args.repeat)
+        ok = result["time"] <= args.target and not result["loaded"]
+        failed += not ok
+        print(f"{name:12s} {result['time']*1000:8.1f} ms  "
+              f"{'loads ' + ', '.join(result['loaded']) if result['loaded'] else ''}"
+              f"{'' if ok else '  FAILED'}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
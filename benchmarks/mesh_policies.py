@@ -0,0 +1,107 @@
+"""Compares the mesh policies of stok.meshing with the filename based mesh
+options they replaced, on the bundled configuration. Every part is meshed
+both ways in one gmsh session and the triangle counts and mesh times are
+printed, and written to a JSON file if one is given.
+
+    python benchmarks/mesh_policies.py --max-triangle-size 200 --output policies.json
+"""
+import argparse
+import json
+import os
+import time
+from typing import Any, Dict, List
+
+import gmsh
+
+from stok import STOK, parameters_from_config
+from stok.meshing import (MESH_POLICIES, apply_mesh_policy, import_shape, policy_for,
+                          triangle_count)
+from stok.stok_modules import named_parts
+
+DEFAULT_COMPONENTS = ("central_solenoid", "containment_with_divertor_and_ports",
+                      "transformer_limbs", "limiter_firstwall", "limiter_backwall",
+                      "divertor_firstwall", "divertor_backwall", "bounding_box")
+
+
+def legacy_mesh_options(filename: str, max_triangle_size: float, exp_factor: float) -> None:
+    """legacy_mesh_options : The mesh options export_to_stl used to pick from
+    the stl filename, kept here as the reference."""
+    if "containment" in filename:
+        gmsh.option.setNumber("Mesh.MeshSizeMin", max_triangle_size)
+        gmsh.model.mesh.field.add("MathEval", 1)
+        gmsh.model.mesh.field.setString(1, "F", f"(x^2+y^2)^({exp_factor})/10")
+        gmsh.model.mesh.field.add("Min", 7)
+        gmsh.model.mesh.field.setNumbers(7, "FieldsList", [1])
+        gmsh.model.mesh.field.setAsBackgroundMesh(7)
+        gmsh.option.setNumber("Mesh.MeshSizeExtendFromBoundary", 0)
+        gmsh.option.setNumber("Mesh.MeshSizeFromPoints", 0)
+        gmsh.option.setNumber("Mesh.MeshSizeFromCurvature", 0)
+    elif "transformer" in filename:
+        gmsh.option.setNumber("Mesh.MeshSizeMax", max_triangle_size)
+    else:
+        gmsh.option.setNumber("Mesh.MeshSizeFromCurvature", 20)
+    gmsh.option.setNumber("Mesh.MeshSizeMax", max_triangle_size)
+    gmsh.option.setNumber("General.NumThreads", os.cpu_count())
+    gmsh.option.setNumber("Mesh.Algorithm", 6)
+    gmsh.option.setNumber("Mesh.AngleToleranceFacetOverlap", 0.1)
+
+
+def mesh(part, set_options) -> Dict[str, float]:
+    """mesh : Meshes a part in a new model and returns its triangles and time."""
+    gmsh.option.restoreDefaults()
+    gmsh.option.setNumber("General.Terminal", 0)
+    gmsh.model.add("benchmark")
+    import_shape(part)
+    gmsh.model.occ.synchronize()
+    set_options()
+    tic = time.perf_counter()
+    gmsh.model.mesh.generate(2)
+    result = {"triangles": triangle_count(), "mesh_time": time.perf_counter() - tic}
+    gmsh.model.remove()
+    return result
+
+
+def main() -> None:
+    """main : Runs the benchmark."""
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--max-triangle-size", type=float, default=200.0)
+    parser.add_argument("--exp-factor", type=float, default=0.5)
+    parser.add_argument("--components", nargs="+", default=list(DEFAULT_COMPONENTS))
+    parser.add_argument("--output", default=None, help="JSON file for the results")
+    args = parser.parse_args()
+
+    reactor = STOK(parameters_from_config())
+    size = args.max_triangle_size
+    rows: List[Dict[str, Any]] = []
+
+    gmsh.initialize()
+    try:
+        for component in args.components:
+            for name, part in named_parts(component, getattr(reactor, component)()):
+                legacy = mesh(part, lambda: legacy_mesh_options(name + ".stl", size,
+                                                                args.exp_factor))
+                policy = policy_for(component)
+                current = mesh(part, lambda: apply_mesh_policy(policy, size, reactor.chamber))
+                rows.append({"part": name, "legacy": legacy, "policy": current,
+                             "budget": policy.triangle_budget})
+                print(f"{name:45s} {legacy['triangles']:8d} {legacy['mesh_time']:7.2f} s"
+                      f" -> {current['triangles']:8d} {current['mesh_time']:7.2f} s")
+    finally:
+        gmsh.finalize()
+
+    totals = {key: {"triangles": sum(row[key]["triangles"] for row in rows),
+                    "mesh_time": sum(row[key]["mesh_time"] for row in rows)}
+              for key in ("legacy", "policy")}
+    print(f"{'total':45s} {totals['legacy']['triangles']:8d} "
+          f"{totals['legacy']['mesh_time']:7.2f} s -> {totals['policy']['triangles']:8d} "
+          f"{totals['policy']['mesh_time']:7.2f} s")
+
+    if args.output is not None:
+        with open(args.output, "w", encoding="utf8") as file:
+            json.dump({"max_triangle_size": size, "policies": sorted(MESH_POLICIES),
+                       "parts": rows, "totals": totals}, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""Compares the serial export of a reactor with the pipelined one of
+stok.pipeline. The serial export builds every component and then meshes
+every part in one gmsh session, the pipelined one overlaps both over a
+process pool within a core budget.
+
+    python benchmarks/pipeline.py --cores 32 --max-triangle-size 200
+
+Exits with status 1 if the two exports write different files or triangle counts.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from typing import Dict, Optional, Sequence
+
+from stok import STOK, parameters_from_config
+from stok.pipeline import DEFAULT_COMPONENTS
+from stok.stok_modules import named_parts
+
+
+def serial(reactor: STOK, components: Sequence[str], directory: str,
+           max_triangle_size: float) -> Dict[str, int]:
+    """serial : Builds every component, then meshes every part.
+
+    Returns:
+        Dict[str, int]: the triangle count of every file.
+    """
+    os.makedirs(directory, exist_ok=True)
+    solids, options = {}, {}
+    for component in components:
+        for name, part in named_parts(component, getattr(reactor, component)()):
+            filename = os.path.join(directory, name + ".stl")
+            solids[filename] = part
+            options[filename] = {"component": component}
+    reports = reactor.export_many_to_stl(solids, max_triangle_size, None,
+                                         mesh_options=options, binary=True)
+    return {os.path.basename(report["filename"]): report["triangles"] for report in reports}
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    """main : The command line entry point."""
+
+    parser = argparse.ArgumentParser(description="Time the pipelined STOK export.")
+    parser.add_argument("--cores", type=int, default=None)
+    parser.add_argument("--mesh-threads", type=int, default=None)
+    parser.add_argument("--max-triangle-size", type=float, default=200.0)
+    parser.add_argument("--components", nargs="+",
+                        default=list(DEFAULT_COMPONENTS) + ["sphere_pair_array"])
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as directory:
+        tic = time.perf_counter()
+        expected = serial(STOK(parameters_from_config()), args.components,
+                          os.path.join(directory, "serial"), args.max_triangle_size)
+        serial_time = time.perf_counter() - tic
+        print(f"serial     {serial_time:7.1f} s, {len(expected)} files")
+
+        tic = time.perf_counter()
+        written: Dict[str, int] = {}
+        for report in STOK(parameters_from_config()).export_pipelined_to_stl(
+                args.components, os.path.join(directory, "pipelined"), args.max_triangle_size,
+                None, cores=args.cores, mesh_threads=args.mesh_threads, binary=True):
+            written[os.path.basename(report["filename"])] = report["triangles"]
+            if len(written) == 1:
+                print(f"first file {report['elapsed']:7.1f} s")
+        pipelined_time = time.perf_counter() - tic
+        print(f"pipelined  {pipelined_time:7.1f} s, {len(written)} files, "
+              f"{serial_time/pipelined_time:.2f}x on {args.cores or os.cpu_count()} cores")
+
+    different = sorted(name for name in set(expected) | set(written)
+                       if expected.get(name) != written.get(name))
+    for name in different:
+        print(f"  {name}: serial {expected.get(name)}, pipelined {written.get(name)}")
+    return 1 if different else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,103 @@
+"""Times the preview of stok.preview and, optionally, compares it with the
+CAD components: the volume of every component, and for every collision
+the volume the two CAD solids share.
+
+    python benchmarks/preview.py
+    python benchmarks/preview.py --set limb_radius=0 --check
+
+The preview is made without port openings, so it is compared with
+containment_with_divertor. The limiter walls are boxes in the preview, their
+volumes are only printed. Exits with status 1 if a volume differs by more
+than the polygon meshes explain, or a collision has no shared volume.
+"""
+import argparse
+import json
+import math
+import sys
+import time
+from typing import Optional, Sequence
+
+from stok import load_config, parameters_from_config
+from stok.config import config_from_mapping
+from stok.preview import DEFAULT_SEGMENTS, Preview
+
+# Relative volume difference accepted for the analytic parts.
+_TOLERANCE = 1e-6
+
+
+def _parse_assignment(text: str):
+    """_parse_assignment : Splits a NAME=JSON command line argument."""
+    name, _, value = text.partition("=")
+    return name.strip(), json.loads(value)
+
+
+def _cad_solids(reactor, name: str):
+    """_cad_solids : The CAD solids of a preview component."""
+    if name.startswith("containment_"):
+        return [reactor.containment_with_divertor()[int(name.split("_")[1])].val()]
+    result = getattr(reactor, name)()
+    if name == "sphere_pair_array":
+        return [sphere.val() for pair in result for sphere in pair]
+    return result.vals()
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    """main : The command line entry point."""
+
+    parser = argparse.ArgumentParser(description="Time the STOK preview.")
+    parser.add_argument("--set", action="append", default=[], type=_parse_assignment,
+                        metavar="NAME=VALUE", help="change a configuration value")
+    parser.add_argument("--segments", type=int, default=DEFAULT_SEGMENTS)
+    parser.add_argument("--output", default=None, help="write the stl files here")
+    parser.add_argument("--check", action="store_true", help="compare with the CAD")
+    args = parser.parse_args(argv)
+
+    param_tup = parameters_from_config(config_from_mapping(dict(args.set), base=load_config()))
+    tic = time.perf_counter()
+    preview = Preview.from_parameters(param_tup, ports=False)
+    collisions = preview.collisions()
+    meshes = preview.meshes(args.segments)
+    if args.output is not None:
+        preview.write_stl(args.output, args.segments)
+    elapsed = time.perf_counter() - tic
+
+    triangles = sum(len(triangles) for _, triangles in meshes.values())
+    print(f"preview of {len(meshes)} components, {triangles} triangles, in {elapsed*1e3:.1f} ms")
+    for collision in collisions:
+        print(f"  {collision.first} collides with {collision.second}, {collision.depth:.1f} mm")
+
+    if not args.check:
+        return 0
+
+    from stok import STOK  # pylint: disable=import-outside-toplevel
+
+    failed = 0
+    reactor = STOK(param_tup)
+    solids = {name: _cad_solids(reactor, name) for name in preview.parts}
+    for name, parts in preview.parts.items():
+        expected = sum(solid.Volume() for solid in solids[name])
+        volume = sum(part.volume for part in parts)
+        error = abs(volume - expected)/expected
+        compared = not name.startswith("limiter")
+        failed += compared and error > _TOLERANCE
+        print(f"  {name:20s} CAD {expected:.6g} preview {volume:.6g} "
+              f"{'differ' if compared and error > _TOLERANCE else 'ok' if compared else 'boxes'}")
+
+    for collision in collisions:
+        if collision.second == "bounding_box":
+            continue
+        pairs = [(first, second) for i, first in enumerate(solids[collision.first])
+                 for j, second in enumerate(solids[collision.second])
+                 if collision.first != collision.second or i < j]
+        shared = sum(first.intersect(second).Volume() for first, second in pairs)
+        failed += shared <= 0
+        print(f"  {collision.first} and {collision.second} share {shared:.6g} mm3 in the CAD")
+
+    # The polygon meshes are inside the exact parts by the inscribed polygon area.
+    factor = args.segments*math.sin(2*math.pi/args.segments)/(2*math.pi)
+    print(f"the meshes of rings have {factor:.4%} of the exact volume")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
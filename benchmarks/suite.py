@@ -0,0 +1,226 @@
+"""Times the STOK builders and their stl export over a grid of reactor sizes.
+Every builder of every variant runs in a fresh process, so the peak RSS
+belongs to that builder alone. The results are written as JSON and can be
+compared with a stored baseline.
+
+    python benchmarks/suite.py --output results.json
+    python benchmarks/suite.py --output results.json --baseline benchmarks/baseline.json
+    python benchmarks/suite.py --grid "nr_ports=[8, 16, 32]" --max-triangle-size 100 200
+
+The comparison exits with status 1 if any time, peak RSS or triangle count
+grew by more than the threshold.
+"""
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Mapping, Optional, Sequence, Tuple
+
+DEFAULT_BUILDERS = ("containment", "containment_with_divertor_and_ports",
+                    "transformer_limbs", "sphere_pair_array", "limiter_firstwall",
+                    "divertor_firstwall", "divertor_backwall", "bounding_box")
+
+DEFAULT_GRID = {"nr_layers": [4, 8], "nr_ports": [8, 16], "nr_limbs": [8, 16]}
+
+DEFAULT_SIZES = (200.0, 400.0)
+
+# Times shorter than this are too noisy to flag as regressions.
+_MIN_COMPARED_TIME = 0.05
+
+# The stl files are only written to be timed, and removed right after.
+_SCRATCH = "/dev/shm" if os.path.isdir("/dev/shm") else "."
+
+
+def variant_config(overrides: Mapping[str, Any]):
+    """variant_config : The bundled configuration with the overrides of a
+    variant. nr_layers keeps the outermost layers of the bundled config."""
+    from stok.config import config_from_mapping, load_config  # pylint: disable=import-outside-toplevel
+
+    base = load_config()
+    overrides = dict(overrides)
+    if "nr_layers" in overrides and "layers" not in overrides:
+        overrides["layers"] = base.layers[:int(overrides["nr_layers"])]
+    return config_from_mapping(overrides, base=base)
+
+
+def _peak_rss_mb() -> float:
+    """_peak_rss_mb : The peak resident set size of this process in MB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes.
+    return peak/2**20 if sys.platform == "darwin" else peak/2**10
+
+
+def run_case(overrides: Mapping[str, Any], builder: str,
+             sizes: Sequence[float]) -> Dict[str, Any]:
+    """run_case : Builds one component of one variant and exports it at every
+    triangle size. This runs in its own process."""
+
+    # pylint: disable=import-outside-toplevel
+    from stok.meshing import BatchExporter
+    from stok.stok_modules import STOK, named_parts, parameters_from_config
+
+    reactor = STOK(parameters_from_config(variant_config(overrides)))
+    record: Dict[str, Any] = {"variant": dict(overrides), "builder": builder}
+
+    tic = time.perf_counter()
+    parts = named_parts(builder, getattr(reactor, builder)())
+    record["build_time"] = time.perf_counter() - tic
+    record["parts"] = len(parts)
+
+    record["exports"] = []
+    with BatchExporter(sizes[0], None, chamber=reactor.chamber, binary=True) as exporter:
+        for size in sizes:
+            tic = time.perf_counter()
+            triangles = 0
+            for name, part in parts:
+                filename = os.path.join(_SCRATCH, f"{os.getpid()}_{name}.stl")
+                triangles += exporter.export(part, filename, max_triangle_size=size,
+                                             component=builder)["triangles"]
+                os.remove(filename)
+            record["exports"].append({"max_triangle_size": size, "triangles": triangles,
+                                      "export_time": time.perf_counter() - tic})
+
+    record["peak_rss_mb"] = _peak_rss_mb()
+    return record
+
+
+def run_suite(grid: Mapping[str, Sequence[Any]], builders: Sequence[str],
+              sizes: Sequence[float]) -> Dict[str, Any]:
+    """run_suite : Runs every builder of every variant in the grid, one
+    process at a time so the timings do not disturb each other.
+
+    Args:
+        grid (Mapping[str, Sequence[Any]]): the values of every swept parameter.
+        builders (Sequence[str]): the STOK builders to time.
+        sizes (Sequence[float]): the max_triangle_size values of the exports.
+
+    Returns:
+        Dict[str, Any]: the machine description and the records.
+    """
+
+    # pylint: disable=import-outside-toplevel
+    import cadquery
+    import gmsh
+
+    names = list(grid)
+    variants = [dict(zip(names, values)) for values in itertools.product(*grid.values())]
+    records: List[Dict[str, Any]] = []
+
+    start = time.perf_counter()
+    context = multiprocessing.get_context("spawn")
+    for variant in variants:
+        for builder in builders:
+            # A new worker for every case, so the peak RSS is not carried over.
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                record = executor.submit(run_case, variant, builder, tuple(sizes)).result()
+            records.append(record)
+            print(f"{json.dumps(variant):50s} {builder:37s} build {record['build_time']:6.2f} s"
+                  f"  export {sum(e['export_time'] for e in record['exports']):7.2f} s"
+                  f"  {record['peak_rss_mb']:6.0f} MB", flush=True)
+
+    return {"machine": {"python": platform.python_version(), "platform": platform.platform(),
+                        "processor": platform.processor(), "cpu_count": os.cpu_count(),
+                        "cadquery": cadquery.__version__, "gmsh": gmsh.__version__},
+            "grid": {name: list(values) for name, values in grid.items()},
+            "builders": list(builders),
+            "max_triangle_sizes": list(sizes),
+            "wall_time": time.perf_counter() - start,
+            "records": records}
+
+
+def _metrics(record: Mapping[str, Any]) -> Dict[str, float]:
+    """_metrics : The compared numbers of a record by name."""
+    metrics = {"build_time": record["build_time"], "peak_rss_mb": record["peak_rss_mb"]}
+    for export in record["exports"]:
+        size = export["max_triangle_size"]
+        metrics[f"export_time@{size:g}"] = export["export_time"]
+        metrics[f"triangles@{size:g}"] = export["triangles"]
+    return metrics
+
+
+def compare(results: Mapping[str, Any], baseline: Mapping[str, Any],
+            threshold: float = 1.2) -> List[Tuple[str, str, str, float, float]]:
+    """compare : Prints the ratio of every number to the baseline.
+
+    Args:
+        results (Mapping[str, Any]): the new results.
+        baseline (Mapping[str, Any]): the stored results.
+        threshold (float): the ratio above which a number counts as a regression.
+
+    Returns:
+        List[Tuple[str, str, str, float, float]]: the variant, builder, metric,
+        baseline and new value of every regression.
+    """
+
+    def key(record: Mapping[str, Any]) -> Tuple[str, str]:
+        return json.dumps(record["variant"], sort_keys=True), record["builder"]
+
+    stored = {key(record): _metrics(record) for record in baseline["records"]}
+    regressions = []
+    for record in results["records"]:
+        old = stored.get(key(record))
+        if old is None:
+            continue
+        for metric, value in _metrics(record).items():
+            if metric not in old or old[metric] == 0:
+                continue
+            ratio = value/old[metric]
+            noisy = "time" in metric and max(value, old[metric]) < _MIN_COMPARED_TIME
+            regression = ratio > threshold and not noisy
+            if regression:
+                regressions.append((key(record)[0], record["builder"], metric,
+                                    old[metric], value))
+            print(f"{key(record)[0]:50s} {record['builder']:37s} {metric:22s} "
+                  f"{old[metric]:12.3f} -> {value:12.3f}  x{ratio:5.2f}"
+                  f"{'  REGRESSION' if regression else ''}")
+    return regressions
+
+
+def _parse_assignment(text: str) -> Tuple[str, Any]:
+    """_parse_assignment : Splits a NAME=JSON command line argument."""
+    name, _, value = text.partition("=")
+    if not value:
+        raise argparse.ArgumentTypeError(f"Expected NAME=VALUE, got {text!r}.")
+    return name.strip(), json.loads(value)
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    """main : The command line entry point of the suite."""
+
+    parser = argparse.ArgumentParser(description="Time the STOK builders and stl export.")
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--grid", action="append", default=[], type=_parse_assignment,
+                        metavar="NAME=[VALUES]",
+                        help="replaces the default grid, can be repeated")
+    parser.add_argument("--builders", nargs="+", default=list(DEFAULT_BUILDERS))
+    parser.add_argument("--max-triangle-size", nargs="+", type=float,
+                        default=list(DEFAULT_SIZES))
+    parser.add_argument("--baseline", default=None, help="stored results to compare with")
+    parser.add_argument("--threshold", type=float, default=1.2,
+                        help="ratio above which a number counts as a regression")
+    args = parser.parse_args(argv)
+
+    grid = dict(args.grid) if args.grid else DEFAULT_GRID
+    results = run_suite(grid, args.builders, args.max_triangle_size)
+    with open(args.output, "w", encoding="utf8") as file:
+        json.dump(results, file, indent=2)
+    print(f"{len(results['records'])} cases in {results['wall_time']:.1f} s, "
+          f"written to {args.output}.")
+
+    if args.baseline is None:
+        return 0
+
+    with open(args.baseline, "r", encoding="utf8") as file:
+        regressions = compare(results, json.load(file), args.threshold)
+    print(f"{len(regressions)} regressions over x{args.threshold}.")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,5 +1,76 @@
-# Classes and dataclasses
-from .stok_modules import (STOK, ContainmentParameters, DivertorParameters,
-                           Layer, LimbDimensiones, LimbParameters,
-                           LimiterParameters, PortParameters,
-                           SolenoidParameters)
+# Names are imported from their modules on first use, so that `import stok`
+# does not load cadquery and gmsh. Parameter handling only needs stok.config
+# and stok.parameters, the analytic dimensions stok.dimensions.
+import importlib
+from typing import Any, List
+
+_LAZY_NAMES = {
+    # Classes and dataclasses
+    "STOK": "stok_modules",
+    "ContainmentParameters": "parameters",
+    "DivertorParameters": "parameters",
+    "Layer": "config",
+    "LimbDimensiones": "parameters",
+    "LimbParameters": "parameters",
+    "LimiterParameters": "parameters",
+    "PortParameters": "parameters",
+    "SolenoidParameters": "parameters",
+    # Configuration
+    "STOK_CONFIG": "config",
+    "ConfigValues": "config",
+    "load_config": "config",
+    "defaults": "parameters",
+    "parameters_from_config": "parameters",
+    # Caching
+    "GeometryCache": "geometry_cache",
+    "MeshCache": "mesh_cache",
+    # Sweeps
+    "grid": "sweep",
+    "run_sweep": "sweep",
+    "Study": "study",
+    "load_study": "study",
+    "WorkQueue": "work_queue",
+    # Meshing
+    "BatchExporter": "meshing",
+    "MeshPolicy": "meshing",
+    "import_shape": "meshing",
+    "register_mesh_policy": "meshing",
+    "tune_mesh": "meshing",
+    "export_pipelined": "pipeline",
+    # Validation
+    "MeshReport": "stl_check",
+    "check_stl": "stl_check",
+    # Point classification
+    "COMPONENTS": "classify",
+    "PointClassifier": "classify",
+    # Previews
+    "Preview": "preview",
+    # Source sampling
+    "PlasmaSourceSampler": "source",
+    "write_serpent_source": "source",
+    # Instancing
+    "Instanced": "instancing",
+    "Transform": "instancing",
+    # Dimensions
+    "LayerTable": "dimensions",
+    "layer_table": "dimensions",
+    # Symmetry sectors
+    "Sector": "sector",
+    "symmetry_order": "sector",
+    # Tracing
+    "Tracer": "tracing",
+}
+
+__all__ = list(_LAZY_NAMES)
+
+
+def __getattr__(name: str) -> Any:
+    if name not in _LAZY_NAMES:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{_LAZY_NAMES[name]}", __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__() -> List[str]:
+    return sorted(set(globals()) | set(_LAZY_NAMES))
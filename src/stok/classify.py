@@ -0,0 +1,329 @@
+"""Finds the STOK component and containment layer that contain points,
+without CAD. Every STOK body is a rectangular torus, a box or a sphere, or
+copies of one around the Z axis, so membership follows from the cylindrical
+coordinates of the points and a handful of comparisons. This module only
+needs NumPy, the parameters and the layer table."""
+import math
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+import numpy as np
+
+from .dimensions import LayerTable, layer_table_from_parameters, plasma_source_dimensions
+
+# The components in the order their ids are given, points in no component
+# get VOID. Where components overlap the first one in this order wins.
+COMPONENTS = ("divertor_firstwall", "divertor_backwall", "limiter_firstwall",
+              "limiter_backwall", "containment", "central_solenoid", "plasma_source",
+              "transformer_limbs", "sphere_pair_array", "bounding_box")
+
+VOID = -1
+
+# Number of points classified at a time, small enough to stay in cache.
+DEFAULT_CHUNK_SIZE = 1 << 16
+
+
+@dataclass(frozen=True)
+class PointClassifier:
+    """The analytic dimensions of every STOK component, used to classify
+    points, see classify. All lengths are in mm and angles in degrees.
+
+    Args:
+        table: LayerTable -> the containment layers.
+        solenoid_radius: float
+        solenoid_height: float
+        ports: bool -> cut the port openings out of the containment.
+        divertor: bool -> cut the divertor slot out of the containment.
+        nr_ports: int
+        port_depth: float -> the sum of the upper, lower and outer walls, which
+        sets the length of the port openings.
+        port_y_side: float
+        port_z_side: float
+        limiter_gap: float
+        limiter_r: Tuple[float, float, float] -> the inner radius of the
+        limiter firstwall, the firstwall and the backwall boundary and the
+        outer radius of the backwall.
+        divertor_r: Tuple[float, float, float, float] -> the inner and outer
+        radius of the divertor slot and of the divertor walls.
+        divertor_z: Tuple[float, float, float] -> the top of the divertor
+        firstwall, the firstwall and backwall boundary and the bottom of the
+        backwall.
+        plasma: Tuple[float, float, float] -> the inner radius, outer radius
+        and height of the plasma source.
+        nr_limbs: int
+        limb_radius: float -> the distance of the limb and sphere centers
+        from the Z axis.
+        limb_size: Tuple[float, float, float] -> the length, width and height
+        of a limb.
+        sphere_radius: float
+        sphere_offset: float -> the distance of the sphere centers from the limb axis.
+        bbox_outer: Tuple[float, float, float] -> the sides of the bounding box.
+        bbox_inner: Tuple[float, float, float] -> the sides of the space inside it.
+        sector: Tuple[float, float], optional -> the start and opening angle
+        of the sector, points outside of it are VOID.
+    """
+    table: LayerTable
+    solenoid_radius: float
+    solenoid_height: float
+    ports: bool
+    divertor: bool
+    nr_ports: int
+    port_depth: float
+    port_y_side: float
+    port_z_side: float
+    limiter_gap: float
+    limiter_r: Tuple[float, float, float]
+    divertor_r: Tuple[float, float, float, float]
+    divertor_z: Tuple[float, float, float]
+    plasma: Tuple[float, float, float]
+    nr_limbs: int
+    limb_radius: float
+    limb_size: Tuple[float, float, float]
+    sphere_radius: float
+    sphere_offset: float
+    bbox_outer: Tuple[float, float, float]
+    bbox_inner: Tuple[float, float, float]
+    sector: Optional[Tuple[float, float]] = None
+
+    @classmethod
+    def from_parameters(cls, param_tup: Tuple, ports: bool = True, divertor: bool = True,
+                        sector=None) -> "PointClassifier":
+        """from_parameters : Computes the dimensions with the same arithmetic
+        as the STOK builders.
+
+        Args:
+            param_tup (Tuple): the parameters, as passed to STOK.
+            ports (bool): classify against the containment with port openings.
+            divertor (bool): classify against the containment with the divertor slot.
+            sector (Sector, optional): only classify points inside this sector.
+
+        Returns:
+            PointClassifier: the classifier.
+        """
+
+        containment, solenoid, port, limb, limiter, divertor_parameters = param_tup
+        table = layer_table_from_parameters(containment, solenoid)
+        outer_sum = float(table.total_upper_lower_outer)
+
+        # See STOK.centering_of_divertor and the divertor builders.
+        center = (float(table.total_inner) + solenoid.solenoid_radius +
+                  containment.outer_radius - outer_sum)/2
+        firstwall_top = -containment.containment_height/2 - \
+            (containment.outer_radius - outer_sum) + containment.outer_radius
+
+        # See STOK.limiter_firstwall and STOK.limiter_backwall.
+        limiter_inner = containment.outer_radius - outer_sum
+
+        dims = limb.limb_dimensions
+        box_side = limb.limb_radius + containment.outer_radius*8
+
+        return cls(
+            table=table,
+            solenoid_radius=solenoid.solenoid_radius,
+            solenoid_height=solenoid.solenoid_height,
+            ports=ports,
+            divertor=divertor,
+            nr_ports=port.nr_ports,
+            port_depth=outer_sum,
+            port_y_side=port.y_side,
+            port_z_side=port.z_side,
+            limiter_gap=limiter.limiter_gap,
+            limiter_r=(limiter_inner, limiter_inner + limiter.firstwall_thickness,
+                       limiter_inner + limiter.limiter_thickness + limiter.firstwall_thickness),
+            divertor_r=(center - divertor_parameters.divertor_width,
+                        center + divertor_parameters.divertor_width,
+                        center - divertor_parameters.divertor_width +
+                        divertor_parameters.divertor_gap,
+                        center + divertor_parameters.divertor_width -
+                        divertor_parameters.divertor_gap),
+            divertor_z=(firstwall_top,
+                        firstwall_top - divertor_parameters.divertor_firstwall_thickness,
+                        firstwall_top - divertor_parameters.divertor_firstwall_thickness -
+                        divertor_parameters.divertor_thickness),
+            plasma=plasma_source_dimensions(containment, solenoid),
+            nr_limbs=limb.nr_limbs,
+            limb_radius=limb.limb_radius + containment.outer_radius,
+            limb_size=(dims.limb_length, dims.limb_width, dims.limb_height),
+            sphere_radius=limb.sphere_radius,
+            sphere_offset=limb.sphere_radius + dims.limb_width/2,
+            bbox_outer=(box_side + solenoid.bbox_thickness, box_side + solenoid.bbox_thickness,
+                        solenoid.solenoid_height*4 + solenoid.bbox_thickness),
+            bbox_inner=(box_side, box_side, solenoid.solenoid_height*4),
+            sector=None if sector is None else (sector.start_angle, sector.angle))
+
+    def classify(self, points: np.ndarray,
+                 chunk_size: int = DEFAULT_CHUNK_SIZE) -> Tuple[np.ndarray, np.ndarray]:
+        """classify : Finds the component and the containment layer of every point.
+
+        Args:
+            points (np.ndarray): the points in mm, shape (N, 3).
+            chunk_size (int): the number of points classified at a time.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: the index of the component in
+            COMPONENTS, VOID outside of all components, and the containment
+            layer, VOID outside of the containment. Both have shape (N,).
+        """
+
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+        component = np.empty(len(points), dtype=np.int16)
+        layer = np.empty(len(points), dtype=np.int16)
+        for start in range(0, len(points), chunk_size):
+            chunk = slice(start, start + chunk_size)
+            component[chunk], layer[chunk] = self._classify(points[chunk])
+        return component, layer
+
+    def _classify(self, points: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """_classify : Classifies one chunk of points. Everything is computed
+        for every point, boolean indexing costs more than the tests."""
+
+        # Contiguous coordinates are much faster than the columns of points.
+        x, y, z = np.ascontiguousarray(points.T)
+        r = np.sqrt(x*x + y*y)
+        abs_z = np.abs(z)
+        phi = np.arctan2(y, x)
+
+        # The layer tori are nested, so the number of tori that contain a
+        # point is its depth. The chamber is the innermost torus.
+        table = self.table
+        depth = np.zeros(len(points), dtype=np.int8)
+        for inner_r, outer_r, height in zip(
+                np.append(table.inner_r, table.hole_inner_r[-1]),
+                np.append(table.outer_r, table.hole_outer_r[-1]),
+                np.append(table.height, table.hole_height[-1])):
+            inside = r >= inner_r
+            inside &= r <= outer_r
+            inside &= abs_z <= height/2
+            depth += inside
+        in_containment = depth > 0
+        in_containment &= depth <= table.nr_layers
+
+        # The ports. The limiter walls are cut by the same openings made
+        # smaller by the gap.
+        u_min = self.containment_radius - 1.4*self.port_depth
+        u_max = self.containment_radius + 0.1*self.port_depth
+        u, v = self._nearest_axis(x, y, phi, 180.0, -self.nr_ports, self.port_y_side/2, u_min)
+        abs_v = np.abs(v, out=v)
+        in_limiter = u >= u_min
+        in_limiter &= u <= u_max
+        in_limiter &= abs_v <= (self.port_y_side - self.limiter_gap)/2
+        in_limiter &= abs_z <= min(self.port_z_side - self.limiter_gap, self.solenoid_height)/2
+        in_limiter &= r >= self.limiter_r[0]
+        in_limiter &= r <= self.limiter_r[2]
+        if self.ports:
+            in_port = u > u_min
+            in_port &= u < u_max
+            in_port &= abs_v < self.port_y_side/2
+            in_port &= abs_z < self.port_z_side/2
+            in_containment &= ~in_port
+        if self.divertor:
+            in_slot = r > self.divertor_r[0]
+            in_slot &= r < self.divertor_r[1]
+            in_slot &= z < 0
+            in_slot &= z > -self.solenoid_height
+            in_containment &= ~in_slot
+        in_divertor = r >= self.divertor_r[2]
+        in_divertor &= r <= self.divertor_r[3]
+
+        # The limbs and the sphere pairs next to them share their axes.
+        length, width, height = self.limb_size
+        u, v = self._nearest_axis(x, y, phi, -22.5, self.nr_limbs,
+                                  max(width/2, self.sphere_offset + self.sphere_radius),
+                                  self.limb_radius - max(length/2, self.sphere_radius))
+        along = np.subtract(u, self.limb_radius, out=u)
+        across = np.abs(v, out=v)
+        sphere_v = across - self.sphere_offset
+        in_limb = np.abs(along) <= length/2
+        in_limb &= across <= width/2
+        in_limb &= abs_z <= height/2
+        sphere_v *= sphere_v
+        sphere_v += along*along
+        sphere_v += z*z
+        in_sphere = sphere_v <= self.sphere_radius**2
+
+        abs_x, abs_y = np.abs(x), np.abs(y)
+        outer = np.array(self.bbox_outer)/2
+        inner = np.array(self.bbox_inner)/2
+        in_box = abs_x <= outer[0]
+        in_box &= abs_y <= outer[1]
+        in_box &= abs_z <= outer[2]
+        in_hole = abs_x < inner[0]
+        in_hole &= abs_y < inner[1]
+        in_hole &= abs_z < inner[2]
+        in_box &= ~in_hole
+
+        in_solenoid = r <= self.solenoid_radius
+        in_solenoid &= abs_z <= self.solenoid_height/2
+        in_plasma = r >= self.plasma[0]
+        in_plasma &= r <= self.plasma[1]
+        in_plasma &= abs_z <= self.plasma[2]/2
+
+        # From the last component to the first, so the first one wins.
+        masks = (in_divertor & (z <= self.divertor_z[0]) & (z >= self.divertor_z[1]),
+                 in_divertor & (z <= self.divertor_z[1]) & (z >= self.divertor_z[2]),
+                 in_limiter & (r <= self.limiter_r[1]),
+                 in_limiter & (r >= self.limiter_r[1]),
+                 in_containment, in_solenoid, in_plasma, in_limb, in_sphere, in_box)
+        component = np.full(len(points), VOID, dtype=np.int8)
+        for index in range(len(COMPONENTS) - 1, -1, -1):
+            np.copyto(component, index, where=masks[index])
+        layer = np.where(component == COMPONENTS.index("containment"), depth - 1, VOID)
+
+        if self.sector is not None:
+            start, angle = self.sector
+            offset = np.degrees(phi) - start
+            offset += np.where(offset < 0, 360.0, 0.0)
+            offset += np.where(offset < 0, 360.0, 0.0)
+            outside = offset > angle + 1e-9
+            component[outside] = VOID
+            layer[outside] = VOID
+
+        return component, layer
+
+    @property
+    def containment_radius(self) -> float:
+        """containment_radius : The outer radius of the containment."""
+        return float(self.table.outer_r[0])
+
+    @staticmethod
+    def _nearest_axis(x: np.ndarray, y: np.ndarray, phi: np.ndarray, first: float,
+                      count: int, half_width: float,
+                      min_distance: float) -> Tuple[np.ndarray, np.ndarray]:
+        """_nearest_axis : The coordinates of points along and across the
+        nearest of count copies of an axis through the Z axis, spaced evenly
+        from the angle first, in degrees. phi is the angle of the points in
+        radians. A negative count places the copies clockwise, which gives
+        the same axes. The points are rotated with a table of the axis
+        directions, which is faster than the cosine of every angle.
+
+        Copies that reach across half the spacing to the next axis would need
+        more than the nearest axis, so those are refused.
+
+        Raises:
+            ValueError: if neighbouring copies can overlap.
+        """
+        period = 360/abs(count)
+        if min_distance <= half_width or \
+                math.degrees(math.asin(half_width/min_distance)) > period/2:
+            raise ValueError("Neighbouring copies overlap, the classifier cannot handle them.")
+
+        # phi - first lies within 540 degrees of 0, so the nearest axis is
+        # one of these. The index is positive, so truncating it rounds down.
+        steps = int(math.ceil(540/period)) + 1
+        angles = np.radians(first + np.arange(-steps, steps + 1)*period)
+        nearest = ((phi - math.radians(first))*(1/math.radians(period)) +
+                   (steps + 0.5)).astype(np.intp)
+        cos, sin = np.take(np.cos(angles), nearest), np.take(np.sin(angles), nearest)
+        return x*cos + y*sin, y*cos - x*sin
+
+    def names(self, component: np.ndarray) -> np.ndarray:
+        """names : The component name of every id, "void" for VOID.
+
+        Args:
+            component (np.ndarray): the ids from classify.
+
+        Returns:
+            np.ndarray: the names.
+        """
+        return np.array(COMPONENTS + ("void",))[component]
+
@@ -0,0 +1,280 @@
+"""Reading of the STOK configuration file. The file is parsed once per
+path and modification time into an immutable set of values, which is then
+used for the defaults of the parameter dataclasses."""
+import os
+from dataclasses import dataclass, fields
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+
+STOK_CONFIG = os.path.dirname(os.path.realpath(__file__)) + "/stok_config.txt"
+
+
+class FileReader:
+    """
+    Reads the input file.
+    """
+
+    def __init__(self, *args: str):
+        self.filename: str = args[0]
+        self.read = self.reader()
+
+    def reader(self) -> List[float]:
+        """reader : Reads a file and checks for numerical values,
+        then returns a list of the numerical values.
+
+        Returns:
+            List[float, str]: returns a tuple of the numerical values.
+        """
+
+        with open(self.filename, 'r', encoding='utf8') as file:
+            output: List[float] = []
+            for _, line in enumerate(file):
+                if ("\n" in line[0]) or ("#" in line[0]) or ("%" in line[0]):
+                    pass
+                else:
+                    output.append(float(line))
+        return output
+
+
+@dataclass(order=True, frozen=True)
+class Layer:
+    """Layer class, used to store the data for each layer.
+
+    Args:
+        upper_lower_outer: float
+        inner: float
+    """
+    upper_lower_outer: float
+    inner: float
+
+
+@dataclass(frozen=True)
+class ConfigValues:
+    """The values of one STOK design, named after the fields of the
+    parameter dataclasses they end up in.
+
+    Args:
+        conf_path: str -> the file the values were read from, if any.
+        outer_radius: float
+        containment_height: float
+        layers: Tuple[Layer, ...]
+        distance_from_plasma: float
+        solenoid_radius: float
+        solenoid_height: float
+        bbox_thickness: float
+        nr_ports: int
+        z_side: float
+        y_side: float
+        nr_limbs: int
+        limb_distance: float -> between the outer containment radius and the limb.
+        sphere_radius: float
+        limb_length: float
+        limb_width: float
+        limb_height: float -> as in the file, 0 for the solenoid height.
+        firstwall_thickness: float
+        limiter_gap: float
+        limiter_thickness: float
+        divertor_firstwall_thickness: float
+        divertor_width: float
+        divertor_gap: float
+        divertor_thickness: float
+    """
+    conf_path: str
+    outer_radius: float
+    containment_height: float
+    layers: Tuple[Layer, ...]
+    distance_from_plasma: float
+    solenoid_radius: float
+    solenoid_height: float
+    bbox_thickness: float
+    nr_ports: int
+    z_side: float
+    y_side: float
+    nr_limbs: int
+    limb_distance: float
+    sphere_radius: float
+    limb_length: float
+    limb_width: float
+    limb_height: float
+    firstwall_thickness: float
+    limiter_gap: float
+    limiter_thickness: float
+    divertor_firstwall_thickness: float
+    divertor_width: float
+    divertor_gap: float
+    divertor_thickness: float
+
+    @property
+    def nr_layers(self) -> int:
+        """nr_layers : The number of containment layers.
+
+        Returns:
+            int: the number of layers.
+        """
+        return len(self.layers)
+
+    @property
+    def limb_radius(self) -> float:
+        """limb_radius : The outer containment radius plus the limb distance.
+
+        Returns:
+            float: the radius.
+        """
+        return self.outer_radius + self.limb_distance
+
+    @property
+    def resolved_limb_height(self) -> float:
+        """resolved_limb_height : The limb height, the solenoid height if
+        limb_height is 0.
+
+        Returns:
+            float: the height.
+        """
+        return self.limb_height if self.limb_height != 0.0 else self.solenoid_height
+
+    def as_dict(self) -> Dict[str, Any]:
+        """as_dict : Returns the values as a plain dictionary, the
+        layers are given as (upper_lower_outer, inner) pairs.
+
+        Returns:
+            Dict[str, Any]: the values.
+        """
+        output = {item.name: getattr(self, item.name) for item in fields(self)}
+        output["layers"] = [(layer.upper_lower_outer, layer.inner)
+                            for layer in self.layers]
+        return output
+
+
+CONFIG_FIELDS: Tuple[str, ...] = tuple(item.name for item in fields(ConfigValues))
+
+# Cache of parsed files, keyed by the real path of the file.
+_CONFIG_CACHE: Dict[str, Tuple[int, ConfigValues]] = {}
+
+
+def parse_values(values: List[float], conf_path: str = "") -> ConfigValues:
+    """parse_values : Turns the positional values of a STOK configuration
+    file into named values.
+
+    Args:
+        values (List[float]): the numerical values as given by FileReader.
+        conf_path (str): the file the values come from.
+
+    Raises:
+        ValueError: if there are not enough values for the number of layers.
+
+    Returns:
+        ConfigValues: the named values.
+    """
+
+    nr_layers = int(values[2])
+    offset = nr_layers*2
+    if len(values) < offset + 23:
+        raise ValueError(f"Expected {offset + 23} values for {nr_layers} layers "
+                         f"in {conf_path or 'the configuration'}, got {len(values)}.")
+
+    layers = tuple(Layer(values[i], values[i+1]) for i in range(3, offset+3, 2))
+
+    return ConfigValues(
+        conf_path=conf_path,
+        outer_radius=values[0],
+        containment_height=values[1],
+        layers=layers,
+        distance_from_plasma=values[-1],
+        solenoid_radius=values[offset+3],
+        solenoid_height=values[offset+4],
+        bbox_thickness=values[offset+5],
+        nr_ports=int(values[offset+6]),
+        z_side=values[offset+7],
+        y_side=values[offset+8],
+        nr_limbs=int(values[offset+9]),
+        limb_distance=values[offset+10],
+        sphere_radius=values[offset+11],
+        limb_length=values[offset+12],
+        limb_width=values[offset+13],
+        limb_height=values[offset+14],
+        firstwall_thickness=values[offset+15],
+        limiter_gap=values[offset+16],
+        limiter_thickness=values[offset+17],
+        divertor_firstwall_thickness=values[offset+18],
+        divertor_width=values[offset+19],
+        divertor_gap=values[offset+20],
+        divertor_thickness=values[offset+21])
+
+
+def load_config(conf_path: Optional[str] = None) -> ConfigValues:
+    """load_config : Reads a STOK configuration file. The file is only
+    parsed again when its modification time changes.
+
+    Args:
+        conf_path (str, optional): the configuration file, defaults to
+        the bundled STOK_CONFIG.
+
+    Returns:
+        ConfigValues: the values in the file.
+    """
+
+    conf_path = STOK_CONFIG if conf_path is None else conf_path
+    real_path = os.path.realpath(conf_path)
+    mtime = os.stat(real_path).st_mtime_ns
+
+    cached = _CONFIG_CACHE.get(real_path)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+
+    values = parse_values(FileReader(real_path).read, conf_path=conf_path)
+    _CONFIG_CACHE[real_path] = (mtime, values)
+    return values
+
+
+def _to_layer(layer: Any) -> Layer:
+    """_to_layer : Accepts a Layer, a mapping with the Layer fields or
+    an (upper_lower_outer, inner) pair."""
+    if isinstance(layer, Layer):
+        return layer
+    if isinstance(layer, Mapping):
+        return Layer(float(layer["upper_lower_outer"]), float(layer["inner"]))
+    upper_lower_outer, inner = layer
+    return Layer(float(upper_lower_outer), float(inner))
+
+
+def config_from_mapping(mapping: Mapping[str, Any],
+                        base: Optional[ConfigValues] = None) -> ConfigValues:
+    """config_from_mapping : Creates configuration values from a mapping
+    with the same names as the ConfigValues fields.
+
+    Args:
+        mapping (Mapping[str, Any]): the values, layers can be given as
+        Layer objects, mappings or (upper_lower_outer, inner) pairs. A
+        limb_radius is turned into the limb_distance from the outer_radius.
+        base (ConfigValues, optional): the values used for missing keys.
+
+    Raises:
+        KeyError: if a key is unknown or a value is missing and there is no base.
+
+    Returns:
+        ConfigValues: the values.
+    """
+
+    unknown = set(mapping) - set(CONFIG_FIELDS) - {"nr_layers", "limb_radius"}
+    if unknown:
+        raise KeyError(f"Unknown configuration keys: {sorted(unknown)}")
+
+    output: Dict[str, Any] = {} if base is None else base.as_dict()
+    output.update(mapping)
+    output.setdefault("conf_path", "")
+    if "limb_radius" in output and "outer_radius" in output:
+        output["limb_distance"] = output.pop("limb_radius") - output["outer_radius"]
+
+    missing = [name for name in CONFIG_FIELDS if name not in output]
+    if missing:
+        raise KeyError(f"Missing configuration keys: {missing}")
+
+    layers = tuple(_to_layer(layer) for layer in output["layers"])
+    if "nr_layers" in mapping and int(mapping["nr_layers"]) != len(layers):
+        raise ValueError(f"nr_layers is {mapping['nr_layers']} but "
+                         f"{len(layers)} layers were given.")
+
+    output["layers"] = layers
+    output["nr_ports"] = int(output["nr_ports"])
+    output["nr_limbs"] = int(output["nr_limbs"])
+
+    return ConfigValues(**{name: output[name] for name in CONFIG_FIELDS})
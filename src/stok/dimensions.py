@@ -0,0 +1,200 @@
+"""Closed form dimensions of the containment layers. The cross-section of
+every layer is rectangular, so radii, heights, volumes and surface areas
+follow directly from the parameters without building any CAD. All arrays
+can carry leading dimensions to evaluate many designs at once."""
+from dataclasses import dataclass
+from typing import Mapping, Tuple, Union
+
+import numpy as np
+
+ArrayLike = Union[float, np.ndarray]
+
+
+def torus_volume(inner_r: ArrayLike, outer_r: ArrayLike, height: ArrayLike) -> np.ndarray:
+    """torus_volume : The volume of a rectangular torus.
+
+    Args:
+        inner_r (ArrayLike): inner radius of the torus.
+        outer_r (ArrayLike): outer radius of the torus.
+        height (ArrayLike): the height of the torus.
+
+    Returns:
+        np.ndarray: the volume.
+    """
+    return np.pi*(np.square(outer_r) - np.square(inner_r))*height
+
+
+def torus_area(inner_r: ArrayLike, outer_r: ArrayLike, height: ArrayLike) -> np.ndarray:
+    """torus_area : The surface area of a rectangular torus.
+
+    Args:
+        inner_r (ArrayLike): inner radius of the torus.
+        outer_r (ArrayLike): outer radius of the torus.
+        height (ArrayLike): the height of the torus.
+
+    Returns:
+        np.ndarray: the surface area.
+    """
+    return 2*np.pi*(np.asarray(outer_r) + inner_r)*height + \
+        2*np.pi*(np.square(outer_r) - np.square(inner_r))
+
+
+@dataclass(frozen=True)
+class LayerTable:
+    """The dimensions of every containment layer. A layer is the space between
+    its outer torus (inner_r, outer_r, height) and its hole (hole_inner_r,
+    hole_outer_r, hole_height), which is the outer torus of the next layer.
+    The last axis of every layer array runs over the layers.
+
+    Args:
+        inner_r: np.ndarray
+        outer_r: np.ndarray
+        height: np.ndarray
+        hole_inner_r: np.ndarray
+        hole_outer_r: np.ndarray
+        hole_height: np.ndarray
+        total_inner: np.ndarray -> the sum of all inner wall thicknesses.
+        total_upper_lower_outer: np.ndarray -> the sum of all upper, lower
+        and outer wall thicknesses.
+    """
+    inner_r: np.ndarray
+    outer_r: np.ndarray
+    height: np.ndarray
+    hole_inner_r: np.ndarray
+    hole_outer_r: np.ndarray
+    hole_height: np.ndarray
+    total_inner: np.ndarray
+    total_upper_lower_outer: np.ndarray
+
+    @property
+    def nr_layers(self) -> int:
+        """nr_layers : The number of layers."""
+        return self.inner_r.shape[-1]
+
+    @property
+    def volume(self) -> np.ndarray:
+        """volume : The volume of every layer."""
+        return torus_volume(self.inner_r, self.outer_r, self.height) - \
+            torus_volume(self.hole_inner_r, self.hole_outer_r, self.hole_height)
+
+    @property
+    def surface_area(self) -> np.ndarray:
+        """surface_area : The surface area of every layer, the outer
+        and the hole surface together."""
+        return torus_area(self.inner_r, self.outer_r, self.height) + \
+            torus_area(self.hole_inner_r, self.hole_outer_r, self.hole_height)
+
+    @property
+    def chamber(self) -> np.ndarray:
+        """chamber : The inner radius, outer radius and height of the space
+        inside the innermost layer, stacked on the last axis."""
+        return np.stack([self.hole_inner_r[..., -1], self.hole_outer_r[..., -1],
+                         self.hole_height[..., -1]], axis=-1)
+
+    def masses(self, densities: Union[ArrayLike, Mapping[int, float]]) -> np.ndarray:
+        """masses : The mass of every layer.
+
+        Args:
+            densities (ArrayLike or Mapping[int, float]): the density of every
+            layer, in the units of the parameters, or a mapping from layer
+            index to density, missing layers count as empty.
+
+        Returns:
+            np.ndarray: the mass of every layer.
+        """
+        if isinstance(densities, Mapping):
+            values = np.zeros(self.nr_layers)
+            for index, density in densities.items():
+                values[index] = density
+            densities = values
+        return self.volume*densities
+
+
+def layer_table(solenoid_radius: ArrayLike, outer_radius: ArrayLike,
+                containment_height: ArrayLike, upper_lower_outer: ArrayLike,
+                inner: ArrayLike) -> LayerTable:
+    """layer_table : Computes the layer dimensions, the additions are done in
+    the same order as in the STOK builders so the numbers agree exactly.
+
+    Args:
+        solenoid_radius (ArrayLike): the solenoid radius, i.e. the inner
+        radius of the containment, shape (...).
+        outer_radius (ArrayLike): the outer containment radius, shape (...).
+        containment_height (ArrayLike): the containment height, shape (...).
+        upper_lower_outer (ArrayLike): the upper, lower and outer wall thickness
+        of every layer, shape (..., nr_layers).
+        inner (ArrayLike): the inner wall thickness of every layer,
+        shape (..., nr_layers).
+
+    Returns:
+        LayerTable: the layer dimensions.
+    """
+
+    upper_lower_outer = np.asarray(upper_lower_outer, dtype=float)
+    inner = np.asarray(inner, dtype=float)
+    start = np.asarray(solenoid_radius, dtype=float)[..., None]
+    outer = np.asarray(outer_radius, dtype=float)[..., None]
+    height = np.asarray(containment_height, dtype=float)[..., None]
+
+    # Running sums start from the base values, like the loops in the builders.
+    shape = np.broadcast_shapes(upper_lower_outer.shape, inner.shape, start.shape)
+    ones = np.ones(shape[:-1] + (1,))
+    hole_inner_r = np.cumsum(np.concatenate([start*ones, np.broadcast_to(inner, shape)],
+                                            axis=-1), axis=-1)
+    hole_outer_r = np.cumsum(np.concatenate([outer*ones,
+                                             -np.broadcast_to(upper_lower_outer, shape)],
+                                            axis=-1), axis=-1)
+    hole_height = np.cumsum(np.concatenate([height*ones,
+                                            -np.broadcast_to(upper_lower_outer, shape)*2],
+                                           axis=-1), axis=-1)
+
+    return LayerTable(inner_r=hole_inner_r[..., :-1],
+                      outer_r=hole_outer_r[..., :-1],
+                      height=hole_height[..., :-1],
+                      hole_inner_r=hole_inner_r[..., 1:],
+                      hole_outer_r=hole_outer_r[..., 1:],
+                      hole_height=hole_height[..., 1:],
+                      total_inner=np.cumsum(np.broadcast_to(inner, shape), axis=-1)[..., -1],
+                      total_upper_lower_outer=np.cumsum(
+                          np.broadcast_to(upper_lower_outer, shape), axis=-1)[..., -1])
+
+
+def layer_table_from_parameters(containment_parameters, solenoid_parameters) -> LayerTable:
+    """layer_table_from_parameters : Computes the layer dimensions of a
+    single design from its ContainmentParameters and SolenoidParameters.
+
+    Args:
+        containment_parameters (ContainmentParameters): the containment.
+        solenoid_parameters (SolenoidParameters): the solenoid.
+
+    Returns:
+        LayerTable: the layer dimensions.
+    """
+    layers = containment_parameters.layers[:containment_parameters.nr_layers]
+    return layer_table(solenoid_parameters.solenoid_radius,
+                       containment_parameters.outer_radius,
+                       containment_parameters.containment_height,
+                       [layer.upper_lower_outer for layer in layers],
+                       [layer.inner for layer in layers])
+
+
+def plasma_source_dimensions(containment_parameters,
+                             solenoid_parameters) -> Tuple[float, float, float]:
+    """plasma_source_dimensions : The inner radius, outer radius and height
+    of the plasma source, with the same arithmetic as STOK.plasma_source,
+    which uses the last configured layer.
+
+    Args:
+        containment_parameters (ContainmentParameters): the containment.
+        solenoid_parameters (SolenoidParameters): the solenoid.
+
+    Returns:
+        Tuple[float, float, float]: the plasma source dimensions.
+    """
+    inner_r, outer_r, height = (float(value) for value in layer_table_from_parameters(
+        containment_parameters, solenoid_parameters).chamber)
+    last = containment_parameters.layers[-1]
+    distance = containment_parameters.distance_from_plasma
+    return (inner_r + last.inner + distance,
+            outer_r - last.upper_lower_outer - distance,
+            height - last.upper_lower_outer*2 - distance*2)
@@ -0,0 +1,210 @@
+"""A content addressed cache for the solids created by the STOK builders.
+Solids are kept in memory with LRU eviction and, optionally, in a directory
+of BREP files so they survive between runs."""
+import functools
+import hashlib
+import json
+import os
+from collections import OrderedDict
+from dataclasses import fields, is_dataclass
+from typing import Any, Callable, List, Optional, Tuple, Union
+
+import cadquery as cq
+
+from .tracing import shape_counts, span, tracing_enabled
+
+# Bump this if the way entries are stored changes.
+CACHE_FORMAT_VERSION = 1
+
+# Fields that do not change the geometry and are left out of the keys.
+_IGNORED_FIELDS = ("conf_path",)
+
+
+def _key_value(value: Any) -> Any:
+    """_key_value : Turns a parameter into plain data for the key, so
+    that it does not depend on the process it was created in."""
+    if is_dataclass(value) and not isinstance(value, type):
+        return (type(value).__name__,
+                tuple((item.name, _key_value(getattr(value, item.name)))
+                      for item in fields(value) if item.name not in _IGNORED_FIELDS))
+    if isinstance(value, (list, tuple)):
+        return tuple(_key_value(item) for item in value)
+    if isinstance(value, float):
+        return float.hex(value)
+    return value
+
+
+def geometry_key(builder: str, version: int, *parameters: Any) -> str:
+    """geometry_key : Creates the key for a builder output.
+
+    Args:
+        builder (str): the name of the builder.
+        version (int): the version of the builder.
+        parameters: the parameter dataclasses and arguments the builder reads.
+
+    Returns:
+        str: the hex digest of the key.
+    """
+    payload = repr((CACHE_FORMAT_VERSION, builder, version,
+                    tuple(_key_value(parameter) for parameter in parameters)))
+    return hashlib.sha256(payload.encode("utf8")).hexdigest()
+
+
+class GeometryCache:
+    """Stores builder outputs by key, in memory and optionally on disk.
+
+    Args:
+        directory (str, optional): where the BREP files are stored, if None
+        the cache is only kept in memory.
+        max_items (int): the number of entries kept in memory.
+    """
+
+    def __init__(self, directory: Optional[str] = None, max_items: int = 64) -> None:
+        self.directory = directory
+        self.max_items = max_items
+        self.hits = 0
+        self.misses = 0
+        self._memory: "OrderedDict[str, Tuple[str, Tuple[cq.Shape, ...]]]" = OrderedDict()
+
+        if self.directory is not None:
+            os.makedirs(self.directory, exist_ok=True)
+
+    def _paths(self, key: str) -> Tuple[str, str]:
+        return (os.path.join(self.directory, key + ".brep"),
+                os.path.join(self.directory, key + ".json"))
+
+    def _remember(self, key: str, entry: Tuple[str, Tuple[cq.Shape, ...]]) -> None:
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_items:
+            self._memory.popitem(last=False)
+
+    def get(self, key: str) -> Optional[Tuple[str, Tuple[cq.Shape, ...]]]:
+        """get : Returns an entry, first looking in memory and then on disk.
+
+        Args:
+            key (str): the key of the entry.
+
+        Returns:
+            Tuple[str, Tuple[cq.Shape, ...]] or None: the kind of the
+            builder output and its shapes, None if the key is not cached.
+        """
+
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            self.hits += 1
+            return self._memory[key]
+
+        if self.directory is not None:
+            brep_path, meta_path = self._paths(key)
+            if os.path.exists(brep_path) and os.path.exists(meta_path):
+                with open(meta_path, "r", encoding="utf8") as file:
+                    meta = json.load(file)
+                # The shapes are always stored wrapped in a compound.
+                entry = (meta["kind"], tuple(cq.Shape.importBrep(brep_path)))
+                self._remember(key, entry)
+                self.hits += 1
+                return entry
+
+        self.misses += 1
+        return None
+
+    def put(self, key: str, kind: str, shapes: Tuple[cq.Shape, ...],
+            builder: str = "") -> None:
+        """put : Stores an entry.
+
+        Args:
+            key (str): the key of the entry.
+            kind (str): "workplane" or "list", the type of the builder output.
+            shapes (Tuple[cq.Shape, ...]): the shapes of the output.
+            builder (str): the builder name, only stored for reference.
+        """
+
+        self._remember(key, (kind, shapes))
+
+        if self.directory is not None:
+            brep_path, meta_path = self._paths(key)
+            # Write to temporary names first, so parallel runs never read a
+            # half written entry.
+            tmp_suffix = f".{os.getpid()}.tmp"
+            cq.Compound.makeCompound(list(shapes)).exportBrep(brep_path + tmp_suffix)
+            with open(meta_path + tmp_suffix, "w", encoding="utf8") as file:
+                json.dump({"kind": kind, "count": len(shapes), "builder": builder}, file)
+            os.replace(brep_path + tmp_suffix, brep_path)
+            os.replace(meta_path + tmp_suffix, meta_path)
+
+    def clear(self, disk: bool = False) -> None:
+        """clear : Empties the memory cache and, if asked, the directory.
+
+        Args:
+            disk (bool): also remove the BREP files.
+        """
+
+        self._memory.clear()
+        if disk and self.directory is not None:
+            for name in os.listdir(self.directory):
+                if name.endswith((".brep", ".json")):
+                    os.remove(os.path.join(self.directory, name))
+
+
+def _to_shapes(result: Union[cq.Workplane, List[cq.Workplane]]) -> Tuple[str, Tuple[cq.Shape, ...]]:
+    """_to_shapes : Splits a builder output into its kind and shapes."""
+    def single(workplane: cq.Workplane) -> cq.Shape:
+        values = workplane.vals()
+        return values[0] if len(values) == 1 else cq.Compound.makeCompound(values)
+
+    if isinstance(result, list):
+        return "list", tuple(single(item) for item in result)
+    return "workplane", (single(result),)
+
+
+def _from_shapes(kind: str, shapes: Tuple[cq.Shape, ...]) -> Union[cq.Workplane, List[cq.Workplane]]:
+    """_from_shapes : Recreates a builder output from its kind and shapes."""
+    if kind == "list":
+        return [cq.Workplane("XY").add(shape) for shape in shapes]
+    return cq.Workplane("XY").add(shapes[0])
+
+
+def cached_builder(*parameter_names: str, version: int = 1) -> Callable:
+    """cached_builder : Decorates a STOK builder so its output is taken from
+    the geometry cache of the instance, when it has one. The key also holds
+    the sector of the instance, if any. Every call is a span while tracing.
+
+    Args:
+        parameter_names (str): the parameter attributes the builder reads.
+        version (int): the builder version, bump it when the geometry changes.
+    """
+
+    def decorator(method: Callable) -> Callable:
+        def build(self, *args: Any, **kwargs: Any) -> Any:
+            cache: Optional[GeometryCache] = getattr(self, "geometry_cache", None)
+            if cache is None:
+                return method(self, *args, **kwargs)
+
+            # The sector of the instance changes every builder output.
+            key = geometry_key(method.__name__, version,
+                               *(getattr(self, name) for name in parameter_names),
+                               getattr(self, "sector", None),
+                               args, tuple(sorted(kwargs.items())))
+            entry = cache.get(key)
+            if entry is not None:
+                return _from_shapes(*entry)
+
+            result = method(self, *args, **kwargs)
+            kind, shapes = _to_shapes(result)
+            cache.put(key, kind, shapes, builder=method.__name__)
+            return result
+
+        @functools.wraps(method)
+        def wrapper(self, *args: Any, **kwargs: Any) -> Any:
+            if not tracing_enabled():
+                return build(self, *args, **kwargs)
+            with span(method.__name__, "builder") as current:
+                result = build(self, *args, **kwargs)
+                current.set(**shape_counts(result))
+            return result
+
+        wrapper.cache_parameters = parameter_names
+        return wrapper
+
+    return decorator
@@ -0,0 +1,153 @@
+"""Repeated components as one prototype and the rigid transforms of its
+copies. The limbs, the sphere detectors and the ports are N copies of the
+same solid, so the prototype only has to be built and meshed once, and the
+copies are either written from its transformed triangles or placed by
+Serpent transformation cards."""
+import math
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, List, Tuple
+
+import numpy as np
+
+if TYPE_CHECKING:
+    import cadquery as cq
+
+# STOK works in mm, Serpent in cm.
+_MM_TO_CM = 0.1
+
+
+@dataclass(frozen=True)
+class Transform:
+    """A rigid transform, a rotation around the Z axis through the origin
+    followed by a translation.
+
+    Args:
+        angle: float -> the rotation in degrees, counterclockwise seen from +Z.
+        translation: Tuple[float, float, float] -> the translation in mm.
+    """
+    angle: float = 0.0
+    translation: Tuple[float, float, float] = (0.0, 0.0, 0.0)
+
+    @property
+    def matrix(self) -> np.ndarray:
+        """matrix : The rotation matrix, shape (3, 3)."""
+        cos, sin = math.cos(math.radians(self.angle)), math.sin(math.radians(self.angle))
+        return np.array([[cos, -sin, 0.0], [sin, cos, 0.0], [0.0, 0.0, 1.0]])
+
+    def apply(self, points: np.ndarray) -> np.ndarray:
+        """apply : Transforms points.
+
+        Args:
+            points (np.ndarray): the points, shape (M, 3).
+
+        Returns:
+            np.ndarray: the transformed points.
+        """
+        return np.asarray(points, dtype=np.float64) @ self.matrix.T + self.translation
+
+    def apply_to(self, shape: "cq.Shape") -> "cq.Shape":
+        """apply_to : Transforms a shape.
+
+        Args:
+            shape (cq.Shape): the shape.
+
+        Returns:
+            cq.Shape: the transformed copy.
+        """
+        # cadquery is only needed for the geometry, not for the transforms.
+        from cadquery import Vector  # pylint: disable=import-outside-toplevel
+
+        if self.angle != 0:
+            shape = shape.rotate(Vector(0, 0, 0), Vector(0, 0, 1), self.angle)
+        if any(self.translation):
+            shape = shape.translate(Vector(*self.translation))
+        return shape
+
+    def serpent_card(self, universe: str) -> str:
+        """serpent_card : The Serpent universe transformation that places a
+        universe like this transform places the prototype.
+
+        Args:
+            universe (str): the universe to transform.
+
+        Returns:
+            str: the trans card, with the translation in cm.
+        """
+        x, y, z = (value*_MM_TO_CM for value in self.translation)
+        return f"trans U {universe} {x} {y} {z} 0.0 0.0 {self.angle}"
+
+
+def polar_transforms(count: int, offset: float = 0.0) -> Tuple[Transform, ...]:
+    """polar_transforms : Rotations that spread copies evenly around the Z axis.
+
+    Args:
+        count (int): the number of copies.
+        offset (float): the angle of the first copy in degrees.
+
+    Returns:
+        Tuple[Transform, ...]: the transforms.
+    """
+    return tuple(Transform(angle=offset + i*360/count) for i in range(count))
+
+
+@dataclass(frozen=True)
+class Instanced:
+    """A prototype solid and the transforms of all of its copies.
+
+    Args:
+        prototype: cq.Workplane -> the solid, as placed by the identity.
+        transforms: Tuple[Transform, ...] -> one transform per copy.
+    """
+    prototype: Any
+    transforms: Tuple[Transform, ...]
+
+    def __len__(self) -> int:
+        return len(self.transforms)
+
+    def shapes(self) -> List["cq.Shape"]:
+        """shapes : Builds every copy.
+
+        Returns:
+            List[cq.Shape]: the copies, in the order of the transforms.
+        """
+        shape = self.prototype.val()
+        return [transform.apply_to(shape) for transform in self.transforms]
+
+    def solids(self) -> List["cq.Workplane"]:
+        """solids : Builds every copy as a separate component.
+
+        Returns:
+            List[cq.Workplane]: the copies, in the order of the transforms.
+        """
+        import cadquery as cq  # pylint: disable=import-outside-toplevel
+
+        return [cq.Workplane("XY").add(shape) for shape in self.shapes()]
+
+    def fused(self) -> "cq.Workplane":
+        """fused : Fuses every copy into one component, in a single boolean
+        operation.
+
+        Returns:
+            cq.Workplane: the fused copies.
+        """
+        import cadquery as cq  # pylint: disable=import-outside-toplevel
+
+        shapes = self.shapes()
+        if len(shapes) == 1:
+            return cq.Workplane("XY").add(shapes[0])
+        return cq.Workplane("XY").add(shapes[0].fuse(*shapes[1:]).clean())
+
+    def serpent_cards(self, universe: str) -> List[str]:
+        """serpent_cards : Serpent transformations that place every copy,
+        the copy i is expected in universe f"{universe}_{i}", filled with
+        the prototype geometry.
+
+        Args:
+            universe (str): the prefix of the copied universes.
+
+        Returns:
+            List[str]: one trans card per copy.
+        """
+        return [transform.serpent_card(f"{universe}_{i}")
+                for i, transform in enumerate(self.transforms)]
+
@@ -0,0 +1,204 @@
+"""A cache for surface meshes, keyed by a fingerprint of the solid and the
+mesh options that change the mesh. Repeated exports of unchanged solids,
+e.g. into another directory or with only one other component changed, write
+the cached triangles straight out instead of meshing again. Meshes are kept
+as compressed NumPy archives in a directory, or in memory, and the least
+recently used ones are evicted once the cache grows over its size limit."""
+import hashlib
+import io
+import json
+import os
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Any, Dict, Mapping, Optional, Tuple, Union
+
+import numpy as np
+
+if TYPE_CHECKING:
+    import cadquery as cq
+
+# Bump this if the way meshes are stored or keyed changes.
+CACHE_FORMAT_VERSION = 1
+
+# The default size limit, 1 GiB.
+DEFAULT_MAX_BYTES = 1 << 30
+
+# Step files are hashed in blocks of this size.
+_BLOCK_SIZE = 1 << 20
+
+
+def shape_fingerprint(the_solid: Union[str, "cq.Shape"]) -> str:
+    """shape_fingerprint : A stable fingerprint of a solid, the hash of its
+    BREP serialization, or of the file for a step file. The same builder
+    with the same parameters gives the same fingerprint in every process.
+
+    Args:
+        the_solid (str or cq.Shape): the shape or the step file.
+
+    Returns:
+        str: the hex digest.
+    """
+
+    digest = hashlib.sha256()
+    if isinstance(the_solid, str):
+        with open(the_solid, "rb") as file:
+            for block in iter(lambda: file.read(_BLOCK_SIZE), b""):
+                digest.update(block)
+    else:
+        stream = io.BytesIO()
+        the_solid.exportBrep(stream)
+        digest.update(stream.getvalue())
+    return digest.hexdigest()
+
+
+def mesh_key(fingerprint: str, options: Mapping[str, Any]) -> str:
+    """mesh_key : Creates the key of a mesh.
+
+    Args:
+        fingerprint (str): the fingerprint of the solid, see shape_fingerprint.
+        options (Mapping[str, Any]): every option that changes the mesh, as
+        plain data.
+
+    Returns:
+        str: the hex digest of the key.
+    """
+    payload = json.dumps([CACHE_FORMAT_VERSION, fingerprint, options], sort_keys=True)
+    return hashlib.sha256(payload.encode("utf8")).hexdigest()
+
+
+class MeshCache:
+    """Stores the nodes and triangles of surface meshes by key.
+
+    Args:
+        directory (str, optional): where the meshes are stored, if None the
+        cache is only kept in memory.
+        max_bytes (int): the size limit, of the files or of the arrays in memory.
+    """
+
+    def __init__(self, directory: Optional[str] = None,
+                 max_bytes: int = DEFAULT_MAX_BYTES) -> None:
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._memory: "OrderedDict[str, Tuple[np.ndarray, np.ndarray]]" = OrderedDict()
+
+        if self.directory is not None:
+            os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key + ".npz")
+
+    def get(self, key: str) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """get : Returns a mesh.
+
+        Args:
+            key (str): the key of the mesh, see mesh_key.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray] or None: the node coordinates, shape
+            (M, 3), and the node indices of every triangle, shape (T, 3), None
+            if the key is not cached.
+        """
+
+        if self.directory is None:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+        else:
+            path = self._path(key)
+            try:
+                with np.load(path) as archive:
+                    entry = (archive["nodes"], archive["triangles"].astype(np.int64))
+                # The file time orders the eviction.
+                os.utime(path)
+            except (FileNotFoundError, OSError, KeyError, ValueError):
+                # Missing, or evicted or half removed by another process.
+                entry = None
+
+        if entry is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return entry
+
+    def put(self, key: str, nodes: np.ndarray, triangles: np.ndarray) -> None:
+        """put : Stores a mesh, only the nodes of the triangles are kept.
+
+        Args:
+            key (str): the key of the mesh, see mesh_key.
+            nodes (np.ndarray): the node coordinates, shape (M, 3).
+            triangles (np.ndarray): the node indices of every triangle, shape (T, 3).
+        """
+
+        used, triangles = np.unique(np.asarray(triangles), return_inverse=True)
+        nodes = np.asarray(nodes, dtype=np.float64)[used]
+        dtype = np.uint16 if len(nodes) <= np.iinfo(np.uint16).max else np.uint32
+        triangles = triangles.reshape(-1, 3).astype(dtype)
+
+        if self.directory is None:
+            self._memory[key] = (nodes, triangles.astype(np.int64))
+            self._memory.move_to_end(key)
+        else:
+            # Written under a temporary name first, so parallel runs never
+            # read a half written mesh.
+            path = self._path(key)
+            temporary = f"{path}.{os.getpid()}.tmp.npz"
+            np.savez_compressed(temporary, nodes=nodes, triangles=triangles)
+            os.replace(temporary, path)
+        self._evict()
+
+    def _entries(self) -> Dict[str, Tuple[float, int]]:
+        """_entries : The last use and size of every mesh, oldest first."""
+        if self.directory is None:
+            return {key: (float(i), nodes.nbytes + triangles.nbytes)
+                    for i, (key, (nodes, triangles)) in enumerate(self._memory.items())}
+        entries = {}
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".npz") and ".tmp" not in entry.name:
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries[entry.name[:-4]] = (stat.st_mtime, stat.st_size)
+        return dict(sorted(entries.items(), key=lambda item: item[1][0]))
+
+    def _evict(self) -> None:
+        """_evict : Removes the least recently used meshes until the cache
+        fits in max_bytes."""
+        entries = self._entries()
+        total = sum(size for _, size in entries.values())
+        for key, (_, size) in entries.items():
+            if total <= self.max_bytes:
+                break
+            if self.directory is None:
+                del self._memory[key]
+            else:
+                try:
+                    os.remove(self._path(key))
+                except FileNotFoundError:
+                    pass
+            total -= size
+            self.evictions += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """stats : The hit and miss counts of this instance and the size of
+        the cache.
+
+        Returns:
+            Dict[str, Any]: hits, misses, hit_rate, evictions, entries and bytes.
+        """
+        entries = self._entries()
+        lookups = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses,
+                "hit_rate": self.hits/lookups if lookups else 0.0,
+                "evictions": self.evictions, "entries": len(entries),
+                "bytes": sum(size for _, size in entries.values())}
+
+    def clear(self) -> None:
+        """clear : Removes every mesh."""
+        self._memory.clear()
+        if self.directory is not None:
+            for name in os.listdir(self.directory):
+                if name.endswith(".npz"):
+                    os.remove(os.path.join(self.directory, name))
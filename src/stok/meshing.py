@@ -0,0 +1,995 @@
+"""Helpers for handing STOK components over to gmsh. CadQuery shapes are
+passed to gmsh in memory where possible, instead of being written to STEP
+and parsed back."""
+import math
+import os
+import re
+import tempfile
+import time
+import warnings
+from dataclasses import asdict, dataclass, replace
+from typing import Any, Dict, List, Mapping, Optional, Sequence, Tuple, Union
+
+import cadquery as cq
+import gmsh
+import numpy as np
+
+from .instancing import Instanced
+from .mesh_cache import MeshCache, mesh_key, shape_fingerprint
+from .stl import (gmsh_body_triangles, gmsh_nodes, gmsh_triangles, write_ascii_stl,
+                  write_binary_stl, write_gmsh_stl)
+from .stl_check import MeshReport, check_stl
+from .tracing import span
+
+# Relative tolerance used when checking the pointer import.
+_TRANSFER_TOLERANCE = 1e-6
+
+# Whether gmsh can import CadQuery shapes by pointer, checked on first use.
+_POINTER_OK: Optional[bool] = None
+
+# A RAM backed directory for the BREP fallback, when there is one.
+_SHM_DIR = "/dev/shm" if os.path.isdir("/dev/shm") else None
+
+
+def to_shape(the_solid: Union[cq.Workplane, cq.Shape]) -> cq.Shape:
+    """to_shape : Returns the single shape of a workplane, a compound if
+    the workplane holds more than one object.
+
+    Args:
+        the_solid (cq.Workplane or cq.Shape): the component.
+
+    Returns:
+        cq.Shape: the shape.
+    """
+    if isinstance(the_solid, cq.Shape):
+        return the_solid
+    values = the_solid.vals()
+    return values[0] if len(values) == 1 else cq.Compound.makeCompound(values)
+
+
+def _pointer_transfer_works() -> bool:
+    """_pointer_transfer_works : Checks once per process if gmsh can use the
+    TopoDS_Shape pointers of CadQuery. gmsh and CadQuery can be linked
+    against different OCC builds, in which case the pointer import fails or
+    silently produces broken shapes, so a small cylinder is imported into a
+    scratch model and its volume compared."""
+    global _POINTER_OK  # pylint: disable=global-statement
+
+    if _POINTER_OK is None:
+        probe = cq.Workplane("XY").cylinder(2.0, 1.0).val()
+        current = gmsh.model.getCurrent()
+        gmsh.model.add("stok_transfer_probe")
+        try:
+            dim_tags = gmsh.model.occ.importShapesNativePointer(probe.wrapped._address())
+            mass = sum(gmsh.model.occ.getMass(dim, tag) for dim, tag in dim_tags if dim == 3)
+            _POINTER_OK = abs(mass - probe.Volume()) <= _TRANSFER_TOLERANCE*probe.Volume()
+        except Exception:  # pylint: disable=broad-except
+            # gmsh raises plain Exceptions for OCC errors.
+            _POINTER_OK = False
+        gmsh.model.remove()
+        gmsh.model.setCurrent(current)
+
+    return _POINTER_OK
+
+
+def _import_brep(shape: cq.Shape) -> List[Tuple[int, int]]:
+    """_import_brep : Imports a shape through a BREP file in RAM backed
+    storage, gmsh cannot read shapes from a string."""
+    handle, path = tempfile.mkstemp(suffix=".brep", dir=_SHM_DIR)
+    os.close(handle)
+    try:
+        shape.exportBrep(path)
+        return gmsh.model.occ.importShapes(path)
+    finally:
+        os.remove(path)
+
+
+def import_shape(the_solid: Union[str, cq.Workplane, cq.Shape],
+                 transfer: str = "auto") -> List[Tuple[int, int]]:
+    """import_shape : Adds a component to the current gmsh model, gmsh
+    has to be initialized.
+
+    Args:
+        the_solid (str, cq.Workplane or cq.Shape): a step file or the component.
+        transfer (str): how shapes are handed to gmsh, "pointer" passes the
+        underlying TopoDS_Shape, "brep" goes through a BREP file in memory
+        and "auto" uses the pointer when gmsh and CadQuery share a compatible
+        OCC build and BREP otherwise. The pointer is checked by importing a
+        probe in this process, so only mismatches that give wrong shapes or
+        errors are caught, one that crashes OCC still ends the process. Use
+        "brep" where the builds are not known to match.
+
+    Raises:
+        ValueError: if transfer is not one of the options.
+        RuntimeError: if transfer is "pointer" and the probe import failed.
+
+    Returns:
+        List[Tuple[int, int]]: the imported gmsh entities.
+    """
+
+    if isinstance(the_solid, str):
+        return gmsh.model.occ.importShapes(the_solid)
+
+    if transfer not in ("auto", "pointer", "brep"):
+        raise ValueError(f"Unknown transfer {transfer!r}, expected auto, pointer or brep.")
+
+    shape = to_shape(the_solid)
+    if transfer == "brep":
+        return _import_brep(shape)
+
+    if _pointer_transfer_works():
+        return gmsh.model.occ.importShapesNativePointer(shape.wrapped._address())
+    if transfer == "pointer":
+        raise RuntimeError("gmsh cannot import CadQuery shapes by pointer, their OCC "
+                           "builds do not match, use transfer=\"brep\" or \"auto\".")
+
+    return _import_brep(shape)
+
+
+# The options apply_mesh_policy can change. A batch session puts them back
+# to their defaults before every component.
+_MESH_OPTIONS = ("Mesh.MeshSizeMin", "Mesh.MeshSizeMax", "Mesh.MeshSizeExtendFromBoundary",
+                 "Mesh.MeshSizeFromPoints", "Mesh.MeshSizeFromCurvature",
+                 "General.NumThreads", "Mesh.Algorithm", "Mesh.AngleToleranceFacetOverlap")
+
+
+@dataclass(frozen=True)
+class MeshPolicy:
+    """How a component is meshed. Sizes are given as multiples of the
+    max_triangle_size of the export, so one policy works for coarse and fine
+    exports alike.
+
+    Args:
+        min_size: float -> the smallest triangle size.
+        max_size: float -> the largest triangle size.
+        curvature: int -> the number of triangles per 2*pi of curvature, 0 turns
+        the curvature refinement off.
+        plasma_size: float, optional -> the triangle size on the plasma-facing
+        surfaces, None turns the threshold off and meshes with max_size.
+        transition: float -> the distance from the plasma over which the size
+        grows from plasma_size to max_size.
+        triangle_budget: int, optional -> the number of triangles the component
+        is expected to stay under, exceeding it gives a warning.
+    """
+    min_size: float = 0.0
+    max_size: float = 1.0
+    curvature: int = 0
+    plasma_size: Optional[float] = None
+    transition: float = 10.0
+    triangle_budget: Optional[int] = None
+
+
+# The containment layers are meshed as fine as before next to the plasma and
+# coarser towards the outside of the reactor.
+_CONTAINMENT_POLICY = MeshPolicy(plasma_size=1.0, max_size=2.0, triangle_budget=1_000_000)
+_CURVED_POLICY = MeshPolicy(curvature=20, triangle_budget=250_000)
+
+# The mesh policy of every STOK builder.
+MESH_POLICIES: Dict[str, MeshPolicy] = {
+    "containment_layer": _CONTAINMENT_POLICY,
+    "containment": _CONTAINMENT_POLICY,
+    "containment_with_ports": _CONTAINMENT_POLICY,
+    "containment_with_divertor": _CONTAINMENT_POLICY,
+    "containment_with_divertor_and_ports": _CONTAINMENT_POLICY,
+    "transformer_limbs": MeshPolicy(triangle_budget=250_000),
+    "transformer_limb": MeshPolicy(triangle_budget=250_000),
+    "transformer_limb_instances": MeshPolicy(triangle_budget=250_000),
+    # The bounding box only has flat faces, any triangle size represents
+    # it exactly.
+    "bounding_box": MeshPolicy(max_size=25.0, triangle_budget=50_000),
+    "central_solenoid": _CURVED_POLICY,
+    "plasma_source": _CURVED_POLICY,
+    "opening": _CURVED_POLICY,
+    "openings": _CURVED_POLICY,
+    "limiter_firstwall_openings": _CURVED_POLICY,
+    "limiter_firstwall": _CURVED_POLICY,
+    "limiter_backwall": _CURVED_POLICY,
+    "divertor_cutter": _CURVED_POLICY,
+    "divertor_firstwall": _CURVED_POLICY,
+    "divertor_backwall": _CURVED_POLICY,
+    "sphere_pair_array": _CURVED_POLICY,
+    "sphere_instances": _CURVED_POLICY,
+    "opening_instances": _CURVED_POLICY,
+}
+
+# Used for step files and components that are not in the registry.
+DEFAULT_MESH_POLICY = MeshPolicy(curvature=20)
+
+
+def register_mesh_policy(component: str, policy: MeshPolicy) -> None:
+    """register_mesh_policy : Sets the mesh policy of a component, e.g.
+    for a builder added in a subclass of STOK.
+
+    Args:
+        component (str): the name of the builder.
+        policy (MeshPolicy): the policy.
+    """
+    MESH_POLICIES[component] = policy
+
+
+def policy_for(name: str) -> MeshPolicy:
+    """policy_for : Looks up the mesh policy of a component. Besides the
+    builder name this also accepts the names of the parts from
+    stok_modules.named_parts and stl filenames made from them.
+
+    Args:
+        name (str): the builder name, part name or stl filename.
+
+    Returns:
+        MeshPolicy: the policy, DEFAULT_MESH_POLICY for unknown components.
+    """
+    component = os.path.splitext(os.path.basename(name))[0]
+    # Part names end in the indices of the part, e.g. containment_3.
+    while component not in MESH_POLICIES and re.search(r"_\d+$", component):
+        component = re.sub(r"_\d+$", "", component)
+    return MESH_POLICIES.get(component, DEFAULT_MESH_POLICY)
+
+
+def _distance_to_chamber(points: np.ndarray, chamber: Sequence[float]) -> np.ndarray:
+    """_distance_to_chamber : The distance of points from the rectangular
+    cross-section of the plasma chamber, 0 inside it."""
+    inner_r, outer_r, height = chamber
+    r = np.hypot(points[:, 0], points[:, 1])
+    dr = np.maximum(np.maximum(inner_r - r, r - outer_r), 0.0)
+    dz = np.maximum(np.abs(points[:, 2]) - height/2, 0.0)
+    return np.hypot(dr, dz)
+
+
+def apply_mesh_policy(policy: MeshPolicy, max_triangle_size: float,
+                      chamber: Optional[Sequence[float]] = None,
+                      threads: Optional[int] = None) -> None:
+    """apply_mesh_policy : Sets the mesh size options of the current gmsh
+    model. The threshold on the distance from the plasma is evaluated once
+    for every model vertex, gmsh then grows the sizes from the boundaries,
+    instead of evaluating a size field at every mesh node.
+
+    Args:
+        policy (MeshPolicy): the policy.
+        max_triangle_size (float): the maximum size of the side of a triangle.
+        chamber (Sequence[float], optional): the inner radius, outer radius and
+        height of the plasma chamber, see LayerTable.chamber. Without it the
+        threshold is skipped.
+        threads (int, optional): the number of gmsh threads, defaults to
+        the cpu count.
+    """
+
+    max_size = policy.max_size*max_triangle_size
+    gmsh.option.setNumber("Mesh.MeshSizeMin", policy.min_size*max_triangle_size)
+    gmsh.option.setNumber("Mesh.MeshSizeMax", max_size)
+    gmsh.option.setNumber("Mesh.MeshSizeFromCurvature", policy.curvature)
+
+    if policy.plasma_size is not None and chamber is not None:
+        dim_tags = gmsh.model.getEntities(0)
+        points = np.array([gmsh.model.getValue(0, tag, []) for _, tag in dim_tags]).reshape(-1, 3)
+        distance = _distance_to_chamber(points, chamber)
+        plasma_size = policy.plasma_size*max_triangle_size
+        fraction = np.clip(distance/(policy.transition*max_triangle_size), 0.0, 1.0)
+        for dim_tag, size in zip(dim_tags, plasma_size + (max_size - plasma_size)*fraction):
+            gmsh.model.mesh.setSize([dim_tag], float(size))
+        gmsh.option.setNumber("Mesh.MeshSizeFromPoints", 1)
+        gmsh.option.setNumber("Mesh.MeshSizeExtendFromBoundary", 1)
+    else:
+        gmsh.option.setNumber("Mesh.MeshSizeFromPoints", 0)
+        gmsh.option.setNumber("Mesh.MeshSizeExtendFromBoundary", 0)
+
+    # Set nr of cores to run on.
+    gmsh.option.setNumber("General.NumThreads", os.cpu_count() if threads is None else threads)
+
+    # Type of meshing algorithm.
+    gmsh.option.setNumber("Mesh.Algorithm", 6)
+    gmsh.option.setNumber("Mesh.AngleToleranceFacetOverlap", 0.1)
+
+
+def _warn_exp_factor(exp_factor, stacklevel: int = 3) -> None:
+    """_warn_exp_factor : Warns if an exp_factor is given, it does nothing
+    since the mesh policies replaced the radial size field."""
+    if exp_factor is not None:
+        warnings.warn("exp_factor does nothing and will be removed, leave it as None.",
+                      FutureWarning, stacklevel=stacklevel)
+
+
+def set_mesh_options(filename: str, max_triangle_size: float, exp_factor=None,
+                     chamber: Optional[Sequence[float]] = None) -> None:
+    """set_mesh_options : Sets the mesh options for a component in the
+    current gmsh model, with the policy found by policy_for.
+
+    Args:
+        filename (str): the component, part or stl file name.
+        max_triangle_size (float): the maximum size of the side of a triangle.
+        exp_factor: deprecated, a value other than None gives a FutureWarning.
+        The radial size field it controlled was always clamped to
+        max_triangle_size.
+        chamber (Sequence[float], optional): see apply_mesh_policy.
+    """
+    _warn_exp_factor(exp_factor)
+    apply_mesh_policy(policy_for(filename), max_triangle_size, chamber)
+
+
+def check_triangle_budget(policy: MeshPolicy, triangles: int, name: str) -> bool:
+    """check_triangle_budget : Warns if a mesh has more triangles than the
+    budget of its policy.
+
+    Args:
+        policy (MeshPolicy): the policy the mesh was made with.
+        triangles (int): the number of triangles.
+        name (str): the component, used in the warning.
+
+    Returns:
+        bool: True if the mesh is within the budget.
+    """
+    if policy.triangle_budget is None or triangles <= policy.triangle_budget:
+        return True
+    warnings.warn(f"{name} has {triangles} triangles, over its budget of "
+                  f"{policy.triangle_budget}.", RuntimeWarning)
+    return False
+
+
+def triangle_count() -> int:
+    """triangle_count : The number of triangles in the current gmsh model.
+
+    Returns:
+        int: the number of triangles.
+    """
+    return len(gmsh.model.mesh.getElementsByType(2)[0])
+
+
+def mesh_deviation() -> float:
+    """mesh_deviation : The chordal deviation of the surface mesh of the
+    current gmsh model, the largest distance of the triangle centers and
+    edge midpoints from the CAD surface they mesh.
+
+    Returns:
+        float: the deviation, 0 for flat surfaces.
+    """
+    nodes, index = gmsh_nodes()
+    deviation = 0.0
+    for _, tag in gmsh.model.getEntities(2):
+        vertices = nodes[gmsh_triangles(index, tag)]
+        if not len(vertices):
+            continue
+        points = np.concatenate([vertices.mean(axis=1),
+                                 (vertices + np.roll(vertices, 1, axis=1)).reshape(-1, 3)/2])
+        closest, _ = gmsh.model.getClosestPoint(2, tag, points.ravel())
+        distance = np.linalg.norm(np.reshape(closest, (-1, 3)) - points, axis=1)
+        deviation = max(deviation, float(distance.max()))
+    return deviation
+
+
+# The triangle count and deviation change about as the inverse square and
+# the square of the triangle size, used until two meshes give the slopes.
+_TRIANGLE_SLOPE = (-2.0, -3.0, -0.3)
+_DEVIATION_SLOPE = (2.0, 0.3, 3.0)
+
+# The tuner aims a little under the limits, so noise does not push it over.
+_TUNING_AIM = 0.95
+
+# A mesh within these fractions of the limit ends the search.
+_TUNING_BAND = {"triangles": 0.8, "deviation": 0.6}
+
+# The fewest triangles per 2*pi of curvature the tuner goes down to.
+_MIN_CURVATURE = 6
+
+# The tuner never goes coarser than this multiple of max_triangle_size.
+_MAX_SIZE_FACTOR = 64
+
+# Deviations below this fraction of the triangle size are rounding, the
+# surfaces are flat.
+_FLAT = 1e-9
+
+
+@dataclass(frozen=True)
+class MeshTuning:
+    """The mesh settings tune_mesh chose and what they achieved.
+
+    Args:
+        max_triangle_size: float
+        curvature: int -> the triangles per 2*pi of curvature, see MeshPolicy.
+        triangles: int
+        deviation: float -> the chordal deviation, see mesh_deviation.
+        triangle_budget: int, optional
+        max_deviation: float, optional
+        meshes: Tuple[Tuple[float, int, float], ...] -> the triangle size,
+        number of triangles and deviation of every mesh made in the search.
+    """
+    max_triangle_size: float
+    curvature: int
+    triangles: int
+    deviation: float
+    triangle_budget: Optional[int]
+    max_deviation: Optional[float]
+    meshes: Tuple[Tuple[float, int, float], ...]
+
+    @property
+    def within_budget(self) -> bool:
+        """within_budget : True if the mesh fits the triangle budget."""
+        return self.triangle_budget is None or self.triangles <= self.triangle_budget
+
+    @property
+    def within_deviation(self) -> bool:
+        """within_deviation : True if the mesh keeps to the maximum deviation."""
+        return self.max_deviation is None or self.deviation <= self.max_deviation
+
+    def as_dict(self) -> Dict[str, Any]:
+        """as_dict : The tuning as plain data, with the derived values."""
+        values = asdict(self)
+        values["meshes"] = [list(mesh) for mesh in self.meshes]
+        values.update(within_budget=self.within_budget, within_deviation=self.within_deviation)
+        return values
+
+
+def _tuned_policy(policy: MeshPolicy, size: float, max_triangle_size: float) -> MeshPolicy:
+    """_tuned_policy : Scales the curvature refinement with the triangle
+    size, relative to the policy at max_triangle_size. Without it, the
+    curvature refinement would keep the same triangles on curved surfaces
+    at every size."""
+    if policy.curvature == 0:
+        return policy
+    return replace(policy, curvature=max(_MIN_CURVATURE,
+                                         math.ceil(policy.curvature*max_triangle_size/size)))
+
+
+def _next_size(meshes: List[Tuple[float, int, float]], column: int, target: float,
+               slope: Tuple[float, float, float]) -> float:
+    """_next_size : Extrapolates the triangle size that reaches a target
+    number of triangles (column 1) or deviation (column 2), on a log-log
+    line through the last two meshes."""
+    (size_a, *values_a), (size_b, *values_b) = meshes[-2], meshes[-1]
+    value_a, value_b = values_a[column - 1], values_b[column - 1]
+    fitted = slope[0]
+    if value_a > 0 and value_b > 0 and size_a != size_b:
+        fitted = math.log(value_b/value_a)/math.log(size_b/size_a)
+    if not min(slope[1:]) <= fitted <= max(slope[1:]):
+        fitted = slope[0]
+    if value_b <= 0:
+        return size_b*8
+    step = math.exp(math.log(target/value_b)/fitted)
+    return size_b*min(max(step, 1/8), 8)
+
+
+def tune_mesh(policy: MeshPolicy, max_triangle_size: float,
+              triangle_budget: Optional[int] = None, max_deviation: Optional[float] = None,
+              chamber: Optional[Sequence[float]] = None, threads: Optional[int] = None,
+              max_meshes: int = 8) -> MeshTuning:
+    """tune_mesh : Finds the triangle size for the current gmsh model that
+    keeps to a triangle budget and a maximum chordal deviation, and leaves
+    its mesh in the model. The search starts from two coarse meshes, at 4
+    and 2 times max_triangle_size, and extrapolates the triangle count and
+    deviation on log-log lines to the size that reaches the limit. With a
+    maximum deviation the coarsest mesh within both limits is chosen,
+    otherwise the finest mesh within the budget. Where both limits cannot be
+    met, the budget wins. The curvature refinement of the policy is scaled
+    with the size, see _tuned_policy.
+
+    Args:
+        policy (MeshPolicy): the policy of the component.
+        max_triangle_size (float): the size the policy is scaled from.
+        triangle_budget (int, optional): the largest number of triangles.
+        max_deviation (float, optional): the largest chordal deviation.
+        chamber (Sequence[float], optional): see apply_mesh_policy.
+        threads (int, optional): see apply_mesh_policy.
+        max_meshes (int): the largest number of meshes made in the search.
+
+    Raises:
+        ValueError: if neither a budget nor a deviation is given.
+
+    Returns:
+        MeshTuning: the chosen settings and what they achieved.
+    """
+
+    if triangle_budget is None and max_deviation is None:
+        raise ValueError("tune_mesh needs a triangle budget or a maximum deviation.")
+
+    meshes: List[Tuple[float, int, float]] = []
+
+    def mesh(size: float) -> Tuple[float, int, float]:
+        gmsh.model.mesh.clear()
+        apply_mesh_policy(_tuned_policy(policy, size, max_triangle_size), size,
+                          chamber, threads)
+        with span("generate", "export", max_triangle_size=size) as current:
+            gmsh.model.mesh.generate(2)
+            result = (size, triangle_count(), mesh_deviation())
+            current.set(triangles=result[1], deviation=result[2])
+        meshes.append(result)
+        return result
+
+    def fits(result: Tuple[float, int, float]) -> bool:
+        return (triangle_budget is None or result[1] <= triangle_budget) and \
+            (max_deviation is None or result[2] <= max_deviation)
+
+    def close(result: Tuple[float, int, float]) -> bool:
+        # A mesh near the budget cannot get much finer, flat surfaces
+        # without deviation not better.
+        if triangle_budget is not None and \
+                _TUNING_BAND["triangles"]*triangle_budget <= result[1] <= triangle_budget:
+            return True
+        return fits(result) and max_deviation is not None and \
+            (result[2] >= _TUNING_BAND["deviation"]*max_deviation or
+             result[2] <= _FLAT*result[0])
+
+    with span("tune_mesh", "export", triangle_budget=triangle_budget,
+              max_deviation=max_deviation):
+        mesh(max_triangle_size*4)
+        result = mesh(max_triangle_size*2)
+        while not close(result) and len(meshes) < max_meshes:
+            # Sizes above the budget size keep to the budget, sizes below
+            # the deviation size to the deviation. The budget wins.
+            sizes = []
+            if triangle_budget is not None:
+                sizes.append(_next_size(meshes, 1, _TUNING_AIM*triangle_budget,
+                                        _TRIANGLE_SLOPE))
+            if max_deviation is not None:
+                sizes.append(_next_size(meshes, 2, _TUNING_AIM*max_deviation,
+                                        _DEVIATION_SLOPE))
+            size = min(max(sizes), max_triangle_size*_MAX_SIZE_FACTOR)
+            if any(math.isclose(size, done[0], rel_tol=1e-3) for done in meshes):
+                break
+            result = mesh(size)
+
+        # The coarsest mesh within the limits with a deviation, the finest
+        # within the budget otherwise.
+        within = [done for done in meshes if fits(done)]
+        if within:
+            best = (max if max_deviation is not None else min)(within, key=lambda done: done[0])
+        elif triangle_budget is not None and \
+                any(done[1] <= triangle_budget for done in meshes):
+            best = min((done for done in meshes if done[1] <= triangle_budget),
+                       key=lambda done: done[2])
+        elif triangle_budget is not None:
+            best = min(meshes, key=lambda done: done[1])
+        else:
+            best = min(meshes, key=lambda done: done[2])
+        if best is not result:
+            result = mesh(best[0])
+
+    tuning = MeshTuning(max_triangle_size=result[0],
+                        curvature=_tuned_policy(policy, result[0], max_triangle_size).curvature,
+                        triangles=result[1], deviation=result[2],
+                        triangle_budget=triangle_budget, max_deviation=max_deviation,
+                        meshes=tuple(meshes))
+    if not (tuning.within_budget and tuning.within_deviation):
+        warnings.warn(f"No mesh was found within the triangle budget of {triangle_budget} "
+                      f"and the maximum deviation of {max_deviation}, the chosen one has "
+                      f"{tuning.triangles} triangles and a deviation of "
+                      f"{tuning.deviation:.3g}.", RuntimeWarning)
+    return tuning
+
+
+def write_stl(filename: str, binary: bool = False) -> None:
+    """write_stl : Writes the surface mesh of the current gmsh model.
+
+    Args:
+        filename (str): the name of the stl file.
+        binary (bool): write a binary stl with stok.stl, which is smaller and
+        faster than the ascii file gmsh writes.
+    """
+    if binary:
+        write_gmsh_stl(filename)
+    else:
+        gmsh.write(filename)
+
+
+def check_written_stl(filename: str, the_solid: Union[str, cq.Workplane, cq.Shape],
+                      expected_volume: Optional[float] = None) -> MeshReport:
+    """check_written_stl : Checks an exported stl file against the component
+    it was made from, warns if it is not watertight.
+
+    Args:
+        filename (str): the stl file.
+        the_solid (str, cq.Workplane or cq.Shape): the component, the volume
+        is only compared for components, not for step files.
+        expected_volume (float, optional): replaces the volume of the component.
+
+    Returns:
+        MeshReport: the report.
+    """
+    if expected_volume is None and not isinstance(the_solid, str):
+        expected_volume = to_shape(the_solid).Volume()
+    with span("check", "export"):
+        report = check_stl(filename, expected_volume)
+    if not report.watertight:
+        warnings.warn(f"{filename} is not watertight: {report.boundary_edges} boundary, "
+                      f"{report.non_manifold_edges} non-manifold and "
+                      f"{report.flipped_edges} flipped edges.", RuntimeWarning)
+    return report
+
+
+class BatchExporter:
+    """Exports many components as stl files in one gmsh session, used as a
+    context manager. Every component gets its own model, which is removed
+    once its stl file is written.
+
+    Args:
+        max_triangle_size (float): the default maximum size of the side of a triangle.
+        exp_factor: deprecated, see set_mesh_options.
+        transfer (str): how components are handed to gmsh, see import_shape.
+        binary (bool): write binary stl files, see write_stl.
+        chamber (Sequence[float], optional): the plasma chamber the mesh
+        policies refine towards, see apply_mesh_policy.
+        check (bool): check every written stl file, see check_written_stl.
+        threads (int, optional): the number of gmsh threads, defaults to the
+        cpu count. Set it when several exporters run side by side.
+        mesh_cache (MeshCache, optional): where meshes are looked up before
+        meshing and stored after, see export.
+    """
+
+    def __init__(self, max_triangle_size: float, exp_factor=None, transfer: str = "auto",
+                 binary: bool = False, chamber: Optional[Sequence[float]] = None,
+                 check: bool = False, threads: Optional[int] = None,
+                 mesh_cache: Optional[MeshCache] = None) -> None:
+        _warn_exp_factor(exp_factor)
+        self.max_triangle_size = max_triangle_size
+        self.transfer = transfer
+        self.binary = binary
+        self.chamber = chamber
+        self.check = check
+        self.threads = threads
+        self.mesh_cache = mesh_cache
+        self._defaults: Dict[str, float] = {}
+
+    def __enter__(self) -> "BatchExporter":
+        gmsh.initialize()
+        self._defaults = {name: gmsh.option.getNumber(name) for name in _MESH_OPTIONS}
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        gmsh.finalize()
+
+    def mesh_key(self, the_solid: Union[str, cq.Workplane, cq.Shape],
+                 max_triangle_size: float, policy: MeshPolicy) -> str:
+        """mesh_key : The key of a component in the mesh cache, made of the
+        fingerprint of the solid and every option that changes its mesh. The
+        number of threads and the stl format do not change the triangles, so
+        they are left out.
+
+        Args:
+            the_solid (str, cq.Workplane or cq.Shape): the component or its step file.
+            max_triangle_size (float): the maximum size of the side of a triangle.
+            policy (MeshPolicy): the mesh policy.
+
+        Returns:
+            str: the key.
+        """
+        fingerprint = shape_fingerprint(the_solid if isinstance(the_solid, str)
+                                        else to_shape(the_solid))
+        options = {"policy": asdict(policy), "max_triangle_size": float(max_triangle_size),
+                   # The chamber only matters when the policy refines towards it.
+                   "chamber": None if policy.plasma_size is None or self.chamber is None
+                   else [float(value) for value in self.chamber],
+                   "gmsh": gmsh.__version__}
+        return mesh_key(fingerprint, options)
+
+    def export(self, the_solid: Union[str, cq.Workplane, cq.Shape], filename: str,
+               max_triangle_size: Optional[float] = None,
+               exp_factor=None, component: Optional[str] = None,
+               policy: Optional[MeshPolicy] = None) -> Dict[str, Any]:
+        """export : Meshes one component and writes its stl file.
+
+        Args:
+            the_solid (str, cq.Workplane or cq.Shape): the component or its step file.
+            filename (str): the name of the stl file.
+            max_triangle_size (float, optional): replaces the default for this component.
+            exp_factor (optional): deprecated, see set_mesh_options.
+            component (str, optional): the builder or part name the mesh policy
+            is looked up with, defaults to the filename.
+            policy (MeshPolicy, optional): replaces the registered policy.
+
+        Returns:
+            Dict[str, Any]: the filename, the import, mesh and write times,
+            the number of triangles, whether they fit the triangle budget and,
+            when checking, the MeshReport as a dict.
+        """
+
+        max_triangle_size = self.max_triangle_size if max_triangle_size is None \
+            else max_triangle_size
+        _warn_exp_factor(exp_factor)
+        if policy is None:
+            policy = policy_for(filename if component is None else component)
+
+        key = None
+        if self.mesh_cache is not None:
+            with span("mesh_cache", "export", filename=filename) as current:
+                key = self.mesh_key(the_solid, max_triangle_size, policy)
+                cached = self.mesh_cache.get(key)
+                current.set(hit=cached is not None)
+            if cached is not None:
+                return self._write_cached(the_solid, filename, policy, *cached)
+
+        # Options are global in gmsh, so the ones of the previous component
+        # are reset first.
+        for name, value in self._defaults.items():
+            gmsh.option.setNumber(name, value)
+        gmsh.model.add(filename)
+
+        with span("export", "export", filename=filename):
+            tic = time.perf_counter()
+            with span("import", "export"):
+                import_shape(the_solid, transfer=self.transfer)
+            with span("synchronize", "export"):
+                gmsh.model.occ.synchronize()
+            import_time = time.perf_counter() - tic
+
+            apply_mesh_policy(policy, max_triangle_size, self.chamber, self.threads)
+
+            tic = time.perf_counter()
+            with span("generate", "export") as current:
+                gmsh.model.mesh.generate(2)
+                triangles = triangle_count()
+                current.set(triangles=triangles)
+            mesh_time = time.perf_counter() - tic
+            within_budget = check_triangle_budget(policy, triangles, filename)
+
+            tic = time.perf_counter()
+            with span("write", "export", binary=self.binary):
+                write_stl(filename, self.binary)
+            write_time = time.perf_counter() - tic
+
+            if key is not None:
+                with span("mesh_cache_put", "export"):
+                    nodes, index = gmsh_nodes()
+                    self.mesh_cache.put(key, nodes, gmsh_triangles(index))
+
+        # Removing the model also removes its mesh size fields.
+        gmsh.model.remove()
+
+        report = {"filename": filename, "import_time": import_time, "mesh_time": mesh_time,
+                  "write_time": write_time, "triangles": triangles,
+                  "within_budget": within_budget}
+        if key is not None:
+            report["cached"] = False
+        if self.check:
+            report["check"] = check_written_stl(filename, the_solid).as_dict()
+        return report
+
+    def _write_cached(self, the_solid: Union[str, cq.Workplane, cq.Shape], filename: str,
+                      policy: MeshPolicy, nodes: np.ndarray,
+                      triangles: np.ndarray) -> Dict[str, Any]:
+        """_write_cached : Writes a mesh from the cache, with the report of export."""
+        tic = time.perf_counter()
+        with span("write", "export", binary=self.binary, cached=True):
+            writer = write_binary_stl if self.binary else write_ascii_stl
+            writer(filename, nodes, triangles)
+        write_time = time.perf_counter() - tic
+
+        report = {"filename": filename, "import_time": 0.0, "mesh_time": 0.0,
+                  "write_time": write_time, "triangles": len(triangles),
+                  "within_budget": check_triangle_budget(policy, len(triangles), filename),
+                  "cached": True}
+        if self.check:
+            report["check"] = check_written_stl(filename, the_solid).as_dict()
+        return report
+
+    def export_tuned(self, the_solid: Union[str, cq.Workplane, cq.Shape], filename: str,
+                     triangle_budget: Optional[int] = None,
+                     max_deviation: Optional[float] = None,
+                     component: Optional[str] = None,
+                     policy: Optional[MeshPolicy] = None) -> Dict[str, Any]:
+        """export_tuned : Meshes one component with the triangle size
+        tune_mesh finds and writes its stl file.
+
+        Args:
+            the_solid (str, cq.Workplane or cq.Shape): the component or its step file.
+            filename (str): the name of the stl file.
+            triangle_budget (int, optional): the largest number of triangles,
+            defaults to the triangle budget of the policy.
+            max_deviation (float, optional): the largest chordal deviation.
+            component (str, optional): the builder or part name the mesh policy
+            is looked up with, defaults to the filename.
+            policy (MeshPolicy, optional): replaces the registered policy.
+
+        Returns:
+            Dict[str, Any]: the report of export, with the MeshTuning as a
+            dict in "tuning". The mesh time is the time of the whole search.
+        """
+
+        if policy is None:
+            policy = policy_for(filename if component is None else component)
+        triangle_budget = policy.triangle_budget if triangle_budget is None \
+            else triangle_budget
+
+        for name, value in self._defaults.items():
+            gmsh.option.setNumber(name, value)
+        gmsh.model.add(filename)
+
+        with span("export_tuned", "export", filename=filename):
+            tic = time.perf_counter()
+            with span("import", "export"):
+                import_shape(the_solid, transfer=self.transfer)
+                gmsh.model.occ.synchronize()
+            import_time = time.perf_counter() - tic
+
+            tic = time.perf_counter()
+            tuning = tune_mesh(policy, self.max_triangle_size, triangle_budget, max_deviation,
+                               self.chamber, self.threads)
+            mesh_time = time.perf_counter() - tic
+
+            tic = time.perf_counter()
+            with span("write", "export", binary=self.binary):
+                write_stl(filename, self.binary)
+            write_time = time.perf_counter() - tic
+        gmsh.model.remove()
+
+        report = {"filename": filename, "import_time": import_time, "mesh_time": mesh_time,
+                  "write_time": write_time, "triangles": tuning.triangles,
+                  "within_budget": tuning.within_budget, "tuning": tuning.as_dict()}
+        if self.check:
+            report["check"] = check_written_stl(filename, the_solid).as_dict()
+        return report
+
+    def export_instances(self, instanced: Instanced, filename: str, copies: bool = True,
+                         max_triangle_size: Optional[float] = None,
+                         component: Optional[str] = None,
+                         policy: Optional[MeshPolicy] = None) -> Dict[str, Any]:
+        """export_instances : Meshes the prototype of a repeated component once
+        and writes the copies from its transformed triangles.
+
+        Args:
+            instanced (Instanced): the prototype and the transforms of its copies.
+            filename (str): the name of the stl file, the copy i is written to
+            the name with _i added before the extension.
+            copies (bool): write every copy, otherwise only the prototype is
+            written to filename and the copies are left to Serpent, see
+            Instanced.serpent_cards.
+            max_triangle_size (float, optional): replaces the default.
+            component (str, optional): the builder the mesh policy is looked up
+            with, defaults to the filename.
+            policy (MeshPolicy, optional): replaces the registered policy.
+
+        Returns:
+            Dict[str, Any]: the mesh and write times, the number of triangles
+            of the prototype, whether they fit the triangle budget and, in
+            "files", the filename and, when checking, the MeshReport of every
+            stl file.
+        """
+
+        max_triangle_size = self.max_triangle_size if max_triangle_size is None \
+            else max_triangle_size
+        if policy is None:
+            policy = policy_for(filename if component is None else component)
+
+        for name, value in self._defaults.items():
+            gmsh.option.setNumber(name, value)
+        gmsh.model.add(filename)
+
+        with span("export_instances", "export", filename=filename, copies=len(instanced)):
+            tic = time.perf_counter()
+            with span("import", "export"):
+                import_shape(instanced.prototype, transfer=self.transfer)
+                gmsh.model.occ.synchronize()
+            apply_mesh_policy(policy, max_triangle_size, self.chamber, self.threads)
+            with span("generate", "export") as current:
+                gmsh.model.mesh.generate(2)
+                nodes, index = gmsh_nodes()
+                triangles = gmsh_triangles(index)
+                current.set(triangles=len(triangles))
+            mesh_time = time.perf_counter() - tic
+            within_budget = check_triangle_budget(policy, len(triangles), filename)
+            gmsh.model.remove()
+
+            # Rigid transforms keep the orientation of the triangles, so only
+            # the nodes are transformed.
+            tic = time.perf_counter()
+            writer = write_binary_stl if self.binary else write_ascii_stl
+            root, extension = os.path.splitext(filename)
+            files: List[Dict[str, Any]] = []
+            with span("write", "export", binary=self.binary):
+                if copies:
+                    for i, transform in enumerate(instanced.transforms):
+                        path = f"{root}_{i}{extension}"
+                        writer(path, transform.apply(nodes), triangles)
+                        files.append({"filename": path})
+                else:
+                    writer(filename, nodes, triangles)
+                    files.append({"filename": filename})
+            write_time = time.perf_counter() - tic
+
+        if self.check:
+            for entry in files:
+                entry["check"] = check_written_stl(entry["filename"],
+                                                   instanced.prototype).as_dict()
+        return {"mesh_time": mesh_time, "write_time": write_time,
+                "triangles": len(triangles), "within_budget": within_budget, "files": files}
+
+    def export_conformal(self, bodies: Mapping[str, Union[str, cq.Workplane, cq.Shape]],
+                         max_triangle_size: Optional[float] = None,
+                         component: Optional[str] = None,
+                         policy: Optional[MeshPolicy] = None) -> Dict[str, Any]:
+        """export_conformal : Meshes several touching components together and
+        writes an stl file for each. The components are fragmented in one
+        gmsh model, so a surface two of them share is meshed once and both
+        stl files have the same nodes on it. Where components overlap the
+        overlap goes to the first of them.
+
+        Args:
+            bodies (Mapping[str, ...]): the stl filename of every component and
+            the component or its step file.
+            max_triangle_size (float, optional): replaces the default.
+            component (str, optional): the builder or part name the mesh policy
+            is looked up with, defaults to the first filename. The whole model
+            is meshed with one policy.
+            policy (MeshPolicy, optional): replaces the registered policy.
+
+        Raises:
+            ValueError: if a component has no volume.
+
+        Returns:
+            Dict[str, Any]: the import, fragment, mesh and write times, the
+            number of triangles in the model, whether they fit the triangle
+            budget and, in "files", the filename, triangle count, volume and,
+            when checking, the MeshReport of every stl file.
+        """
+
+        max_triangle_size = self.max_triangle_size if max_triangle_size is None \
+            else max_triangle_size
+        filenames = list(bodies)
+        if policy is None:
+            policy = policy_for(filenames[0] if component is None else component)
+
+        for name, value in self._defaults.items():
+            gmsh.option.setNumber(name, value)
+        gmsh.model.add("conformal")
+
+        with span("export_conformal", "export", bodies=len(filenames)):
+            tic = time.perf_counter()
+            inputs: List[List[Tuple[int, int]]] = []
+            with span("import", "export"):
+                for filename in filenames:
+                    dim_tags = [dim_tag for dim_tag in import_shape(bodies[filename],
+                                                                    transfer=self.transfer)
+                                if dim_tag[0] == 3]
+                    if not dim_tags:
+                        raise ValueError(f"{filename} has no volume to mesh.")
+                    inputs.append(dim_tags)
+            import_time = time.perf_counter() - tic
+
+            tic = time.perf_counter()
+            with span("fragment", "export"):
+                flat = [dim_tag for dim_tags in inputs for dim_tag in dim_tags]
+                _, fragments = gmsh.model.occ.fragment(flat[:1], flat[1:])
+                gmsh.model.occ.synchronize()
+            fragment_time = time.perf_counter() - tic
+
+            # fragments has the pieces of every input volume, in input order.
+            # A piece in several inputs lies in an overlap and goes to the first.
+            volumes: Dict[str, List[int]] = {filename: [] for filename in filenames}
+            owned = set()
+            position = 0
+            for filename, dim_tags in zip(filenames, inputs):
+                for pieces in fragments[position:position + len(dim_tags)]:
+                    for _, tag in pieces:
+                        if tag not in owned:
+                            owned.add(tag)
+                            volumes[filename].append(tag)
+                position += len(dim_tags)
+
+            apply_mesh_policy(policy, max_triangle_size, self.chamber, self.threads)
+
+            tic = time.perf_counter()
+            with span("generate", "export") as current:
+                gmsh.model.mesh.generate(2)
+                triangles = triangle_count()
+                current.set(triangles=triangles)
+            mesh_time = time.perf_counter() - tic
+            within_budget = check_triangle_budget(policy, triangles, filenames[0])
+
+            tic = time.perf_counter()
+            files: List[Dict[str, Any]] = []
+            with span("write", "export", binary=self.binary):
+                nodes, index = gmsh_nodes()
+                for filename in filenames:
+                    surface = gmsh_body_triangles(nodes, index, volumes[filename])
+                    writer = write_binary_stl if self.binary else write_ascii_stl
+                    files.append({"filename": filename,
+                                  "triangles": writer(filename, nodes, surface),
+                                  "volume": sum(gmsh.model.occ.getMass(3, tag)
+                                                for tag in volumes[filename])})
+            write_time = time.perf_counter() - tic
+
+        gmsh.model.remove()
+
+        if self.check:
+            for entry in files:
+                entry["check"] = check_written_stl(entry["filename"], bodies[entry["filename"]],
+                                                   entry["volume"]).as_dict()
+        return {"import_time": import_time, "fragment_time": fragment_time,
+                "mesh_time": mesh_time, "write_time": write_time, "triangles": triangles,
+                "within_budget": within_budget, "files": files}
@@ -0,0 +1,215 @@
+"""The STOK parameter dataclasses. This module only needs the standard
+library, so tools that handle parameters do not pay for importing cadquery
+and gmsh.
+
+The defaults are read from the bundled STOK_CONFIG when a dataclass is first
+created, so they are not class attributes anymore: ContainmentParameters.nr_layers
+is now defaults().nr_layers, or ContainmentParameters().nr_layers."""
+from dataclasses import dataclass, field
+from typing import Any, Mapping, Tuple, Union
+
+from .config import STOK_CONFIG, ConfigValues, config_from_mapping, load_config
+
+
+def _default(name: str):
+    """_default : Returns a default factory that reads a value from the
+    bundled STOK_CONFIG the first time a dataclass is created.
+
+    Args:
+        name (str): the name of the value in ConfigValues.
+    """
+    return field(default_factory=lambda: getattr(load_config(STOK_CONFIG), name))
+
+
+def defaults() -> ConfigValues:
+    """defaults : The default values of the parameter dataclasses, those
+    of the bundled STOK_CONFIG.
+
+    Returns:
+        ConfigValues: the values, with the limb radius as limb_radius.
+    """
+    return load_config(STOK_CONFIG)
+
+
+def layers_all() -> Tuple:
+    """layers_all : Returns a list of Layer objects.
+
+    Args:
+        args: float
+
+    Returns:
+        List[Layer]: returns a list of Layer objects.
+    """
+    return load_config(STOK_CONFIG).layers
+
+
+@dataclass(order=True, frozen=True)
+class ContainmentParameters:
+    """A class to store the parameters for the containment.
+
+    Args:
+        outer_radius: float
+        containment_height: float
+        nr_layers: int
+        layers: List[Layer]
+        distance_from_plasma: float
+    """
+    conf_path: str = STOK_CONFIG
+    outer_radius: float = _default("outer_radius")
+    containment_height: float = _default("containment_height")
+    nr_layers: int = _default("nr_layers")
+    distance_from_plasma: float = _default("distance_from_plasma")
+    layers: Tuple = field(default_factory=layers_all)
+
+
+@dataclass(order=True, frozen=True)
+class SolenoidParameters:
+    """Class that contains the parameters for the solenoid.
+
+    Args:
+        solenoid_radius: float
+        solenoid_height: float
+    """
+    solenoid_radius: float = _default("solenoid_radius")
+    solenoid_height: float = _default("solenoid_height")
+    bbox_thickness: float = _default("bbox_thickness")
+
+
+@dataclass(order=True, frozen=True)
+class PortParameters:
+    """Class that contains the parameters for the ports.
+
+    Args:
+        nr_ports: int
+        z_side: float
+        y_side: float
+    """
+    nr_ports: int = _default("nr_ports")
+    z_side: float = _default("z_side")
+    y_side: float = _default("y_side")
+
+
+@dataclass(order=True, frozen=True)
+class LimbDimensiones:
+    """Class that contains the dimensions for the limbs.
+
+    Args:
+        limb_length: float
+        limb_height: float
+        limb_width: float
+    """
+    limb_length: float
+    limb_width: float
+    limb_height: float
+
+
+def limb_dimensions_default() -> LimbDimensiones:
+    """limb_dimensions_default : Returns the limb dimensions
+    from the bundled STOK_CONFIG.
+
+    Returns:
+        LimbDimensiones: the limb dimensions.
+    """
+    values = load_config(STOK_CONFIG)
+    return LimbDimensiones(values.limb_length, values.limb_width, values.resolved_limb_height)
+
+
+@dataclass(order=True, frozen=True)
+class LimbParameters:
+    """Class that contains the parameters for the limbs.
+
+    Args:
+        nr_limbs: int
+        limb_radius: float -> at what radius the limbs are placed.
+        sphere_radius: float -> the radius of the spheres next to the limb.
+    """
+    nr_limbs: int = _default("nr_limbs")
+    limb_radius: float = _default("limb_radius")
+    sphere_radius: float = _default("sphere_radius")
+    limb_dimensions: LimbDimensiones = field(default_factory=limb_dimensions_default)
+
+
+@dataclass(order=True, frozen=True)
+class LimiterParameters:
+    """Class that contains the parameters for the limiter.
+
+    Attributes:
+        firstwall_thickness: float
+        limiter_gap: float
+        limiter_thickness: float
+    """
+    firstwall_thickness: float = _default("firstwall_thickness")
+    limiter_gap: float = _default("limiter_gap")
+    limiter_thickness: float = _default("limiter_thickness")
+
+
+@dataclass(order=True, frozen=True)
+class DivertorParameters:
+    """A class that contains the parameters for the divertor.
+
+    Attributes:
+        divertor_thickness: float
+        divertor_gap: float or bool
+        divertor_firstwall_thickness: float
+        TODO: divertor_shape: float
+    """
+    divertor_firstwall_thickness: float = _default("divertor_firstwall_thickness")
+    divertor_width: float = _default("divertor_width")
+    divertor_gap: float = _default("divertor_gap")
+    divertor_thickness: float = _default("divertor_thickness")
+    # divertor_shape: float = FileReader( TODO: add shape to divertor.
+    #     STOK_CONFIG).read[ContainmentParameters.nr_layers*2+22]
+
+
+def parameters_from_config(source: Union[str, Mapping[str, Any], ConfigValues, None] = None,
+                           **overrides: Any) -> Tuple:
+    """parameters_from_config : Creates the tuple of parameter dataclasses
+    that STOK expects from a configuration file, a mapping or ConfigValues,
+    without touching the module level STOK_CONFIG.
+
+    Args:
+        source (str, Mapping, ConfigValues, optional): a configuration file path,
+        a mapping with the ConfigValues names or already loaded values. Defaults
+        to the bundled STOK_CONFIG.
+        overrides: single values to change, with the ConfigValues names.
+
+    Returns:
+        Tuple: ContainmentParameters, SolenoidParameters, PortParameters,
+        LimbParameters, LimiterParameters and DivertorParameters in that order.
+    """
+
+    if source is None or isinstance(source, str):
+        values = load_config(source)
+    elif isinstance(source, ConfigValues):
+        values = source
+    else:
+        values = config_from_mapping(source)
+
+    if overrides:
+        values = config_from_mapping(overrides, base=values)
+
+    return (ContainmentParameters(conf_path=values.conf_path,
+                                  outer_radius=values.outer_radius,
+                                  containment_height=values.containment_height,
+                                  nr_layers=values.nr_layers,
+                                  distance_from_plasma=values.distance_from_plasma,
+                                  layers=values.layers),
+            SolenoidParameters(solenoid_radius=values.solenoid_radius,
+                               solenoid_height=values.solenoid_height,
+                               bbox_thickness=values.bbox_thickness),
+            PortParameters(nr_ports=values.nr_ports,
+                           z_side=values.z_side,
+                           y_side=values.y_side),
+            LimbParameters(nr_limbs=values.nr_limbs,
+                           limb_radius=values.limb_radius,
+                           sphere_radius=values.sphere_radius,
+                           limb_dimensions=LimbDimensiones(values.limb_length,
+                                                           values.limb_width,
+                                                           values.resolved_limb_height)),
+            LimiterParameters(firstwall_thickness=values.firstwall_thickness,
+                              limiter_gap=values.limiter_gap,
+                              limiter_thickness=values.limiter_thickness),
+            DivertorParameters(divertor_firstwall_thickness=values.divertor_firstwall_thickness,
+                               divertor_width=values.divertor_width,
+                               divertor_gap=values.divertor_gap,
+                               divertor_thickness=values.divertor_thickness))
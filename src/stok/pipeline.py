@@ -0,0 +1,324 @@
+"""Builds and meshes the components of one reactor concurrently. Every
+builder call is a node of a dependency graph, e.g. the containment with
+ports and divertor needs the containment cutter and the layers, and the
+cutter needs the port openings and the divertor cutter. Independent builds
+and the meshing of finished parts run side by side in worker processes,
+since neither gmsh nor OCC is thread safe, within a budget of cores. The
+solids are handed between the workers through an on-disk geometry cache,
+and every stl file is reported as soon as it is written.
+
+Example:
+    for report in export_pipelined(parameters_from_config(), components,
+                                   "out", 200, cores=32):
+        print(report["filename"], report["triangles"])
+"""
+import multiprocessing
+import os
+import tempfile
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+# The STOK builders in a reactor export.
+DEFAULT_COMPONENTS = ("containment_with_divertor_and_ports", "transformer_limbs",
+                      "limiter_firstwall", "limiter_backwall", "divertor_firstwall",
+                      "divertor_backwall", "central_solenoid", "bounding_box")
+
+# A RAM backed directory for the shared geometry cache, when there is one.
+_SHM_DIR = "/dev/shm" if os.path.isdir("/dev/shm") else None
+
+
+@dataclass(frozen=True)
+class Node:
+    """A call of a STOK builder.
+
+    Args:
+        builder: str -> the name of the builder method.
+        args: Tuple -> the positional arguments.
+        kwargs: Tuple[Tuple[str, Any], ...] -> the keyword arguments, as pairs.
+        The arguments are passed exactly like the builders call each other,
+        so the geometry cache keys match.
+    """
+    builder: str
+    args: Tuple = ()
+    kwargs: Tuple[Tuple[str, Any], ...] = ()
+
+    def __str__(self) -> str:
+        arguments = [repr(arg) for arg in self.args] + \
+            [f"{name}={value!r}" for name, value in self.kwargs]
+        return f"{self.builder}({', '.join(arguments)})"
+
+    def call(self, reactor) -> Any:
+        """call : Runs the builder.
+
+        Args:
+            reactor (STOK): the reactor.
+
+        Returns:
+            Any: what the builder returned.
+        """
+        return getattr(reactor, self.builder)(*self.args, **dict(self.kwargs))
+
+
+def _layers(param_tup: Tuple, node: Node) -> List[Node]:
+    """_layers : The containment layers, see STOK.containment."""
+    del node
+    return [Node("containment_layer", (i,)) for i in range(param_tup[0].nr_layers)]
+
+
+def _cut(ports: bool, divertor: bool) -> Callable[[Tuple, Node], List[Node]]:
+    """_cut : The cutter and the layers of a cut containment, see STOK.cut_containment."""
+    def dependencies(param_tup: Tuple, node: Node) -> List[Node]:
+        return [Node("containment_cutter", kwargs=(("ports", ports), ("divertor", divertor)))] + \
+            _layers(param_tup, node)
+    return dependencies
+
+
+def _cutter(param_tup: Tuple, node: Node) -> List[Node]:
+    """_cutter : The tools of the containment cutter, see STOK.containment_cutter."""
+    del param_tup
+    kwargs = dict(node.kwargs)
+    return [Node("openings")]*bool(kwargs["ports"]) + \
+        [Node("divertor_cutter")]*bool(kwargs["divertor"])
+
+
+# The cached builders every builder calls, as a function of the parameters
+# and the call. Building them in their own nodes lets independent ones run
+# side by side, the dependent builder then finds them in the cache. A missing
+# entry only costs parallelism, the builder still builds what it needs.
+DEPENDENCIES: Dict[str, Callable[[Tuple, Node], List[Node]]] = {
+    "openings": lambda param_tup, node: [Node("opening", kwargs=(("gap", 0),))],
+    "limiter_firstwall_openings": lambda param_tup, node: [
+        Node("opening", kwargs=(("gap", param_tup[4].limiter_gap),))],
+    "limiter_firstwall": lambda param_tup, node: [Node("limiter_firstwall_openings")],
+    "limiter_backwall": lambda param_tup, node: [Node("limiter_firstwall_openings")],
+    "containment": _layers,
+    "containment_with_ports": _cut(True, False),
+    "containment_with_divertor": _cut(False, True),
+    "containment_with_divertor_and_ports": _cut(True, True),
+    "containment_cutter": _cutter,
+    "transformer_limbs": lambda param_tup, node: [Node("transformer_limb")],
+}
+
+
+def dependency_graph(param_tup: Tuple, components: Sequence[str]) -> Dict[Node, Tuple[Node, ...]]:
+    """dependency_graph : The builder calls needed for the components.
+
+    Args:
+        param_tup (Tuple): the parameters, as passed to STOK.
+        components (Sequence[str]): the builders to export.
+
+    Returns:
+        Dict[Node, Tuple[Node, ...]]: the dependencies of every node, with
+        every dependency before its dependents.
+    """
+
+    graph: Dict[Node, Tuple[Node, ...]] = {}
+
+    def visit(node: Node) -> None:
+        if node in graph:
+            return
+        dependencies = tuple(DEPENDENCIES.get(node.builder, lambda *_: [])(param_tup, node))
+        for dependency in dependencies:
+            visit(dependency)
+        graph[node] = dependencies
+
+    for component in components:
+        visit(Node(component))
+    return graph
+
+
+# The reactor of a worker process, kept between tasks so the in-memory
+# geometry cache is reused.
+_WORKER: Dict[str, Any] = {}
+
+
+def _worker_reactor(param_tup: Tuple, sector, cache_dir: str):
+    """_worker_reactor : The reactor of the current worker process."""
+
+    # Imported here so the coordinating process never loads cadquery or gmsh.
+    from .geometry_cache import GeometryCache  # pylint: disable=import-outside-toplevel
+    from .stok_modules import STOK  # pylint: disable=import-outside-toplevel
+
+    key = (param_tup, sector, cache_dir)
+    if _WORKER.get("key") != key:
+        _WORKER["key"] = key
+        _WORKER["reactor"] = STOK(param_tup, geometry_cache=GeometryCache(cache_dir),
+                                  sector=sector)
+    return _WORKER["reactor"]
+
+
+def _build_task(param_tup: Tuple, sector, cache_dir: str, node: Node, component: bool,
+                directory: str, mesh: Dict[str, Any]) -> Dict[str, Any]:
+    """_build_task : Runs a builder in a worker process, the solids end up in
+    the shared geometry cache. Components that are not cached, and so cannot
+    be handed to other workers, are meshed right away.
+
+    Returns:
+        Dict[str, Any]: the build time, the part names of components and the
+        reports of the parts meshed here.
+    """
+
+    from .stok_modules import named_parts  # pylint: disable=import-outside-toplevel
+
+    reactor = _worker_reactor(param_tup, sector, cache_dir)
+    tic = time.perf_counter()
+    result = node.call(reactor)
+    outcome: Dict[str, Any] = {"build_time": time.perf_counter() - tic, "parts": [],
+                               "reports": []}
+    if not component:
+        return outcome
+
+    parts = named_parts(node.builder, result)
+    outcome["parts"] = [name for name, _ in parts]
+    if not hasattr(getattr(type(reactor), node.builder), "cache_parameters"):
+        outcome["reports"] = [_mesh(reactor, node, part, os.path.join(directory, name + ".stl"),
+                                    dict(mesh, threads=1))
+                              for name, part in parts]
+    return outcome
+
+
+def _mesh_task(param_tup: Tuple, sector, cache_dir: str, node: Node, index: int,
+               filename: str, mesh: Dict[str, Any]) -> Dict[str, Any]:
+    """_mesh_task : Meshes one part of a component in a worker process, the
+    component is taken from the shared geometry cache.
+
+    Returns:
+        Dict[str, Any]: the report of the part.
+    """
+
+    from .stok_modules import named_parts  # pylint: disable=import-outside-toplevel
+
+    reactor = _worker_reactor(param_tup, sector, cache_dir)
+    _, part = named_parts(node.builder, node.call(reactor))[index]
+    return _mesh(reactor, node, part, filename, mesh)
+
+
+def _mesh(reactor, node: Node, part: Any, filename: str, mesh: Dict[str, Any]) -> Dict[str, Any]:
+    """_mesh : Meshes a part with the policy of its component."""
+
+    from .meshing import BatchExporter  # pylint: disable=import-outside-toplevel
+
+    with BatchExporter(mesh["max_triangle_size"], None, binary=mesh["binary"],
+                       chamber=reactor.chamber, check=mesh["check"],
+                       threads=mesh["threads"]) as exporter:
+        report = exporter.export(part, filename, component=node.builder)
+    report["component"] = node.builder
+    return report
+
+
+def export_pipelined(param_tup: Tuple,
+                     components: Sequence[str],
+                     directory: str,
+                     max_triangle_size: float,
+                     cores: Optional[int] = None,
+                     mesh_threads: Optional[int] = None,
+                     binary: bool = False,
+                     check: bool = False,
+                     sector=None,
+                     cache_dir: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+    """export_pipelined : Builds and meshes the components over a process pool
+    and yields the report of every stl file as soon as it is written. Builds
+    take one core and meshes mesh_threads cores, tasks are only started while
+    they fit in the budget. Meshing finished parts goes before new builds, so
+    files keep coming out while the slow booleans run.
+
+    Args:
+        param_tup (Tuple): the parameters, as passed to STOK.
+        components (Sequence[str]): the STOK builders to export.
+        directory (str): where the stl files are written, one per part.
+        max_triangle_size (float): the maximum size of the side of a triangle.
+        cores (int, optional): the core budget, defaults to the cpu count.
+        mesh_threads (int, optional): the gmsh threads of every mesh task,
+        defaults to a quarter of the budget.
+        binary (bool): write binary stl files.
+        check (bool): check that every stl file is watertight.
+        sector (Sector, optional): only export this sector, see STOK.sector_view.
+        cache_dir (str, optional): the geometry cache directory shared by the
+        workers, defaults to a temporary directory removed at the end.
+
+    Raises:
+        Exception: whatever a builder or the meshing raised, the pending
+        tasks are cancelled.
+
+    Yields:
+        Dict[str, Any]: the report of every stl file, see
+        stok.meshing.BatchExporter.export, with its component, the build time
+        of the component and the time since the start in "elapsed".
+    """
+
+    cores = max(1, os.cpu_count() or 1) if cores is None else max(1, cores)
+    mesh_threads = min(cores, max(1, cores//4) if mesh_threads is None else mesh_threads)
+    mesh = {"max_triangle_size": max_triangle_size, "binary": binary, "check": check,
+            "threads": mesh_threads}
+    os.makedirs(directory, exist_ok=True)
+
+    graph = dependency_graph(param_tup, components)
+    wanted = {Node(component) for component in components}
+    waiting = {node: set(dependencies) for node, dependencies in graph.items()}
+    dependents: Dict[Node, List[Node]] = {node: [] for node in graph}
+    for node, dependencies in graph.items():
+        for dependency in dependencies:
+            dependents[dependency].append(node)
+
+    # Tasks are (cores, function, arguments, node), mesh tasks are kept first.
+    builds = [node for node in graph if not waiting[node]]
+    meshes: List[Tuple[int, Callable, Tuple, Node]] = []
+    build_times: Dict[Node, float] = {}
+
+    start = time.perf_counter()
+    temporary = tempfile.TemporaryDirectory(prefix="stok_pipeline_", dir=_SHM_DIR) \
+        if cache_dir is None else None
+    shared = (param_tup, sector, cache_dir if temporary is None else temporary.name)
+
+    # gmsh and OCC do not like being forked, so the workers are spawned.
+    with ProcessPoolExecutor(max_workers=cores,
+                             mp_context=multiprocessing.get_context("spawn")) as executor:
+        running: Dict[Future, Tuple[int, Node, str]] = {}
+        used = 0
+        try:
+            while builds or meshes or running:
+                # Start what fits, a task larger than the budget runs alone.
+                while meshes and (used + meshes[0][0] <= cores or not running):
+                    task_cores, function, arguments, node = meshes.pop(0)
+                    running[executor.submit(function, *shared, *arguments)] = \
+                        (task_cores, node, "mesh")
+                    used += task_cores
+                while builds and (used + 1 <= cores or not running):
+                    node = builds.pop(0)
+                    running[executor.submit(_build_task, *shared, node, node in wanted,
+                                            directory, mesh)] = (1, node, "build")
+                    used += 1
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    task_cores, node, kind = running.pop(future)
+                    used -= task_cores
+                    outcome = future.result()
+
+                    if kind == "mesh":
+                        yield dict(outcome, build_time=build_times[node],
+                                   elapsed=time.perf_counter() - start)
+                        continue
+
+                    build_times[node] = outcome["build_time"]
+                    for dependent in dependents[node]:
+                        waiting[dependent].discard(node)
+                        if not waiting[dependent]:
+                            builds.append(dependent)
+                    for report in outcome["reports"]:
+                        yield dict(report, build_time=build_times[node],
+                                   elapsed=time.perf_counter() - start)
+                    if not outcome["reports"]:
+                        meshes.extend((mesh_threads, _mesh_task,
+                                       (node, index, os.path.join(directory, name + ".stl"),
+                                        mesh), node)
+                                      for index, name in enumerate(outcome["parts"]))
+        finally:
+            # Also when the caller stops early or a task failed.
+            for future in running:
+                future.cancel()
+            executor.shutdown(wait=True)
+            if temporary is not None:
+                temporary.cleanup()
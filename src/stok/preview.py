@@ -0,0 +1,558 @@
+"""A quick, coarse preview of a whole STOK reactor without CAD, for checking
+that parts do not collide while tuning the parameters. Every component is
+described by a few analytic parts: rectangular rings around the Z axis for
+the containment layers, the solenoid, the plasma source and the divertor,
+boxes for the transformer limbs and the limiter walls, and spheres. Their
+dimensions are those of stok.classify, so they follow the arithmetic of the
+STOK builders. The port openings are left out, the limiter walls are the
+boxes around them.
+
+The preview gives the r-z cross-sections of the components, the collisions
+between them and coarse polygon meshes, which can be written as stl files.
+Like stok.classify, this module only needs NumPy."""
+import math
+import os
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple, Union
+
+import numpy as np
+
+from .classify import PointClassifier
+from .stl import write_ascii_stl, write_binary_stl
+
+# The number of segments of a full circle in the meshes and sections.
+DEFAULT_SEGMENTS = 64
+
+# Overlaps up to this depth in mm are contacts, not collisions.
+DEFAULT_TOLERANCE = 1e-6
+
+Rectangle = Tuple[float, float, float, float]
+
+
+@dataclass(frozen=True)
+class Ring:
+    """A rectangular ring around the Z axis.
+
+    Args:
+        inner_r: float
+        outer_r: float
+        bottom: float
+        top: float
+    """
+    inner_r: float
+    outer_r: float
+    bottom: float
+    top: float
+
+    @property
+    def volume(self) -> float:
+        """volume : The volume of the ring."""
+        return math.pi*(self.outer_r**2 - self.inner_r**2)*(self.top - self.bottom)
+
+    def section(self) -> Rectangle:
+        """section : The r-z rectangle of the ring."""
+        return self.inner_r, self.outer_r, self.bottom, self.top
+
+
+@dataclass(frozen=True)
+class Box:
+    """A box standing on the XY plane, turned around the Z axis.
+
+    Args:
+        center: Tuple[float, float, float]
+        half: Tuple[float, float, float] -> half of the sides, along the
+        turned X and Y axes and Z.
+        angle: float -> the angle of the turned X axis in degrees.
+        radial: Tuple[float, float], optional -> the box is also cut to
+        these radii, like the limiter walls.
+    """
+    center: Tuple[float, float, float]
+    half: Tuple[float, float, float]
+    angle: float
+    radial: Optional[Tuple[float, float]] = None
+
+    @property
+    def volume(self) -> float:
+        """volume : The volume of the box, without the radial cut."""
+        return 8*self.half[0]*self.half[1]*self.half[2]
+
+    def corners(self) -> np.ndarray:
+        """corners : The corners in XY, shape (4, 2), counterclockwise."""
+        signs = np.array([[-1, -1], [1, -1], [1, 1], [-1, 1]], dtype=np.float64)
+        local = signs*self.half[:2]
+        cos, sin = math.cos(math.radians(self.angle)), math.sin(math.radians(self.angle))
+        return local @ np.array([[cos, sin], [-sin, cos]]) + self.center[:2]
+
+    def to_local(self, point: np.ndarray) -> np.ndarray:
+        """to_local : The coordinates of points along the sides of the box,
+        relative to its center."""
+        cos, sin = math.cos(math.radians(self.angle)), math.sin(math.radians(self.angle))
+        offset = np.asarray(point, dtype=np.float64) - self.center
+        return np.stack([offset[..., 0]*cos + offset[..., 1]*sin,
+                         offset[..., 1]*cos - offset[..., 0]*sin, offset[..., 2]], axis=-1)
+
+    def section(self) -> Rectangle:
+        """section : The r-z rectangle the box covers when turned around the Z axis."""
+        nearest = self.to_local(np.zeros(3))[:2]
+        nearest -= np.clip(nearest, -np.array(self.half[:2]), self.half[:2])
+        inner_r = float(np.hypot(*nearest))
+        outer_r = float(np.max(np.hypot(*self.corners().T)))
+        if self.radial is not None:
+            inner_r, outer_r = max(inner_r, self.radial[0]), min(outer_r, self.radial[1])
+        return (inner_r, outer_r, self.center[2] - self.half[2],
+                self.center[2] + self.half[2])
+
+
+@dataclass(frozen=True)
+class Sphere:
+    """A sphere.
+
+    Args:
+        center: Tuple[float, float, float]
+        radius: float
+    """
+    center: Tuple[float, float, float]
+    radius: float
+
+    @property
+    def volume(self) -> float:
+        """volume : The volume of the sphere."""
+        return 4/3*math.pi*self.radius**3
+
+    def section(self) -> Rectangle:
+        """section : The r-z rectangle around the sphere turned around the Z axis."""
+        r = math.hypot(*self.center[:2])
+        return (max(r - self.radius, 0.0), r + self.radius,
+                self.center[2] - self.radius, self.center[2] + self.radius)
+
+
+Part = Union[Ring, Box, Sphere]
+
+
+@dataclass(frozen=True)
+class Collision:
+    """Two components that overlap.
+
+    Args:
+        first: str
+        second: str
+        depth: float -> how far they overlap in mm, the largest of all their
+        parts. For the bounding box, how far the first component reaches
+        out of the space inside it.
+    """
+    first: str
+    second: str
+    depth: float
+
+
+def _subtract(rectangle: Rectangle, hole: Rectangle) -> List[Rectangle]:
+    """_subtract : Cuts a hole out of an r-z rectangle, the rest is split
+    into at most four rectangles."""
+    r0, r1, z0, z1 = rectangle
+    h_r0, h_r1, h_z0, h_z1 = hole
+    if min(r1, h_r1) <= max(r0, h_r0) or min(z1, h_z1) <= max(z0, h_z0):
+        return [rectangle]
+    middle_r0, middle_r1 = max(r0, h_r0), min(r1, h_r1)
+    pieces = [(r0, middle_r0, z0, z1), (middle_r1, r1, z0, z1),
+              (middle_r0, middle_r1, z0, max(z0, h_z0)), (middle_r0, middle_r1, min(z1, h_z1), z1)]
+    return [piece for piece in pieces if piece[1] > piece[0] and piece[3] > piece[2]]
+
+
+def _rectangle_depth(first: Rectangle, second: Rectangle) -> float:
+    """_rectangle_depth : How far two rectangles overlap, negative if apart."""
+    return min(min(first[1], second[1]) - max(first[0], second[0]),
+               min(first[3], second[3]) - max(first[2], second[2]))
+
+
+def _point_depth(point: Tuple[float, float], radius: float, rectangle: Rectangle) -> float:
+    """_point_depth : How far a circle reaches into a rectangle, in 2D."""
+    r, z = point
+    r0, r1, z0, z1 = rectangle
+    outside = math.hypot(max(r0 - r, 0.0, r - r1), max(z0 - z, 0.0, z - z1))
+    if outside > 0:
+        return radius - outside
+    return radius + min(r - r0, r1 - r, z - z0, z1 - z)
+
+
+def _box_overlap(first: Box, second: Box) -> float:
+    """_box_overlap : How far two boxes overlap, with the separating axes
+    of their sides in XY and the Z axis."""
+    corners = (first.corners(), second.corners())
+    depth = min(first.center[2] + first.half[2], second.center[2] + second.half[2]) - \
+        max(first.center[2] - first.half[2], second.center[2] - second.half[2])
+    for box in (first, second):
+        angle = math.radians(box.angle)
+        for axis in (np.array([math.cos(angle), math.sin(angle)]),
+                     np.array([-math.sin(angle), math.cos(angle)])):
+            first_span, second_span = corners[0] @ axis, corners[1] @ axis
+            depth = min(depth, min(first_span.max(), second_span.max()) -
+                        max(first_span.min(), second_span.min()))
+    return depth
+
+
+def _depth(first: Part, second: Part) -> float:
+    """_depth : How far two parts overlap, negative if they are apart. A
+    point is as far from a ring as its r and z are from the ring section,
+    which makes the tests with rings exact. Boxes cut to radii are tested
+    as boxes, unless both are cut in the same frame."""
+
+    if isinstance(second, Ring) and not isinstance(first, Ring):
+        first, second = second, first
+    if isinstance(second, Box) and isinstance(first, Sphere):
+        first, second = second, first
+
+    if isinstance(first, Ring):
+        if isinstance(second, Sphere):
+            return _point_depth((math.hypot(*second.center[:2]), second.center[2]),
+                                second.radius, first.section())
+        return _rectangle_depth(first.section(), second.section())
+
+    if isinstance(first, Box) and isinstance(second, Box):
+        if first.radial is not None and second.radial is not None and \
+                first.angle == second.angle and first.half[1] == second.half[1]:
+            return _rectangle_depth(first.section(), second.section())
+        return _box_overlap(first, second)
+
+    if isinstance(first, Box):
+        local = first.to_local(second.center)
+        outside = np.abs(local) - first.half
+        if np.any(outside > 0):
+            return second.radius - float(np.linalg.norm(np.maximum(outside, 0.0)))
+        return second.radius - float(np.max(outside))
+
+    return first.radius + second.radius - math.dist(first.center, second.center)
+
+
+def _extent(part: Part) -> np.ndarray:
+    """_extent : The largest |x|, |y| and z and the smallest z of a part."""
+    if isinstance(part, Ring):
+        return np.array([part.outer_r, part.outer_r, part.top, -part.bottom])
+    if isinstance(part, Box):
+        corners = np.abs(part.corners())
+        return np.array([corners[:, 0].max(), corners[:, 1].max(),
+                         part.center[2] + part.half[2], part.half[2] - part.center[2]])
+    return np.array([abs(part.center[0]) + part.radius, abs(part.center[1]) + part.radius,
+                     part.center[2] + part.radius, part.radius - part.center[2]])
+
+
+def _outlines(rectangles: List[Rectangle]) -> List[np.ndarray]:
+    """_outlines : The boundary loops of the union of r-z rectangles, with
+    the inside on the left, so outer loops run counterclockwise and holes
+    clockwise. Touching rectangles share their edges, so the loops have no
+    T-junctions, and points along straight sides are left out."""
+    rs = np.unique([value for r0, r1, _, _ in rectangles for value in (r0, r1)])
+    zs = np.unique([value for _, _, z0, z1 in rectangles for value in (z0, z1)])
+    # The cells of the grid the rectangle sides make, padded by empty cells.
+    inside = np.zeros((len(rs) + 1, len(zs) + 1), dtype=bool)
+    for r0, r1, z0, z1 in rectangles:
+        if r1 > r0 and z1 > z0:
+            inside[np.searchsorted(rs, r0) + 1:np.searchsorted(rs, r1) + 1,
+                   np.searchsorted(zs, z0) + 1:np.searchsorted(zs, z1) + 1] = True
+
+    # Every cell side between a full and an empty cell, as grid points.
+    edges: Dict[Tuple[int, int], List[Tuple[int, int]]] = {}
+    for i, j in zip(*np.nonzero(inside)):
+        i, j = int(i) - 1, int(j) - 1
+        for (di, dj), start, end in (((0, -1), (i, j), (i + 1, j)),
+                                      ((1, 0), (i + 1, j), (i + 1, j + 1)),
+                                      ((0, 1), (i + 1, j + 1), (i, j + 1)),
+                                      ((-1, 0), (i, j + 1), (i, j))):
+            if not inside[i + 1 + di, j + 1 + dj]:
+                edges.setdefault(start, []).append(end)
+
+    loops = []
+    while edges:
+        start = next(iter(edges))
+        points = [start]
+        while True:
+            ends = edges[points[-1]]
+            end = ends.pop()
+            if not ends:
+                del edges[points[-1]]
+            if end == start:
+                break
+            points.append(end)
+        loop = np.array([[rs[i], zs[j]] for i, j in points])
+        before, after = loop - np.roll(loop, 1, axis=0), np.roll(loop, -1, axis=0) - loop
+        turn = before[:, 0]*after[:, 1] - before[:, 1]*after[:, 0]
+        loops.append(loop[turn != 0])
+    return loops
+
+
+def _revolve(loop: np.ndarray, segments: int) -> Tuple[np.ndarray, np.ndarray]:
+    """_revolve : The mesh of an r-z loop turned around the Z axis, see
+    _outlines. Faces on the axis, of a ring without a hole, have no area."""
+    size = len(loop)
+    angles = np.linspace(0, 2*math.pi, segments, endpoint=False)
+    nodes = np.stack([np.outer(np.cos(angles), loop[:, 0]),
+                      np.outer(np.sin(angles), loop[:, 0]),
+                      np.broadcast_to(loop[:, 1], (segments, size))], axis=-1).reshape(-1, 3)
+
+    k, j = np.meshgrid(np.arange(segments), np.arange(size), indexing="ij")
+    k, j = k.ravel(), j.ravel()
+    a, b = k*size + j, k*size + (j + 1) % size
+    c, d = (k + 1) % segments*size + (j + 1) % size, (k + 1) % segments*size + j
+    triangles = np.concatenate([np.stack([a, d, c], axis=1), np.stack([a, c, b], axis=1)])
+    return nodes, triangles
+
+
+def _box_mesh(box: Box) -> Tuple[np.ndarray, np.ndarray]:
+    """_box_mesh : The 12 triangles of a box."""
+    corners = box.corners()
+    nodes = np.concatenate([np.column_stack([corners, np.full(4, box.center[2] - box.half[2])]),
+                            np.column_stack([corners, np.full(4, box.center[2] + box.half[2])])])
+    triangles = np.array([[0, 2, 1], [0, 3, 2], [4, 5, 6], [4, 6, 7],
+                          [0, 1, 5], [0, 5, 4], [1, 2, 6], [1, 6, 5],
+                          [2, 3, 7], [2, 7, 6], [3, 0, 4], [3, 4, 7]])
+    return nodes, triangles
+
+
+def _sphere_mesh(sphere: Sphere, segments: int) -> Tuple[np.ndarray, np.ndarray]:
+    """_sphere_mesh : A latitude and longitude mesh of a sphere."""
+    rows = max(segments//2, 2)
+    polar = np.linspace(0, math.pi, rows + 1)
+    angles = np.linspace(0, 2*math.pi, segments, endpoint=False)
+    nodes = np.stack([np.outer(np.sin(polar), np.cos(angles)),
+                      np.outer(np.sin(polar), np.sin(angles)),
+                      np.outer(np.cos(polar), np.ones(segments))],
+                     axis=-1).reshape(-1, 3)*sphere.radius + sphere.center
+
+    i, k = np.meshgrid(np.arange(rows), np.arange(segments), indexing="ij")
+    i, k = i.ravel(), k.ravel()
+    a, b = i*segments + k, i*segments + (k + 1) % segments
+    c, d = b + segments, a + segments
+    triangles = np.concatenate([np.stack([a, d, c], axis=1), np.stack([a, c, b], axis=1)])
+    return nodes, triangles
+
+
+def _merge(meshes: List[Tuple[np.ndarray, np.ndarray]]) -> Tuple[np.ndarray, np.ndarray]:
+    """_merge : Joins meshes into one and drops the triangles without area."""
+    offsets = np.cumsum([0] + [len(nodes) for nodes, _ in meshes[:-1]])
+    nodes = np.concatenate([nodes for nodes, _ in meshes])
+    triangles = np.concatenate([triangles + offset
+                                for (_, triangles), offset in zip(meshes, offsets)])
+    vertices = nodes[triangles]
+    area = np.linalg.norm(np.cross(vertices[:, 1] - vertices[:, 0],
+                                   vertices[:, 2] - vertices[:, 0]), axis=1)
+    return nodes, triangles[area > 1e-9*max(float(np.max(area, initial=0.0)), 1.0)]
+
+
+@dataclass(frozen=True)
+class Preview:
+    """The analytic parts of every component, see the module.
+
+    Args:
+        parts: Dict[str, Tuple[Part, ...]] -> the parts of every component,
+        the containment layers are named containment_0, containment_1, ...
+        like the stl files of the containment builders.
+        bbox_outer: Tuple[float, float, float] -> the sides of the bounding box.
+        bbox_inner: Tuple[float, float, float] -> the sides of the space inside it.
+        ports: bool -> the containment has port openings, the limiter walls
+        sit in them.
+    """
+    parts: Dict[str, Tuple[Part, ...]]
+    bbox_outer: Tuple[float, float, float]
+    bbox_inner: Tuple[float, float, float]
+    ports: bool = True
+
+    @classmethod
+    def from_classifier(cls, classifier: PointClassifier) -> "Preview":
+        """from_classifier : The parts of the components of a point
+        classifier, which has the dimensions of the STOK builders.
+
+        Args:
+            classifier (PointClassifier): the classifier, its sector is ignored.
+
+        Returns:
+            Preview: the preview.
+        """
+
+        c = classifier
+        table = c.table
+        slot = (c.divertor_r[0], c.divertor_r[1], -c.solenoid_height, 0.0)
+        parts: Dict[str, Tuple[Part, ...]] = {}
+        for i in range(table.nr_layers):
+            pieces = _subtract((table.inner_r[i], table.outer_r[i],
+                                -table.height[i]/2, table.height[i]/2),
+                               (table.hole_inner_r[i], table.hole_outer_r[i],
+                                -table.hole_height[i]/2, table.hole_height[i]/2))
+            if c.divertor:
+                pieces = [piece for whole in pieces for piece in _subtract(whole, slot)]
+            parts[f"containment_{i}"] = tuple(Ring(*(float(value) for value in piece))
+                                              for piece in pieces)
+
+        parts["divertor_firstwall"] = (Ring(c.divertor_r[2], c.divertor_r[3],
+                                            c.divertor_z[1], c.divertor_z[0]),)
+        parts["divertor_backwall"] = (Ring(c.divertor_r[2], c.divertor_r[3],
+                                           c.divertor_z[2], c.divertor_z[1]),)
+        parts["central_solenoid"] = (Ring(0.0, c.solenoid_radius, -c.solenoid_height/2,
+                                          c.solenoid_height/2),)
+        parts["plasma_source"] = (Ring(c.plasma[0], c.plasma[1], -c.plasma[2]/2,
+                                       c.plasma[2]/2),)
+
+        # The limiter walls lie in the port openings, between two radii.
+        u_min = c.containment_radius - 1.4*c.port_depth
+        u_max = c.containment_radius + 0.1*c.port_depth
+        half_v = (c.port_y_side - c.limiter_gap)/2
+        half_z = min(c.port_z_side - c.limiter_gap, c.solenoid_height)/2
+        port_angles = [180.0 - i*360/c.nr_ports for i in range(c.nr_ports)]
+        for name, (inner_r, outer_r) in (("limiter_firstwall", c.limiter_r[:2]),
+                                         ("limiter_backwall", c.limiter_r[1:])):
+            low = max(u_min, math.sqrt(max(inner_r**2 - half_v**2, 0.0)))
+            high = min(u_max, outer_r)
+            parts[name] = tuple(Box(_turn((low + high)/2, 0.0, angle), ((high - low)/2,
+                                    half_v, half_z), angle, (inner_r, outer_r))
+                                for angle in port_angles)
+
+        length, width, height = c.limb_size
+        limb_angles = [-22.5 + i*360/c.nr_limbs for i in range(c.nr_limbs)]
+        parts["transformer_limbs"] = tuple(
+            Box(_turn(c.limb_radius, 0.0, angle), (length/2, width/2, height/2), angle)
+            for angle in limb_angles)
+        parts["sphere_pair_array"] = tuple(
+            Sphere(_turn(c.limb_radius, side*c.sphere_offset, angle), c.sphere_radius)
+            for angle in limb_angles for side in (-1, 1))
+
+        return cls(parts=parts, bbox_outer=c.bbox_outer, bbox_inner=c.bbox_inner,
+                   ports=c.ports)
+
+    @classmethod
+    def from_parameters(cls, param_tup: Tuple, ports: bool = True,
+                        divertor: bool = True) -> "Preview":
+        """from_parameters : The preview of a reactor.
+
+        Args:
+            param_tup (Tuple): the parameters, as passed to STOK.
+            ports (bool): the containment has port openings.
+            divertor (bool): the containment has the divertor slot.
+
+        Returns:
+            Preview: the preview.
+        """
+        return cls.from_classifier(PointClassifier.from_parameters(param_tup, ports, divertor))
+
+    def sections(self, segments: int = DEFAULT_SEGMENTS) -> Dict[str, List[np.ndarray]]:
+        """sections : The r-z cross-sections of the components, as closed
+        polygons. Rings give their section, boxes and spheres the region they
+        cover when turned around the Z axis, e.g. for plotting with
+        matplotlib's fill.
+
+        Args:
+            segments (int): the number of segments of a full circle.
+
+        Returns:
+            Dict[str, List[np.ndarray]]: the polygons of every component,
+            shape (K, 2) with r and z in mm.
+        """
+        angles = np.linspace(0, 2*math.pi, segments, endpoint=False)
+        circle = np.column_stack([np.cos(angles), np.sin(angles)])
+        output: Dict[str, List[np.ndarray]] = {}
+        for name, parts in self.parts.items():
+            polygons = []
+            for part in parts:
+                if isinstance(part, Sphere):
+                    center = np.array([math.hypot(*part.center[:2]), part.center[2]])
+                    polygons.append(center + circle*part.radius)
+                else:
+                    r0, r1, z0, z1 = part.section()
+                    polygons.append(np.array([[r0, z0], [r1, z0], [r1, z1], [r0, z1]]))
+            output[name] = polygons
+        # The side walls of the bounding box, where they cross the X axis.
+        r0, r1, z = self.bbox_inner[0]/2, self.bbox_outer[0]/2, self.bbox_outer[2]/2
+        output["bounding_box"] = [np.array([[r0, -z], [r1, -z], [r1, z], [r0, z]])]
+        return output
+
+    def collisions(self, tolerance: float = DEFAULT_TOLERANCE) -> List[Collision]:
+        """collisions : The components that overlap each other or reach out of
+        the space inside the bounding box. Parts that only touch, like the
+        containment layers, do not collide. With ports, the limiter walls
+        and the containment are not compared, the walls sit in the openings.
+
+        Args:
+            tolerance (float): overlaps up to this depth in mm are ignored.
+
+        Returns:
+            List[Collision]: the collisions, the deepest first.
+        """
+
+        flat = [(name, part) for name, parts in self.parts.items() for part in parts]
+        deepest: Dict[Tuple[str, str], float] = {}
+        for i, (first_name, first) in enumerate(flat):
+            for second_name, second in flat[i + 1:]:
+                if self.ports and {first_name.split("_")[0], second_name.split("_")[0]} == \
+                        {"limiter", "containment"}:
+                    continue
+                depth = _depth(first, second)
+                pair = (first_name, second_name)
+                if depth > tolerance and depth > deepest.get(pair, 0.0):
+                    deepest[pair] = depth
+
+        inside = np.array(self.bbox_inner)/2
+        limits = np.append(inside, inside[2])
+        for name, parts in self.parts.items():
+            excess = max(float(np.max(_extent(part) - limits)) for part in parts)
+            if excess > tolerance:
+                deepest[(name, "bounding_box")] = excess
+
+        collisions = [Collision(first, second, depth)
+                      for (first, second), depth in deepest.items()]
+        return sorted(collisions, key=lambda collision: -collision.depth)
+
+    def meshes(self, segments: int = DEFAULT_SEGMENTS) -> Dict[str, Tuple[np.ndarray, np.ndarray]]:
+        """meshes : Coarse polygon meshes of the components, the rings and
+        spheres with segments segments around, with outward facing triangles.
+        The rings of a component are merged into the surfaces of their union,
+        so the containment layers are watertight. The boxes and spheres of a
+        component are separate closed meshes, which overlap where the parts
+        collide, see collisions. The meshes are for looking at and checking,
+        not for Serpent, whose geometry needs the CAD export.
+
+        Args:
+            segments (int): the number of segments of a full circle.
+
+        Returns:
+            Dict[str, Tuple[np.ndarray, np.ndarray]]: the nodes, shape (M, 3),
+            and node indices of the triangles, shape (T, 3), of every component.
+        """
+        output: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+        for name, parts in self.parts.items():
+            rings = [part.section() for part in parts if isinstance(part, Ring)]
+            meshes = [_revolve(loop, segments) for loop in _outlines(rings)] if rings else []
+            for part in parts:
+                if isinstance(part, Box):
+                    meshes.append(_box_mesh(part))
+                elif isinstance(part, Sphere):
+                    meshes.append(_sphere_mesh(part, segments))
+            output[name] = _merge(meshes)
+
+        outer = _box_mesh(Box((0.0, 0.0, 0.0), tuple(np.array(self.bbox_outer)/2), 0.0))
+        nodes, triangles = _box_mesh(Box((0.0, 0.0, 0.0), tuple(np.array(self.bbox_inner)/2), 0.0))
+        # The inner walls face into the space inside.
+        output["bounding_box"] = _merge([outer, (nodes, triangles[:, ::-1])])
+        return output
+
+    def write_stl(self, directory: str, segments: int = DEFAULT_SEGMENTS,
+                  binary: bool = True) -> Dict[str, int]:
+        """write_stl : Writes the mesh of every component as an stl file
+        named after it, see meshes.
+
+        Args:
+            directory (str): where the files are written.
+            segments (int): the number of segments of a full circle.
+            binary (bool): write binary stl files.
+
+        Returns:
+            Dict[str, int]: the number of triangles of every file.
+        """
+        os.makedirs(directory, exist_ok=True)
+        writer = write_binary_stl if binary else write_ascii_stl
+        return {path: writer(path, nodes, triangles)
+                for path, (nodes, triangles) in
+                ((os.path.join(directory, name + ".stl"), mesh)
+                 for name, mesh in self.meshes(segments).items())}
+
+
+def _turn(u: float, v: float, angle: float) -> Tuple[float, float, float]:
+    """_turn : The point at u along and v across an axis at angle degrees, on Z = 0."""
+    cos, sin = math.cos(math.radians(angle)), math.sin(math.radians(angle))
+    return (u*cos - v*sin, u*sin + v*cos, 0.0)
@@ -0,0 +1,181 @@
+"""Toroidal symmetry sectors. STOK reactors repeat every 360/N degrees, where
+N divides both the number of ports and the number of limbs, so a single
+wedge of every component is enough for a Monte Carlo model with periodic
+boundaries or rotated copies."""
+import math
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Dict, List
+
+if TYPE_CHECKING:
+    import cadquery as cq
+
+# Angular padding in degrees when deciding if a copy touches the sector.
+_ANGLE_PADDING = 1e-6
+
+
+def symmetry_order(port_parameters, limb_parameters) -> int:
+    """symmetry_order : The largest N for which the reactor is N-fold
+    symmetric. Ports repeat every 360/nr_ports and limbs every 360/nr_limbs
+    degrees (their 22.5 degree offset does not change the period).
+
+    Args:
+        port_parameters (PortParameters): the ports.
+        limb_parameters (LimbParameters): the limbs.
+
+    Returns:
+        int: the symmetry order.
+    """
+    return math.gcd(int(port_parameters.nr_ports), int(limb_parameters.nr_limbs))
+
+
+@dataclass(order=True, frozen=True)
+class Sector:
+    """One 360/nr_sectors degree wedge around the Z axis.
+
+    Args:
+        nr_sectors: int -> the number of sectors in the full reactor.
+        start_angle: float -> the angle of the first symmetry plane in degrees,
+        measured from the X axis towards the Y axis.
+    """
+    nr_sectors: int
+    start_angle: float = 0.0
+
+    @property
+    def angle(self) -> float:
+        """angle : The opening angle of the sector in degrees."""
+        return 360/self.nr_sectors
+
+    @property
+    def rotations(self) -> List[float]:
+        """rotations : The rotations around +Z in degrees that map the
+        sector onto every sector of the full reactor."""
+        return [i*self.angle for i in range(self.nr_sectors)]
+
+    def partial_cylinder(self, radius: float, height: float) -> "cq.Solid":
+        """partial_cylinder : A cylinder of the sector, centered on Z = 0.
+
+        Args:
+            radius (float): the radius of the cylinder.
+            height (float): the height of the cylinder.
+
+        Returns:
+            cq.Solid: the partial cylinder.
+        """
+        # cadquery is only needed for the geometry, not for the sector angles.
+        import cadquery as cq  # pylint: disable=import-outside-toplevel
+        from cadquery import Vector  # pylint: disable=import-outside-toplevel
+
+        return cq.Solid.makeCylinder(radius, height, Vector(0, 0, -height/2),
+                                     Vector(0, 0, 1), self.angle).\
+            rotate(Vector(0, 0, 0), Vector(0, 0, 1), self.start_angle)
+
+    def wedge_for(self, shape: "cq.Shape") -> "cq.Solid":
+        """wedge_for : A partial cylinder of the sector that is larger
+        than the shape, used to clip the shape to the sector.
+
+        Args:
+            shape (cq.Shape): the shape to clip.
+
+        Returns:
+            cq.Solid: the wedge.
+        """
+        box = shape.BoundingBox()
+        radius = 2*max(abs(box.xmin), abs(box.xmax), abs(box.ymin), abs(box.ymax)) + 1.0
+        height = 2*max(abs(box.zmin), abs(box.zmax)) + 1.0
+        return self.partial_cylinder(radius, height)
+
+    def clip(self, workplane: "cq.Workplane") -> "cq.Workplane":
+        """clip : Intersects a component with the sector.
+
+        Args:
+            workplane (cq.Workplane): the component.
+
+        Returns:
+            cq.Workplane: the part of the component inside the sector.
+        """
+        return workplane.intersect(self.wedge_for(workplane.val()))
+
+    def overlaps(self, shape: "cq.Shape") -> bool:
+        """overlaps : Checks if a shape can reach into the sector, based on
+        the angular extent of its bounding box. The check is conservative,
+        it never drops a shape that does overlap.
+
+        Args:
+            shape (cq.Shape): the shape.
+
+        Returns:
+            bool: False if the shape certainly lies outside the sector.
+        """
+        box = shape.BoundingBox()
+        if box.xmin <= 0 <= box.xmax and box.ymin <= 0 <= box.ymax:
+            return True
+
+        # Angles of the corners, unwrapped around the angle of the box center.
+        center = math.degrees(math.atan2((box.ymin + box.ymax)/2, (box.xmin + box.xmax)/2))
+        corners = [math.degrees(math.atan2(y, x)) for x in (box.xmin, box.xmax)
+                   for y in (box.ymin, box.ymax)]
+        corners = [center + (corner - center + 180) % 360 - 180 for corner in corners]
+        low, high = min(corners), max(corners)
+
+        # Distance of the sector start from the low corner, in [0, 360).
+        offset = (self.start_angle - low) % 360
+        return offset <= high - low + _ANGLE_PADDING or \
+            offset >= 360 - self.angle - _ANGLE_PADDING
+
+    def manifest(self, files: Dict[str, str]) -> Dict:
+        """manifest : The data needed to rebuild the full reactor from
+        the sector.
+
+        Args:
+            files (Dict[str, str]): the sector stl file of every component.
+
+        Returns:
+            Dict: the sector description.
+        """
+        return {"nr_sectors": self.nr_sectors,
+                "start_angle": self.start_angle,
+                "sector_angle": self.angle,
+                "axis": [0.0, 0.0, 1.0],
+                "rotations": self.rotations,
+                "files": files}
+
+
+def serpent_symmetry_card(sector: Sector, universe: str, boundary: str = "periodic") -> str:
+    """serpent_symmetry_card : The Serpent universe symmetry card for a
+    sector, placed around the Z axis through the origin.
+
+    Args:
+        sector (Sector): the sector.
+        universe (str): the universe that holds the sector geometry.
+        boundary (str): "periodic" or "reflective". Reflective boundaries are
+        only correct if the design is also mirror symmetric about the planes.
+
+    Raises:
+        ValueError: if the boundary is not known.
+
+    Returns:
+        str: the set usym card.
+    """
+    conditions = {"periodic": 1, "reflective": 2}
+    if boundary not in conditions:
+        raise ValueError(f"Unknown boundary {boundary!r}, expected periodic or reflective.")
+    return (f"set usym {universe} 3 {conditions[boundary]} 0.0 0.0 "
+            f"{sector.start_angle} {sector.angle}")
+
+
+def serpent_rotation_cards(sector: Sector, universe: str) -> List[str]:
+    """serpent_rotation_cards : Serpent universe transformations that place
+    a copy of the sector in every sector of the reactor, for models that
+    replicate the sector instead of using a symmetry boundary.
+
+    Args:
+        sector (Sector): the sector.
+        universe (str): the prefix of the copied universes, the copy i is
+        expected in universe f"{universe}_{i}".
+
+    Returns:
+        List[str]: one trans card per copy.
+    """
+    return [f"trans U {universe}_{i} 0.0 0.0 0.0 0.0 0.0 {rotation}"
+            for i, rotation in enumerate(sector.rotations)]
+
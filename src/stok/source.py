@@ -0,0 +1,209 @@
+"""Samples neutron source sites in the plasma source and writes them as a
+Serpent source file. The plasma source is a rectangular torus, so uniform
+sites follow from the inverse of its cumulative volume in the cylindrical
+coordinates: r = sqrt(r0**2 + u*(r1**2 - r0**2)), z and phi uniform. A
+profile is sampled the same way, cell by cell on an r-z grid. Sites are
+drawn and written in chunks, so the memory does not grow with their number."""
+import math
+from dataclasses import dataclass, field
+from functools import cached_property
+from typing import Callable, Iterator, Optional, Tuple
+
+import numpy as np
+
+from .dimensions import plasma_source_dimensions, torus_volume
+
+# Number of sites drawn and written at a time, the formatted lines of a
+# chunk take a few tens of MB.
+DEFAULT_CHUNK_SIZE = 1 << 16
+
+# The energy of D-T fusion neutrons in MeV.
+DT_ENERGY = 14.1
+
+# STOK works in mm, Serpent in cm.
+_MM_TO_CM = 0.1
+
+# The weight and time of every written site, see write_serpent_source.
+_SOURCE_LINE = "%.8g %.8g %.8g %.8g %.8g %.8g {energy:.8g} 1 0\n"
+
+Profile = Callable[[np.ndarray, np.ndarray], np.ndarray]
+
+
+@dataclass(frozen=True)
+class PlasmaSourceSampler:
+    """Draws source sites in the plasma source. All lengths are in mm and
+    angles in degrees.
+
+    Args:
+        inner_r: float
+        outer_r: float
+        height: float -> the plasma source spans -height/2 to height/2 in Z.
+        profile: Callable, optional -> the relative source density at the radii
+        and heights of a grid, profile(r, z) -> weights, vectorized over
+        arrays of the same shape. None samples uniformly.
+        bins: Tuple[int, int] -> the number of r and z cells of the profile
+        grid, the density is constant in every cell.
+        sector: Tuple[float, float], optional -> the start and opening angle of
+        the sector to sample, None samples the full torus.
+    """
+    inner_r: float
+    outer_r: float
+    height: float
+    profile: Optional[Profile] = field(default=None, compare=False)
+    bins: Tuple[int, int] = (64, 64)
+    sector: Optional[Tuple[float, float]] = None
+
+    @classmethod
+    def from_parameters(cls, containment_parameters, solenoid_parameters,
+                        profile: Optional[Profile] = None, bins: Tuple[int, int] = (64, 64),
+                        sector=None) -> "PlasmaSourceSampler":
+        """from_parameters : A sampler of the plasma source of STOK.plasma_source.
+
+        Args:
+            containment_parameters (ContainmentParameters): the containment.
+            solenoid_parameters (SolenoidParameters): the solenoid.
+            profile (Callable, optional): the relative source density, see the class.
+            bins (Tuple[int, int]): the profile grid.
+            sector (Sector, optional): only sample this sector.
+
+        Returns:
+            PlasmaSourceSampler: the sampler.
+        """
+        inner_r, outer_r, height = plasma_source_dimensions(containment_parameters,
+                                                            solenoid_parameters)
+        return cls(inner_r=inner_r, outer_r=outer_r, height=height, profile=profile,
+                   bins=bins,
+                   sector=None if sector is None else (sector.start_angle, sector.angle))
+
+    @property
+    def volume(self) -> float:
+        """volume : The volume of the sampled plasma source."""
+        fraction = 1.0 if self.sector is None else self.sector[1]/360
+        return float(torus_volume(self.inner_r, self.outer_r, self.height))*fraction
+
+    @cached_property
+    def _cells(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """_cells : The squared radii and heights of the profile grid and the
+        cumulative probability of its cells, in r-major order."""
+
+        if self.inner_r >= self.outer_r or self.height <= 0:
+            raise ValueError(f"The plasma source is empty: inner radius {self.inner_r}, "
+                             f"outer radius {self.outer_r} and height {self.height}.")
+
+        nr_r, nr_z = (1, 1) if self.profile is None else self.bins
+        r2 = np.linspace(self.inner_r, self.outer_r, nr_r + 1)**2
+        z = np.linspace(-self.height/2, self.height/2, nr_z + 1)
+        if self.profile is None:
+            return r2, z, np.ones(1)
+
+        # The density at the cell centers times the volume of the cells.
+        r = np.sqrt(r2)
+        centers_r, centers_z = np.meshgrid((r[:-1] + r[1:])/2, (z[:-1] + z[1:])/2,
+                                           indexing="ij")
+        density = np.broadcast_to(np.asarray(self.profile(centers_r, centers_z),
+                                             dtype=np.float64), centers_r.shape)
+        if not np.all(np.isfinite(density)) or np.any(density < 0) or not np.any(density > 0):
+            raise ValueError("The profile has to be finite, non-negative and positive "
+                             "somewhere.")
+        weights = (density*np.diff(r2)[:, None]*np.diff(z)[None, :]).ravel()
+        cumulative = np.cumsum(weights)
+        return r2, z, cumulative/cumulative[-1]
+
+    def sample(self, count: int, rng: Optional[np.random.Generator] = None) -> np.ndarray:
+        """sample : Draws source sites.
+
+        Args:
+            count (int): the number of sites.
+            rng (np.random.Generator, optional): the random number generator.
+
+        Returns:
+            np.ndarray: the sites in mm, shape (count, 3).
+        """
+
+        rng = np.random.default_rng() if rng is None else rng
+        r2, z, cumulative = self._cells
+        nr_z = len(z) - 1
+        u = rng.random((3 if len(cumulative) == 1 else 4, count))
+
+        # The cell of every site, then the inverse volume in the cell.
+        if len(cumulative) == 1:
+            r2_low, r2_high, z_low, z_high = r2[0], r2[1], z[0], z[1]
+        else:
+            cell = np.minimum(np.searchsorted(cumulative, u[3], side="right"),
+                              len(cumulative) - 1)
+            i, j = np.divmod(cell, nr_z)
+            r2_low, r2_high, z_low, z_high = r2[i], r2[i + 1], z[j], z[j + 1]
+
+        r = np.sqrt(r2_low + u[0]*(r2_high - r2_low))
+        start, angle = (0.0, 360.0) if self.sector is None else self.sector
+        phi = np.radians(start + u[1]*angle)
+
+        sites = np.empty((count, 3))
+        np.multiply(r, np.cos(phi), out=sites[:, 0])
+        np.multiply(r, np.sin(phi), out=sites[:, 1])
+        sites[:, 2] = z_low + u[2]*(z_high - z_low)
+        return sites
+
+    def chunks(self, count: int, chunk_size: int = DEFAULT_CHUNK_SIZE,
+               rng: Optional[np.random.Generator] = None) -> Iterator[np.ndarray]:
+        """chunks : Draws source sites a chunk at a time.
+
+        Args:
+            count (int): the total number of sites.
+            chunk_size (int): the largest number of sites per chunk.
+            rng (np.random.Generator, optional): the random number generator.
+
+        Yields:
+            np.ndarray: the sites in mm, shape (M, 3).
+        """
+        rng = np.random.default_rng() if rng is None else rng
+        for start in range(0, count, chunk_size):
+            yield self.sample(min(chunk_size, count - start), rng)
+
+
+def isotropic_directions(count: int, rng: np.random.Generator) -> np.ndarray:
+    """isotropic_directions : Unit vectors uniformly distributed over the sphere.
+
+    Args:
+        count (int): the number of directions.
+        rng (np.random.Generator): the random number generator.
+
+    Returns:
+        np.ndarray: the directions, shape (count, 3).
+    """
+    w = 2*rng.random(count) - 1
+    phi = 2*math.pi*rng.random(count)
+    s = np.sqrt(1 - w*w)
+    return np.stack([s*np.cos(phi), s*np.sin(phi), w], axis=1)
+
+
+def write_serpent_source(filename: str, sampler: PlasmaSourceSampler, count: int,
+                         energy: float = DT_ENERGY, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                         seed: Optional[int] = None) -> int:
+    """write_serpent_source : Writes source sites as a Serpent source file, one
+    particle per line with the columns "x y z u v w E wgt t": the position in
+    cm, an isotropic direction, the energy in MeV, weight 1 and time 0. Read
+    it with a source card like "src plasma n sf <filename> 0".
+
+    Args:
+        filename (str): the name of the file.
+        sampler (PlasmaSourceSampler): the sampler.
+        count (int): the number of sites.
+        energy (float): the energy of every particle in MeV.
+        chunk_size (int): the number of sites drawn and written at a time.
+        seed (int, optional): the seed, the same seed writes the same file.
+
+    Returns:
+        int: the number of sites written.
+    """
+
+    rng = np.random.default_rng(seed)
+    line = _SOURCE_LINE.format(energy=energy)
+
+    with open(filename, "w", encoding="ascii") as file:
+        for sites in sampler.chunks(count, chunk_size, rng):
+            values = np.concatenate([sites*_MM_TO_CM, isotropic_directions(len(sites), rng)],
+                                    axis=1)
+            file.write((line*len(values)) % tuple(values.ravel().tolist()))
+
+    return count
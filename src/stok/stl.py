@@ -0,0 +1,337 @@
+"""Binary and ascii STL output straight from the gmsh mesh arrays. The
+triangles are converted and written in fixed size chunks, so the file is
+never held in memory as a whole. STL files of either kind can be read back
+as arrays."""
+import os
+import re
+import struct
+from typing import Dict, Sequence, Tuple
+
+import numpy as np
+
+# One binary STL record: normal, three vertices and the attribute byte count.
+STL_RECORD = np.dtype([("normal", "<f4", (3,)), ("vertices", "<f4", (3, 3)),
+                       ("attribute", "<u2")])
+
+# Number of triangles converted and written at a time.
+DEFAULT_CHUNK_SIZE = 1 << 18
+
+
+# One ascii STL facet, in the layout gmsh writes.
+_ASCII_FACET = ("facet normal %.15g %.15g %.15g\n  outer loop\n"
+                "    vertex %.15g %.15g %.15g\n    vertex %.15g %.15g %.15g\n"
+                "    vertex %.15g %.15g %.15g\n  endloop\nendfacet\n")
+
+
+def _normals(vertices: np.ndarray) -> np.ndarray:
+    """_normals : The unit normals of triangles, they follow the right hand
+    rule on the node order, like gmsh."""
+    normals = np.cross(vertices[:, 1] - vertices[:, 0], vertices[:, 2] - vertices[:, 0])
+    lengths = np.linalg.norm(normals, axis=1, keepdims=True)
+    np.divide(normals, lengths, out=normals, where=lengths > 0)
+    return normals
+
+
+def write_binary_stl(filename: str, nodes: np.ndarray, triangles: np.ndarray,
+                     chunk_size: int = DEFAULT_CHUNK_SIZE, header: str = "STOK") -> int:
+    """write_binary_stl : Writes a triangle mesh as a binary STL file.
+
+    Args:
+        filename (str): the name of the file.
+        nodes (np.ndarray): the node coordinates, shape (M, 3).
+        triangles (np.ndarray): the node indices of every triangle, shape (T, 3).
+        chunk_size (int): the number of triangles written at a time.
+        header (str): the text of the 80 byte header.
+
+    Returns:
+        int: the number of triangles written.
+    """
+
+    nodes = np.asarray(nodes, dtype=np.float64)
+    triangles = np.asarray(triangles)
+    record = np.empty(min(chunk_size, max(len(triangles), 1)), dtype=STL_RECORD)
+    record["attribute"] = 0
+
+    with open(filename, "wb") as file:
+        file.write(header.encode("ascii")[:80].ljust(80, b"\0"))
+        file.write(struct.pack("<I", len(triangles)))
+
+        for start in range(0, len(triangles), chunk_size):
+            vertices = nodes[triangles[start:start + chunk_size]]
+            chunk = record[:len(vertices)]
+
+            chunk["normal"] = _normals(vertices)
+            chunk["vertices"] = vertices
+            file.write(chunk.tobytes())
+
+    return len(triangles)
+
+
+def write_ascii_stl(filename: str, nodes: np.ndarray, triangles: np.ndarray,
+                    chunk_size: int = DEFAULT_CHUNK_SIZE >> 4, name: str = "STOK") -> int:
+    """write_ascii_stl : Writes a triangle mesh as an ascii STL file.
+
+    Args:
+        filename (str): the name of the file.
+        nodes (np.ndarray): the node coordinates, shape (M, 3).
+        triangles (np.ndarray): the node indices of every triangle, shape (T, 3).
+        chunk_size (int): the number of triangles written at a time.
+        name (str): the name of the solid.
+
+    Returns:
+        int: the number of triangles written.
+    """
+
+    nodes = np.asarray(nodes, dtype=np.float64)
+    triangles = np.asarray(triangles)
+
+    with open(filename, "w", encoding="ascii") as file:
+        file.write(f"solid {name}\n")
+        for start in range(0, len(triangles), chunk_size):
+            vertices = nodes[triangles[start:start + chunk_size]]
+            values = np.concatenate([_normals(vertices), vertices.reshape(-1, 9)], axis=1)
+            file.write((_ASCII_FACET*len(values)) % tuple(values.ravel().tolist()))
+        file.write(f"endsolid {name}\n")
+
+    return len(triangles)
+
+
+def gmsh_nodes() -> Tuple[np.ndarray, np.ndarray]:
+    """gmsh_nodes : Reads the nodes of the current gmsh model.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: the node coordinates, shape (M, 3), and
+        the index of every node tag in the coordinates.
+    """
+
+    import gmsh  # pylint: disable=import-outside-toplevel
+
+    node_tags, coordinates, _ = gmsh.model.mesh.getNodes()
+
+    # Node tags do not have to be contiguous, so they are mapped to indices.
+    node_tags = np.asarray(node_tags, dtype=np.int64)
+    index = np.zeros(node_tags.max() + 1 if len(node_tags) else 1, dtype=np.int64)
+    index[node_tags] = np.arange(len(node_tags))
+    return np.asarray(coordinates, dtype=np.float64).reshape(-1, 3), index
+
+
+def gmsh_triangles(index: np.ndarray, tag: int = -1) -> np.ndarray:
+    """gmsh_triangles : Reads the triangles of the current gmsh model.
+
+    Args:
+        index (np.ndarray): the node tag to index map from gmsh_nodes.
+        tag (int): the tag of the surface to read, -1 for all surfaces.
+
+    Returns:
+        np.ndarray: the node indices of every triangle, shape (T, 3).
+    """
+
+    import gmsh  # pylint: disable=import-outside-toplevel
+
+    _, element_nodes = gmsh.model.mesh.getElementsByType(2, tag=tag)
+    return index[np.asarray(element_nodes, dtype=np.int64)].reshape(-1, 3)
+
+
+def orient_surfaces(nodes: np.ndarray, triangles: np.ndarray,
+                    surfaces: np.ndarray) -> np.ndarray:
+    """orient_surfaces : Orients the surfaces of a closed mesh so its normals
+    point outwards. The triangles of every surface have to be consistently
+    oriented already, as gmsh meshes them. Two neighbouring surfaces have to
+    run along their shared edges in opposite directions, which sets the
+    orientation of every surface relative to its neighbours, and every
+    connected shell is then turned so it encloses a positive volume.
+
+    Args:
+        nodes (np.ndarray): the node coordinates, shape (M, 3).
+        triangles (np.ndarray): the node indices of every triangle, shape (T, 3).
+        surfaces (np.ndarray): the surface index of every triangle, shape (T,),
+        from 0 to the number of surfaces.
+
+    Returns:
+        np.ndarray: the triangles, with the ones of flipped surfaces reversed.
+    """
+
+    nr_surfaces = int(surfaces.max()) + 1 if len(surfaces) else 0
+    start = triangles.ravel().astype(np.int64)
+    end = np.roll(triangles, -1, axis=1).ravel().astype(np.int64)
+    owner = np.repeat(surfaces, 3)
+
+    # Edges shared by exactly two triangles of different surfaces.
+    keys = np.minimum(start, end)*np.int64(len(nodes)) + np.maximum(start, end)
+    order = np.argsort(keys, kind="stable")
+    sorted_keys = keys[order]
+    pair = np.flatnonzero(sorted_keys[:-1] == sorted_keys[1:])
+    single = np.ones(len(pair), dtype=bool)
+    single[1:] &= sorted_keys[pair[1:]] != sorted_keys[pair[:-1]]
+    single[:-1] &= sorted_keys[pair[:-1] + 1] != sorted_keys[pair[1:] + 1]
+    first, second = order[pair[single]], order[pair[single] + 1]
+    across = owner[first] != owner[second]
+    first, second = first[across], second[across]
+
+    # Neighbours that run along the edge the same way need opposite flips.
+    links = np.unique(np.stack([owner[first], owner[second],
+                                start[first] == start[second]], axis=1), axis=0)
+    neighbours: Dict[int, list] = {}
+    for a, b, same in links.tolist():
+        neighbours.setdefault(a, []).append((b, same))
+        neighbours.setdefault(b, []).append((a, same))
+
+    flip = np.zeros(nr_surfaces, dtype=bool)
+    shell = np.full(nr_surfaces, -1, dtype=np.int64)
+    for seed in range(nr_surfaces):
+        if shell[seed] >= 0:
+            continue
+        shell[seed] = seed
+        pending = [seed]
+        while pending:
+            current = pending.pop()
+            for other, same in neighbours.get(current, ()):
+                if shell[other] < 0:
+                    shell[other] = seed
+                    flip[other] = flip[current] ^ bool(same)
+                    pending.append(other)
+
+    triangles = np.where(flip[surfaces][:, None], triangles[:, ::-1], triangles)
+    corners = nodes[triangles]
+    shells = shell[surfaces]
+
+    # The signed volume of every shell, by the divergence theorem. A shell
+    # inside an odd number of other shells bounds a cavity and has to enclose
+    # a negative volume, every other shell a positive one.
+    volumes = np.bincount(shells, minlength=nr_surfaces, weights=np.einsum(
+        "ij,ij->i", corners[:, 0], np.cross(corners[:, 1], corners[:, 2])))
+    seeds = np.unique(shells)
+    inverted = np.zeros(nr_surfaces, dtype=bool)
+    for seed in seeds:
+        point = corners[np.argmax(shells == seed)].mean(axis=0)
+        depth = sum(_crossings(point, corners[shells == other]) % 2
+                    for other in seeds if other != seed)
+        inverted[seed] = (volumes[seed] < 0) != (depth % 2 == 1)
+    return np.where(inverted[shells][:, None], triangles[:, ::-1], triangles)
+
+
+# An arbitrary ray direction, unlikely to run along a mesh edge.
+_RAY = np.array([0.8017, 0.4423, 0.4020])
+
+
+def _crossings(point: np.ndarray, corners: np.ndarray) -> int:
+    """_crossings : The number of triangles a ray from a point crosses, by
+    the Moller-Trumbore test."""
+    edge1 = corners[:, 1] - corners[:, 0]
+    edge2 = corners[:, 2] - corners[:, 0]
+    normal = np.cross(_RAY, edge2)
+    det = np.einsum("ij,ij->i", edge1, normal)
+    valid = np.abs(det) > 1e-12
+    det = np.where(valid, det, 1.0)
+    offset = point - corners[:, 0]
+    u = np.einsum("ij,ij->i", offset, normal)/det
+    q = np.cross(offset, edge1)
+    v = q @ _RAY/det
+    t = np.einsum("ij,ij->i", edge2, q)/det
+    return int(np.count_nonzero(valid & (u >= 0) & (v >= 0) & (u + v <= 1) & (t > 0)))
+
+
+def gmsh_body_triangles(nodes: np.ndarray, index: np.ndarray,
+                        volumes: Sequence[int]) -> np.ndarray:
+    """gmsh_body_triangles : Reads the triangles of the boundary of a body in
+    the current gmsh model, with outward normals. Surfaces between the
+    volumes of the body are left out.
+
+    Args:
+        nodes (np.ndarray): the node coordinates from gmsh_nodes.
+        index (np.ndarray): the node tag to index map from gmsh_nodes.
+        volumes (Sequence[int]): the tags of the volumes of the body.
+
+    Returns:
+        np.ndarray: the node indices of every triangle, shape (T, 3).
+    """
+
+    import gmsh  # pylint: disable=import-outside-toplevel
+
+    # gmsh meshes a surface along its own normal, which does not follow the
+    # orientation getBoundary reports, so the surfaces are oriented afterwards.
+    boundary = gmsh.model.getBoundary([(3, tag) for tag in volumes], combined=True)
+    triangles = [np.zeros((0, 3), dtype=np.int64)]
+    surfaces = [np.zeros(0, dtype=np.int64)]
+    for i, (_, tag) in enumerate(boundary):
+        triangles.append(gmsh_triangles(index, abs(tag)))
+        surfaces.append(np.full(len(triangles[-1]), i, dtype=np.int64))
+    return orient_surfaces(nodes, np.concatenate(triangles), np.concatenate(surfaces))
+
+
+def write_gmsh_stl(filename: str, per_physical: bool = False,
+                   chunk_size: int = DEFAULT_CHUNK_SIZE) -> Dict[str, int]:
+    """write_gmsh_stl : Writes the surface mesh of the current gmsh model as
+    binary STL.
+
+    Args:
+        filename (str): the name of the file. With per_physical the physical
+        surface name (or its tag) is added before the extension.
+        per_physical (bool): write one file per physical surface group.
+        chunk_size (int): the number of triangles written at a time.
+
+    Raises:
+        ValueError: if per_physical is set and the model has no physical surfaces.
+
+    Returns:
+        Dict[str, int]: the number of triangles in every written file.
+    """
+
+    import gmsh  # pylint: disable=import-outside-toplevel
+
+    nodes, index = gmsh_nodes()
+    if not per_physical:
+        return {filename: write_binary_stl(filename, nodes, gmsh_triangles(index), chunk_size)}
+
+    groups = gmsh.model.getPhysicalGroups(2)
+    if not groups:
+        raise ValueError("The gmsh model has no physical surfaces.")
+
+    root, extension = os.path.splitext(filename)
+    written: Dict[str, int] = {}
+    for _, group in groups:
+        name = gmsh.model.getPhysicalName(2, group) or str(group)
+        triangles = [gmsh_triangles(index, entity)
+                     for entity in gmsh.model.getEntitiesForPhysicalGroup(2, group)]
+        path = f"{root}_{name}{extension}"
+        written[path] = write_binary_stl(path, nodes, np.concatenate(triangles), chunk_size)
+
+    return written
+
+
+def read_binary_stl_header(filename: str) -> int:
+    """read_binary_stl_header : Reads the triangle count of a binary STL.
+
+    Args:
+        filename (str): the name of the file.
+
+    Returns:
+        int: the number of triangles.
+    """
+    with open(filename, "rb") as file:
+        file.seek(80)
+        return struct.unpack("<I", file.read(4))[0]
+
+
+def read_stl(filename: str) -> np.ndarray:
+    """read_stl : Reads the triangles of a binary or ascii STL file.
+
+    Args:
+        filename (str): the name of the file.
+
+    Returns:
+        np.ndarray: the vertices of every triangle, shape (T, 3, 3).
+    """
+
+    size = os.path.getsize(filename)
+    if size >= 84:
+        count = read_binary_stl_header(filename)
+        # Ascii files can start with "solid" too, the size tells them apart.
+        if size == 84 + count*STL_RECORD.itemsize:
+            records = np.fromfile(filename, dtype=STL_RECORD, offset=84, count=count)
+            return records["vertices"]
+
+    with open(filename, "rb") as file:
+        data = file.read()
+    coordinates = re.findall(rb"vertex\s+(\S+)\s+(\S+)\s+(\S+)", data)
+    return np.array(coordinates, dtype=bytes).astype(np.float64).reshape(-1, 3, 3)
@@ -0,0 +1,172 @@
+"""Checks that STL meshes are closed, which Serpent needs to track particles
+through them. Vertices are welded, every edge is counted after sorting its
+two vertex ids, and the enclosed volume is compared with the volume of the
+solid. Everything is done on NumPy arrays, so files with millions of
+triangles are checked in seconds."""
+import argparse
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .stl import read_stl
+
+
+@dataclass(frozen=True)
+class MeshReport:
+    """The result of a mesh check.
+
+    Args:
+        triangles: int
+        vertices: int -> the number of vertices after welding.
+        boundary_edges: int -> edges with a single triangle, i.e. holes.
+        non_manifold_edges: int -> edges shared by more than two triangles.
+        flipped_edges: int -> edges whose two triangles run along them in the
+        same direction, i.e. inconsistently oriented triangles.
+        degenerate_triangles: int -> triangles with repeated vertices.
+        volume: float -> the enclosed volume.
+        expected_volume: float, optional -> the volume of the solid.
+    """
+    triangles: int
+    vertices: int
+    boundary_edges: int
+    non_manifold_edges: int
+    flipped_edges: int
+    degenerate_triangles: int
+    volume: float
+    expected_volume: Optional[float] = None
+
+    @property
+    def closed(self) -> bool:
+        """closed : True if every edge is shared by exactly two triangles."""
+        return self.boundary_edges == 0 and self.non_manifold_edges == 0
+
+    @property
+    def watertight(self) -> bool:
+        """watertight : True if the mesh is closed and consistently oriented."""
+        return self.closed and self.flipped_edges == 0
+
+    @property
+    def volume_error(self) -> Optional[float]:
+        """volume_error : The relative difference of the enclosed and the
+        expected volume, None without an expected volume."""
+        if not self.expected_volume:
+            return None
+        return abs(self.volume - self.expected_volume)/abs(self.expected_volume)
+
+    def as_dict(self) -> Dict[str, Any]:
+        """as_dict : The report as plain data, with the derived values."""
+        values = asdict(self)
+        values.update(closed=self.closed, watertight=self.watertight,
+                      volume_error=self.volume_error)
+        return values
+
+
+def weld(vertices: np.ndarray, tolerance: float = 0.0) -> Tuple[np.ndarray, np.ndarray]:
+    """weld : Merges equal vertices of a triangle soup.
+
+    Args:
+        vertices (np.ndarray): the vertices of every triangle, shape (T, 3, 3).
+        tolerance (float): vertices are snapped to a grid of this size before
+        they are compared, 0 merges only identical vertices.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: the unique vertices, shape (M, 3), and the
+        vertex ids of every triangle, shape (T, 3).
+    """
+
+    points = np.ascontiguousarray(vertices.reshape(-1, 3))
+    if tolerance > 0:
+        points = np.ascontiguousarray(np.round(points/tolerance).astype(np.int64))
+    else:
+        # -0.0 and 0.0 are the same point but not the same bytes.
+        points = points + 0.0
+
+    # Comparing rows as raw bytes is much faster than np.unique(axis=0).
+    keys = points.view(np.dtype((np.void, points.dtype.itemsize*3))).ravel()
+    _, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+    return vertices.reshape(-1, 3)[first], inverse.reshape(-1, 3)
+
+
+def check_triangles(vertices: np.ndarray, expected_volume: Optional[float] = None,
+                    tolerance: float = 0.0) -> MeshReport:
+    """check_triangles : Checks a triangle soup.
+
+    Args:
+        vertices (np.ndarray): the vertices of every triangle, shape (T, 3, 3).
+        expected_volume (float, optional): the volume of the solid.
+        tolerance (float): the weld tolerance, see weld.
+
+    Returns:
+        MeshReport: the report.
+    """
+
+    points, faces = weld(vertices, tolerance)
+    nr_points = np.int64(len(points))
+
+    degenerate = (faces[:, 0] == faces[:, 1]) | (faces[:, 1] == faces[:, 2]) | \
+        (faces[:, 2] == faces[:, 0])
+    faces = faces[~degenerate].astype(np.int64)
+
+    # Every triangle runs along its edges a->b, b->c and c->a.
+    start = faces.ravel()
+    end = np.roll(faces, -1, axis=1).ravel()
+    _, counts = np.unique(np.minimum(start, end)*nr_points + np.maximum(start, end),
+                          return_counts=True)
+    _, directed_counts = np.unique(start*nr_points + end, return_counts=True)
+
+    # The enclosed volume by the divergence theorem, in double precision.
+    corners = np.asarray(vertices, dtype=np.float64)
+    volume = np.einsum("ij,ij->", corners[:, 0], np.cross(corners[:, 1], corners[:, 2]))/6
+
+    return MeshReport(triangles=len(vertices),
+                      vertices=int(nr_points),
+                      boundary_edges=int(np.count_nonzero(counts == 1)),
+                      non_manifold_edges=int(np.count_nonzero(counts > 2)),
+                      flipped_edges=int(np.count_nonzero(directed_counts > 1)),
+                      degenerate_triangles=int(np.count_nonzero(degenerate)),
+                      volume=float(volume),
+                      expected_volume=expected_volume)
+
+
+def check_stl(filename: str, expected_volume: Optional[float] = None,
+              tolerance: float = 0.0) -> MeshReport:
+    """check_stl : Checks a binary or ascii STL file.
+
+    Args:
+        filename (str): the name of the file.
+        expected_volume (float, optional): the volume of the solid.
+        tolerance (float): the weld tolerance, see weld.
+
+    Returns:
+        MeshReport: the report.
+    """
+    return check_triangles(read_stl(filename), expected_volume, tolerance)
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    """main : The command line entry point, exits with status 1 if a file
+    is not watertight."""
+
+    parser = argparse.ArgumentParser(description="Check that STL files are watertight.")
+    parser.add_argument("files", nargs="+")
+    parser.add_argument("--volume", type=float, default=None,
+                        help="the expected volume, for a single file")
+    parser.add_argument("--tolerance", type=float, default=0.0, help="the weld tolerance")
+    args = parser.parse_args(argv)
+
+    failed = 0
+    for filename in args.files:
+        report = check_stl(filename, args.volume, args.tolerance)
+        failed += not report.watertight
+        error = "" if report.volume_error is None else f", volume error {report.volume_error:.2e}"
+        print(f"{filename}: {'watertight' if report.watertight else 'NOT watertight'}, "
+              f"{report.triangles} triangles, {report.boundary_edges} boundary, "
+              f"{report.non_manifold_edges} non-manifold and {report.flipped_edges} flipped "
+              f"edges, volume {report.volume:.6g}{error}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    import sys
+    sys.exit(main())
@@ -1,220 +1,255 @@
 """The STOK builder, text file search and inject functions to use when
 generating STOK."""
+import json
 import os
-from dataclasses import dataclass, field
-from typing import List, Tuple
+from typing import Any, Dict, Iterator, List, Mapping, Optional, Sequence, Tuple, Union
 
 import cadquery as cq
 import gmsh
 from cadquery import Vector
 
-STOK_CONFIG = os.path.dirname(os.path.realpath(__file__)) + "/stok_config.txt"
+from .classify import PointClassifier
+# The configuration helpers and parameters are imported from here by older code.
+from .config import STOK_CONFIG, FileReader, Layer, load_config
+from .dimensions import LayerTable, layer_table_from_parameters
+from .geometry_cache import GeometryCache, cached_builder
+from .instancing import Instanced, Transform, polar_transforms
+from .mesh_cache import MeshCache
+from .meshing import (BatchExporter, _warn_exp_factor, apply_mesh_policy,
+                      check_triangle_budget, check_written_stl, import_shape, policy_for,
+                      triangle_count, write_stl)
+from .parameters import (ContainmentParameters, DivertorParameters,
+                         LimbDimensiones, LimbParameters, LimiterParameters,
+                         PortParameters, SolenoidParameters,
+                         parameters_from_config)
+from .pipeline import export_pipelined
+from .preview import Preview
+from .sector import (Sector, serpent_rotation_cards, serpent_symmetry_card,
+                     symmetry_order)
+from .source import DT_ENERGY, PlasmaSourceSampler, Profile, write_serpent_source
+from .stl_check import MeshReport
+from .tracing import span, traced
+
+
+def named_parts(component: str, result: Any) -> List[Tuple[str, Any]]:
+    """named_parts : Names the solids returned by a builder, the component
+    name for a single solid and component_i (or component_i_j for nested
+    lists such as the sphere pairs) otherwise.
 
-class FileReader:
-    """
-    Reads the input file.
+    Args:
+        component (str): the builder name.
+        result (Any): what the builder returned.
+
+    Returns:
+        List[Tuple[str, Any]]: the name and solid of every part.
     """
+    if not isinstance(result, (list, tuple)):
+        return [(component, result)]
+    return [pair for i, item in enumerate(result)
+            for pair in named_parts(f"{component}_{i}", item)]
 
-    def __init__(self, *args: str):
-        self.filename: str = args[0]
-        self.read = self.reader()
 
-    def reader(self) -> List[float]:
-        """reader : Reads a file and checks for numerical values,
-        then returns a list of the numerical values.
+class STOK():
+    """The class containing all construction components."""
+    def __init__(self, param_tup: Tuple,
+                 geometry_cache: Optional[GeometryCache] = None,
+                 sector: Optional[Sector] = None,
+                 mesh_cache: Optional[MeshCache] = None) -> None:
+        """Intializes the STOK class by passing dataclass objects
+        of the parameters of the reactor.
+
+        Args:
+            param_tup (Tuple): The tuple of parameters needed to pass
+            to the class so it can have values to construct the reactor from.
+            geometry_cache (GeometryCache, optional): if given, the component
+            builders take their solids from it and store new ones in it.
+            sector (Sector, optional): if given, every builder only creates the
+            part of its component inside this toroidal symmetry sector.
+            mesh_cache (MeshCache, optional): if given, the stl exports take
+            the meshes of unchanged components from it instead of meshing them.
 
-        Returns:
-            List[float, str]: returns a tuple of the numerical values.
+        Raises:
+            TypeError: if the input types are not correct or missing.
         """
 
-        with open(self.filename, 'r', encoding='utf8') as file:
-            output: List[float] = []
-            for _, line in enumerate(file):
-                if ("\n" in line[0]) or ("#" in line[0]) or ("%" in line[0]):
-                    pass
-                else:
-                    output.append(float(line))
-        return output
+        type_tuple = list(map(type, param_tup))
+        if type_tuple == [ContainmentParameters, SolenoidParameters, PortParameters,
+                          LimbParameters, LimiterParameters, DivertorParameters]:
+            self.containment_parameters = param_tup[0]
+            self.solenoid_parameters = param_tup[1]
+            self.port_parameters = param_tup[2]
+            self.limb_parameters = param_tup[3]
+            self.limiter_parameters = param_tup[4]
+            self.divertor_parameters = param_tup[5]
+            self.geometry_cache = geometry_cache
+            self.sector = sector
+            self.mesh_cache = mesh_cache
+            self._layer_table: Optional[Tuple[Tuple, LayerTable]] = None
+        else:
+            raise TypeError("""Wrong input types, expected type ContainmentParameters,
+                            SolenoidParameters, PortParameters, LimbParameters,
+                            LimiterParameters, DivertorParameters in that order.""")
 
+    def symmetry_order(self) -> int:
+        """symmetry_order : The toroidal symmetry order of the reactor,
+        the largest number of identical sectors it can be split into.
 
-@dataclass(order=True, frozen=True)
-class Layer:
-    """Layer class, used to store the data for each layer.
+        Returns:
+            int: the symmetry order.
+        """
+        return symmetry_order(self.port_parameters, self.limb_parameters)
 
-    Args:
-        upper_lower_outer: float
-        inner: float
-    """
-    upper_lower_outer: float
-    inner: float
+    def sector_view(self, nr_sectors: Optional[int] = None,
+                    start_angle: float = 0.0) -> "STOK":
+        """sector_view : Returns a STOK with the same parameters and caches
+        whose builders only create one toroidal symmetry sector.
 
+        Args:
+            nr_sectors (int, optional): the number of sectors, it has to divide
+            the symmetry order, defaults to the symmetry order.
+            start_angle (float): the angle of the first sector plane in degrees.
 
-def layers_all() -> Tuple:
-    """layers_all : Returns a list of Layer objects.
+        Raises:
+            ValueError: if the reactor is not symmetric with nr_sectors sectors.
 
-    Args:
-        args: float
+        Returns:
+            STOK: the sector builder.
+        """
 
-    Returns:
-        List[Layer]: returns a list of Layer objects.
-    """
-    output: List = []
-    nr_layers = int(FileReader(STOK_CONFIG).read[2])
-    for i in range(3, nr_layers*2+3, 2):
-        output.append(Layer(FileReader(STOK_CONFIG).read[i],
-                            FileReader(STOK_CONFIG).read[i+1]))
-    return tuple(output)
+        order = self.symmetry_order()
+        nr_sectors = order if nr_sectors is None else nr_sectors
+        if nr_sectors < 1 or order % nr_sectors != 0:
+            raise ValueError(f"The reactor is {order}-fold symmetric, it cannot be "
+                             f"split into {nr_sectors} sectors.")
 
+        return STOK((self.containment_parameters, self.solenoid_parameters,
+                     self.port_parameters, self.limb_parameters,
+                     self.limiter_parameters, self.divertor_parameters),
+                    geometry_cache=self.geometry_cache,
+                    sector=Sector(nr_sectors, start_angle),
+                    mesh_cache=self.mesh_cache)
 
-@dataclass(order=True, frozen=True)
-class ContainmentParameters:
-    """A class to store the parameters for the containment.
+    def point_classifier(self, ports: bool = True, divertor: bool = True) -> PointClassifier:
+        """point_classifier : The analytic classifier of this reactor, see
+        classify_points. Build it once to classify many batches of points.
 
-    Args:
-        outer_radius: float
-        containment_height: float
-        nr_layers: int
-        layers: List[Layer]
-        distance_from_plasma: float
-    """
-    conf_path: str = STOK_CONFIG
-    outer_radius: float = FileReader(STOK_CONFIG).read[0]
-    containment_height: float = FileReader(STOK_CONFIG).read[1]
-    nr_layers: int = int(FileReader(STOK_CONFIG).read[2])
-    distance_from_plasma: float = FileReader(STOK_CONFIG).read[-1]
-    layers: Tuple = field(default=layers_all())
+        Args:
+            ports (bool): the containment has port openings.
+            divertor (bool): the containment has the divertor slot.
 
+        Returns:
+            PointClassifier: the classifier.
+        """
+        return PointClassifier.from_parameters(
+            (self.containment_parameters, self.solenoid_parameters, self.port_parameters,
+             self.limb_parameters, self.limiter_parameters, self.divertor_parameters),
+            ports=ports, divertor=divertor, sector=self.sector)
+
+    def classify_points(self, points, ports: bool = True,
+                        divertor: bool = True) -> Tuple[Any, Any]:
+        """classify_points : Finds the component and containment layer of
+        points, such as tally mesh centroids or source sites, without CAD.
+        The containment is the one of containment_with_divertor_and_ports by
+        default, the divertor and limiter walls take precedence over it.
 
-@dataclass(order=True, frozen=True)
-class SolenoidParameters:
-    """Class that contains the parameters for the solenoid.
+        Args:
+            points (np.ndarray): the points in mm, shape (N, 3).
+            ports (bool): the containment has port openings.
+            divertor (bool): the containment has the divertor slot.
 
-    Args:
-        solenoid_radius: float
-        solenoid_height: float
-    """
-    solenoid_radius: float = FileReader(STOK_CONFIG).read[ContainmentParameters.nr_layers*2+3]
-    solenoid_height: float = FileReader(STOK_CONFIG).read[ContainmentParameters.nr_layers*2+4]
-    bbox_thickness: float = FileReader(STOK_CONFIG).read[ContainmentParameters.nr_layers*2+5]
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: the index of every point's component
+            in stok.classify.COMPONENTS and its containment layer, -1 where
+            there is none.
+        """
+        return self.point_classifier(ports, divertor).classify(points)
 
+    def preview(self, ports: bool = True, divertor: bool = True) -> Preview:
+        """preview : A coarse preview of the whole reactor without CAD, with
+        its r-z sections, collisions and polygon meshes, see stok.preview.
+        It takes milliseconds, so it can be checked after every parameter
+        change before the components are built.
 
-@dataclass(order=True, frozen=True)
-class PortParameters:
-    """Class that contains the parameters for the ports.
+        Args:
+            ports (bool): the containment has port openings.
+            divertor (bool): the containment has the divertor slot.
 
-    Args:
-        nr_ports: int
-        z_side: float
-        y_side: float
-    """
-    nr_ports: int = int(FileReader(STOK_CONFIG).read[ContainmentParameters.nr_layers*2+6])
-    z_side: float = FileReader(STOK_CONFIG).read[ContainmentParameters.nr_layers*2+7]
-    y_side: float = FileReader(STOK_CONFIG).read[ContainmentParameters.nr_layers*2+8]
+        Returns:
+            Preview: the preview, of the full reactor also in sector mode.
+        """
+        return Preview.from_parameters(
+            (self.containment_parameters, self.solenoid_parameters, self.port_parameters,
+             self.limb_parameters, self.limiter_parameters, self.divertor_parameters),
+            ports=ports, divertor=divertor)
 
+    def plasma_source_sampler(self, profile: Optional[Profile] = None,
+                              bins: Tuple[int, int] = (64, 64)) -> PlasmaSourceSampler:
+        """plasma_source_sampler : A sampler of source sites in the plasma
+        source, see stok.source.PlasmaSourceSampler. Only the sector is
+        sampled in sector mode.
 
-@dataclass(order=True, frozen=True)
-class LimbDimensiones:
-    """Class that contains the dimensions for the limbs.
+        Args:
+            profile (Callable, optional): the relative source density,
+            profile(r, z) -> weights in mm, None samples uniformly.
+            bins (Tuple[int, int]): the number of r and z cells of the profile grid.
 
-    Args:
-        limb_length: float
-        limb_height: float
-        limb_width: float
-    """
-    limb_length: float
-    limb_width: float
-    limb_height: float
+        Returns:
+            PlasmaSourceSampler: the sampler.
+        """
+        return PlasmaSourceSampler.from_parameters(
+            self.containment_parameters, self.solenoid_parameters, profile=profile,
+            bins=bins, sector=self.sector)
 
+    def write_plasma_source(self, filename: str, count: int,
+                            profile: Optional[Profile] = None, energy: float = DT_ENERGY,
+                            seed: Optional[int] = None) -> int:
+        """write_plasma_source : Samples source sites in the plasma source and
+        writes them as a Serpent source file, in cm, see
+        stok.source.write_serpent_source.
 
-@dataclass(order=True, frozen=True)
-class LimbParameters:
-    """Class that contains the parameters for the limbs.
+        Args:
+            filename (str): the name of the file.
+            count (int): the number of sites.
+            profile (Callable, optional): the relative source density,
+            profile(r, z) -> weights in mm, None samples uniformly.
+            energy (float): the neutron energy in MeV.
+            seed (int, optional): the seed, the same seed writes the same file.
 
-    Args:
-        nr_limbs: int
-        limb_radius: float -> at what radius the limbs are placed.
-        sphere_radius: float -> the radius of the spheres next to the limb.
-    """
-    nr_limbs: int = int(FileReader(STOK_CONFIG).read[ContainmentParameters.nr_layers*2+9])
-    limb_radius: float = ContainmentParameters.outer_radius + \
-        FileReader(STOK_CONFIG).read[ContainmentParameters.nr_layers*2+10]
-
-    sphere_radius: float = FileReader(STOK_CONFIG).read[ContainmentParameters.nr_layers*2+11]
-    limb_dimensions: LimbDimensiones = LimbDimensiones(
-        FileReader(STOK_CONFIG).read[ContainmentParameters.nr_layers*2+12],
-        FileReader(STOK_CONFIG).read[ContainmentParameters.nr_layers*2+13],
-        FileReader(STOK_CONFIG).read[ContainmentParameters.nr_layers*2+14]
-        if FileReader(STOK_CONFIG).read[ContainmentParameters.nr_layers*2+14] != 0.0
-        else SolenoidParameters.solenoid_height)
-
-
-@dataclass(order=True, frozen=True)
-class LimiterParameters:
-    """Class that contains the parameters for the limiter.
-
-    Attributes:
-        firstwall_thickness: float
-        limiter_gap: float
-        limiter_thickness: float
-    """
-    firstwall_thickness: float = FileReader(STOK_CONFIG).\
-        read[ContainmentParameters.nr_layers*2+15]
-    limiter_gap: float = FileReader(
-        STOK_CONFIG).read[ContainmentParameters.nr_layers*2+16]
-    limiter_thickness: float = FileReader(STOK_CONFIG).\
-        read[ContainmentParameters.nr_layers*2+17]
-
-
-@dataclass(order=True, frozen=True)
-class DivertorParameters:
-    """A class that contains the parameters for the divertor.
-
-    Attributes:
-        divertor_thickness: float
-        divertor_gap: float or bool
-        divertor_firstwall_thickness: float
-        TODO: divertor_shape: float
-    """
-    divertor_firstwall_thickness: float = FileReader(STOK_CONFIG).\
-        read[ContainmentParameters.nr_layers*2+18]
-    divertor_width: float = FileReader(
-        STOK_CONFIG).read[ContainmentParameters.nr_layers*2+19]
-    divertor_gap: float = FileReader(
-        STOK_CONFIG).read[ContainmentParameters.nr_layers*2+20]
-    divertor_thickness: float = FileReader(STOK_CONFIG).\
-        read[ContainmentParameters.nr_layers*2+21]
-    # divertor_shape: float = FileReader( TODO: add shape to divertor.
-    #     STOK_CONFIG).read[ContainmentParameters.nr_layers*2+22]
+        Returns:
+            int: the number of sites written.
+        """
+        with span("write_plasma_source", "export", sites=count):
+            return write_serpent_source(filename, self.plasma_source_sampler(profile), count,
+                                        energy=energy, seed=seed)
 
+    @property
+    def layer_table(self) -> LayerTable:
+        """layer_table : The analytic dimensions of the containment layers,
+        every builder reads its radii and heights from it. It is recomputed
+        when the containment or solenoid parameters are replaced.
 
-class STOK():
-    """The class containing all construction components."""
-    def __init__(self, param_tup: Tuple) -> None:
-        """Intializes the STOK class by passing dataclass objects
-        of the parameters of the reactor.
+        Returns:
+            LayerTable: the layer dimensions.
+        """
 
-        Args:
-            param_tup (Tuple): The tuple of parameters needed to pass
-            to the class so it can have values to construct the reactor from.
+        key = (self.containment_parameters, self.solenoid_parameters)
+        if self._layer_table is None or self._layer_table[0] != key:
+            self._layer_table = (key, layer_table_from_parameters(*key))
+        return self._layer_table[1]
 
-        Raises:
-            TypeError: if the input types are not correct or missing.
-        """
+    @property
+    def chamber(self) -> Tuple[float, float, float]:
+        """chamber : The inner radius, outer radius and height of the space
+        inside the innermost containment layer, the mesh policies refine
+        towards it.
 
-        type_tuple = list(map(type, param_tup))
-        if type_tuple == [ContainmentParameters, SolenoidParameters, PortParameters,
-                          LimbParameters, LimiterParameters, DivertorParameters]:
-            self.containment_parameters = param_tup[0]
-            self.solenoid_parameters = param_tup[1]
-            self.port_parameters = param_tup[2]
-            self.limb_parameters = param_tup[3]
-            self.limiter_parameters = param_tup[4]
-            self.divertor_parameters = param_tup[5]
-        else:
-            raise TypeError("""Wrong input types, expected type ContainmentParameters,
-                            SolenoidParameters, PortParameters, LimbParameters,
-                            LimiterParameters, DivertorParameters in that order.""")
+        Returns:
+            Tuple[float, float, float]: the chamber dimensions.
+        """
+        inner_r, outer_r, height = (float(value) for value in self.layer_table.chamber)
+        return inner_r, outer_r, height
 
+    @cached_builder("solenoid_parameters")
     def central_solenoid(self) -> cq.Workplane:
         """Creates the central solenoid, its parameters
         are controlled by the SolenoidParameters class.
@@ -227,8 +262,13 @@ class STOK():
             circle(self.solenoid_parameters.solenoid_radius).\
             extrude(self.solenoid_parameters.solenoid_height).\
             translate(Vector(0, 0, self.solenoid_parameters.solenoid_height/2))
+
+        if self.sector is not None:
+            solenoid = self.sector.clip(solenoid)
+
         return solenoid
 
+    @cached_builder("containment_parameters", "port_parameters")
     def opening(self, gap: float) -> cq.Workplane:
         """opening : Creates a single component that is used
         to create an opening. Parameters are controlled by
@@ -247,13 +287,9 @@ class STOK():
             rect(self.port_parameters.y_side-gap,
                  self.port_parameters.z_side-gap)
 
-        # Then the opening extrusion depth is calculated and
-        # the port is extruded.
-        extrusion_depth: float = 0.0
-
-        for i in range(self.containment_parameters.nr_layers):
-            extrusion_depth = extrusion_depth +\
-                self.containment_parameters.layers[i].upper_lower_outer
+        # Then the opening extrusion depth is taken from the layer table
+        # and the port is extruded.
+        extrusion_depth: float = float(self.layer_table.total_upper_lower_outer)
 
         # We extrude.
         opening = opening.extrude(extrusion_depth+extrusion_depth*0.5)
@@ -265,6 +301,7 @@ class STOK():
 
         return opening
 
+    @cached_builder("containment_parameters", "port_parameters")
     def openings(self) -> cq.Workplane:
         """openings : Creates the full array of port
         cutting components its parameters are controlled
@@ -276,15 +313,69 @@ class STOK():
         # We call the opening function which gives us
         # a an opening cutter object, which we then rotate
         # into position. Gap is 0 because there is no gap.
-        openings = self.opening(gap=0)
-
-        for i in range(1, self.port_parameters.nr_ports):
-            openings = openings.\
-                union(self.opening(gap=0).
-                      rotate((0, 0, 1), (0, 0, -1), i*360/self.port_parameters.nr_ports))
+        openings = self.polar_array(
+            self.opening(gap=0),
+            [i*360/self.port_parameters.nr_ports for i in range(self.port_parameters.nr_ports)],
+            (0, 0, 1), (0, 0, -1))
 
         return openings
 
+    @traced()
+    def opening_instances(self, gap: float = 0) -> Instanced:
+        """opening_instances : The port cutters as a single opening and
+        the rotations of the copies, see openings.
+
+        Args:
+            gap (float): see opening.
+
+        Raises:
+            ValueError: if the instance has a sector.
+
+        Returns:
+            Instanced: the opening and its copies.
+        """
+        self._require_full_reactor("opening_instances")
+        # openings rotates the copies clockwise, seen from +Z.
+        return Instanced(self.opening(gap=gap), tuple(
+            Transform(angle=-i*360/self.port_parameters.nr_ports)
+            for i in range(self.port_parameters.nr_ports)))
+
+    def polar_array(self, template: cq.Workplane, angles: List[float],
+                    axis_start: Tuple[float, float, float],
+                    axis_end: Tuple[float, float, float],
+                    in_sector: bool = True) -> cq.Workplane:
+        """polar_array : Rotates a template component around an axis
+        and fuses all the copies in a single boolean operation.
+
+        Args:
+            template (cq.Workplane): the component to copy.
+            angles (List[float]): the rotation of each copy in degrees.
+            axis_start (Tuple[float, float, float]): the start of the rotation axis.
+            axis_end (Tuple[float, float, float]): the end of the rotation axis.
+            in_sector (bool): in sector mode, only keep the copies that reach
+            into the sector and clip the result to it. Turn it off if the
+            array is rotated further afterwards.
+
+        Returns:
+            cq.Workplane: the fused copies.
+        """
+
+        shape: cq.Shape = template.val()
+        copies: List[cq.Shape] = [
+            shape if angle == 0 else shape.rotate(Vector(axis_start), Vector(axis_end), angle)
+            for angle in angles]
+
+        sector = self.sector if in_sector else None
+        if sector is not None:
+            copies = [copy for copy in copies if sector.overlaps(copy)] or copies[:1]
+
+        if len(copies) == 1:
+            array = cq.Workplane("XY").add(copies[0])
+        else:
+            array = cq.Workplane("XY").add(copies[0].fuse(*copies[1:]).clean())
+
+        return array if sector is None else sector.clip(array)
+
     def create_torus(self, inner_r: float, outer_r: float, height: float) -> cq.Workplane:
         """create_torus : Creates a rectangular torus.
 
@@ -299,14 +390,20 @@ class STOK():
 
         # First we create the innermost and outermost containment cylinder
         # and subtract one from the other.
-        cylinner: cq.Workplane = cq.Workplane("XY").\
-            cylinder(height, inner_r)
-        cylouter: cq.Workplane = cq.Workplane("XY").\
-            cylinder(height, outer_r)
+        if self.sector is None:
+            cylinner: cq.Workplane = cq.Workplane("XY").\
+                cylinder(height, inner_r)
+            cylouter: cq.Workplane = cq.Workplane("XY").\
+                cylinder(height, outer_r)
+        else:
+            # In sector mode the cylinders are only built inside the sector.
+            cylinner = cq.Workplane("XY").add(self.sector.partial_cylinder(inner_r, height))
+            cylouter = cq.Workplane("XY").add(self.sector.partial_cylinder(outer_r, height))
         torus: cq.Workplane = cylouter.cut(cylinner)
 
         return torus
 
+    @cached_builder("containment_parameters", "solenoid_parameters")
     def containment_layer(self, layer_nr: int) -> cq.Workplane:
         """containment_layer : Creates a containment layer from a
         smaller and a bigger tourus.
@@ -319,39 +416,22 @@ class STOK():
         """
 
         # Creating a containment layer from a smaller and a bigger
-        # tourus.
-        inner_r: float = self.solenoid_parameters.solenoid_radius
-        outer_r: float = self.containment_parameters.outer_radius
-        height: float = self.containment_parameters.containment_height
-
-        # If we are at layer 0 we use the base parameters of inner and outer radius
-        # if not then we use the other ones.
-        if layer_nr == 0:
-            bigger_tourus: cq.Workplane = self.create_torus(
-                inner_r=inner_r, outer_r=outer_r, height=height)
-
-            smaller_torus: cq.Workplane = self.create_torus(
-                inner_r=inner_r + self.containment_parameters.layers[layer_nr].inner,
-                outer_r=outer_r - self.containment_parameters.layers[layer_nr].upper_lower_outer,
-                height=height - self.containment_parameters.layers[layer_nr].upper_lower_outer*2
-                )
-        else:
-            for i in range(layer_nr):
-                inner_r = inner_r + self.containment_parameters.layers[i].inner
-                outer_r = outer_r - self.containment_parameters.layers[i].upper_lower_outer
-                height = height - self.containment_parameters.layers[i].upper_lower_outer*2
-
-            bigger_tourus = self.create_torus(inner_r=inner_r, outer_r=outer_r, height=height)
-            smaller_torus = self.create_torus(
-                inner_r=inner_r + self.containment_parameters.layers[layer_nr].inner,
-                outer_r=outer_r - self.containment_parameters.layers[layer_nr].upper_lower_outer,
-                height=height - self.containment_parameters.layers[layer_nr].upper_lower_outer*2
-                )
+        # tourus, their dimensions are in the layer table.
+        table: LayerTable = self.layer_table
+        bigger_tourus: cq.Workplane = self.create_torus(
+            inner_r=float(table.inner_r[layer_nr]),
+            outer_r=float(table.outer_r[layer_nr]),
+            height=float(table.height[layer_nr]))
+        smaller_torus: cq.Workplane = self.create_torus(
+            inner_r=float(table.hole_inner_r[layer_nr]),
+            outer_r=float(table.hole_outer_r[layer_nr]),
+            height=float(table.hole_height[layer_nr]))
 
         containment: cq.Workplane = bigger_tourus.cut(smaller_torus)
 
         return containment
 
+    @cached_builder("containment_parameters", "solenoid_parameters")
     def containment(self) -> List[cq.Workplane]:
         """containment : Creates the containment layer array
         with no port openings its parameters are controlled
@@ -367,6 +447,7 @@ class STOK():
 
         return containment
 
+    @cached_builder("containment_parameters", "solenoid_parameters", "port_parameters")
     def containment_with_ports(self) -> List[cq.Workplane]:
         """containment_with_ports : Creates the containment layer
         array with port openings its parameters are controlled via
@@ -375,13 +456,10 @@ class STOK():
         Returns:
             List (cq.Workplane): the containment layer list.
         """
-        containment: List[cq.Workplane] = []
-        openings: cq.Workplane = self.openings()
-        for i in range(self.containment_parameters.nr_layers):
-            containment.append(self.containment_layer(i).cut(openings))
-
-        return containment
+        return self.cut_containment(self.containment_cutter(ports=True, divertor=False))
 
+    @cached_builder("containment_parameters", "solenoid_parameters",
+                    "divertor_parameters")
     def containment_with_divertor(self) -> List[cq.Workplane]:
         """containment_with_divertor : Creates the containment layer
         array with divertor openings its parameters are controlled via
@@ -390,13 +468,10 @@ class STOK():
         Returns:
             List (cq.Workplane): the containment layer list.
         """
-        containment: List[cq.Workplane] = []
-        for i in range(self.containment_parameters.nr_layers):
-            containment.append(self.containment_layer(
-                i).cut(self.divertor_cutter()))
-
-        return containment
+        return self.cut_containment(self.containment_cutter(ports=False, divertor=True))
 
+    @cached_builder("containment_parameters", "solenoid_parameters",
+                    "port_parameters", "divertor_parameters")
     def containment_with_divertor_and_ports(self) -> List[cq.Workplane]:
         """containment_with_divertor_and_ports : Creates the containment layer array
         with divertor and port openings its parameters are controlled via the
@@ -405,20 +480,65 @@ class STOK():
         Returns:
             List (cq.Workplane): the containment layer list.
         """
+        return self.cut_containment(self.containment_cutter(ports=True, divertor=True))
+
+    @cached_builder("containment_parameters", "solenoid_parameters",
+                    "port_parameters", "divertor_parameters")
+    def containment_cutter(self, ports: bool, divertor: bool) -> cq.Workplane:
+        """containment_cutter : Creates the single cutting tool for the
+        containment layers, the port and divertor cutters are built once
+        and fused together.
+
+        Args:
+            ports (bool): include the port openings.
+            divertor (bool): include the divertor cutter.
+
+        Raises:
+            ValueError: if neither ports nor divertor are selected.
+
+        Returns:
+            cq.Workplane: the cutting tool.
+        """
+
+        tools: List[cq.Workplane] = []
+        if ports:
+            tools.append(self.openings())
+        if divertor:
+            tools.append(self.divertor_cutter())
+
+        if not tools:
+            raise ValueError("The containment cutter needs ports, divertor or both.")
+
+        if len(tools) == 1:
+            return tools[0]
+
+        return cq.Workplane("XY").add(
+            tools[0].val().fuse(*(tool.val() for tool in tools[1:])).clean())
+
+    def cut_containment(self, cutter: cq.Workplane) -> List[cq.Workplane]:
+        """cut_containment : Cuts every containment layer with the
+        same cutting tool.
+
+        Args:
+            cutter (cq.Workplane): the tool, see containment_cutter.
+
+        Returns:
+            List (cq.Workplane): the containment layer list.
+        """
+
         containment: List[cq.Workplane] = []
         for i in range(self.containment_parameters.nr_layers):
-            containment.append(self.containment_layer(i).
-                               cut(self.openings()).cut(self.divertor_cutter()))
+            containment.append(self.containment_layer(i).cut(cutter))
 
         return containment
 
-    def transformer_limbs(self) -> cq.Workplane:
-        """transformer_limbs : This method constructs the
-        transformer limbs using the parameters defined in
-        the LimbParameter class.
+    @cached_builder("containment_parameters", "limb_parameters")
+    def transformer_limb(self) -> cq.Workplane:
+        """transformer_limb : Creates a single transformer limb on the
+        X axis, the prototype of transformer_limbs.
 
         Returns:
-            cadquery.cq.Workplane: a union of transformer limbs.
+            cq.Workplane: the limb.
         """
 
         # First we create a box with the correct dimensions.
@@ -431,13 +551,23 @@ class STOK():
         box = box.translate(Vector(
             self.limb_parameters.limb_radius+self.containment_parameters.outer_radius, 0, 0))
 
-        # And we construct the full limb union.
-        transformer_limbs: cq.Workplane = box
-        for i in range(1, self.limb_parameters.nr_limbs):
-            transformer_limbs = transformer_limbs.union(box.rotate(
-                (0, 0, 0),
-                (0, 0, 1),
-                360/self.limb_parameters.nr_limbs*i))
+        return box
+
+    @cached_builder("containment_parameters", "limb_parameters")
+    def transformer_limbs(self) -> cq.Workplane:
+        """transformer_limbs : This method constructs the
+        transformer limbs using the parameters defined in
+        the LimbParameter class.
+
+        Returns:
+            cadquery.cq.Workplane: a union of transformer limbs.
+        """
+
+        # We construct the full limb union.
+        transformer_limbs: cq.Workplane = self.polar_array(
+            self.transformer_limb(),
+            [360/self.limb_parameters.nr_limbs*i for i in range(self.limb_parameters.nr_limbs)],
+            (0, 0, 0), (0, 0, 1), in_sector=False)
 
         # Apply the 22.5 deg offset from the limbs.
         transformer_limbs = transformer_limbs.rotate(
@@ -445,8 +575,35 @@ class STOK():
             (0, 0, -1),
             22.5)
 
+        if self.sector is not None:
+            transformer_limbs = self.sector.clip(transformer_limbs)
+
         return transformer_limbs
 
+    def _require_full_reactor(self, builder: str) -> None:
+        """_require_full_reactor : Instances are copies around the full
+        reactor, a sector removes the repetition already."""
+        if self.sector is not None:
+            raise ValueError(f"{builder} does not work on a sector, use the sector "
+                             "builders or the full reactor.")
+
+    @traced()
+    def transformer_limb_instances(self) -> Instanced:
+        """transformer_limb_instances : The transformer limbs as a single
+        limb and the rotations of the copies, see transformer_limbs.
+
+        Raises:
+            ValueError: if the instance has a sector.
+
+        Returns:
+            Instanced: the limb and its copies.
+        """
+        self._require_full_reactor("transformer_limb_instances")
+        # The limbs are offset by 22.5 deg, like in transformer_limbs.
+        return Instanced(self.transformer_limb(),
+                         polar_transforms(self.limb_parameters.nr_limbs, -22.5))
+
+    @cached_builder("containment_parameters", "port_parameters", "limiter_parameters")
     def limiter_firstwall_openings(self):
         """limiter_firstwall_openings : Creates the full array
         of port cutting components with the gap thickness parameter.
@@ -458,17 +615,15 @@ class STOK():
         # Here we call the opening_member function to create a single
         # opening cutter and then rotate it via the Z axis to achieve
         # the port.
-        openings = self.opening(gap=self.limiter_parameters.limiter_gap)
-
-        for i in range(1, self.port_parameters.nr_ports):
-            openings = openings.union(
-                self.opening(gap=self.limiter_parameters.limiter_gap).rotate(
-                    (0, 0, 1),
-                    (0, 0, -1),
-                    i*360/self.port_parameters.nr_ports))
+        openings = self.polar_array(
+            self.opening(gap=self.limiter_parameters.limiter_gap),
+            [i*360/self.port_parameters.nr_ports for i in range(self.port_parameters.nr_ports)],
+            (0, 0, 1), (0, 0, -1))
 
         return openings
 
+    @cached_builder("containment_parameters", "solenoid_parameters",
+                    "port_parameters", "limiter_parameters")
     def limiter_firstwall(self) -> cq.Workplane:
         """limiter_firstwall : A function that creates the
         firstwall limiter set parameters are controlled via
@@ -479,9 +634,7 @@ class STOK():
         """
 
         # First we calculate the position of the firstwall of the cont.
-        outer_sum = 0.0
-        for i in range(self.containment_parameters.nr_layers):
-            outer_sum = outer_sum + self.containment_parameters.layers[i].upper_lower_outer
+        outer_sum = float(self.layer_table.total_upper_lower_outer)
 
         firstwall_torus: cq.Workplane = self.create_torus(
             inner_r=self.containment_parameters.outer_radius-outer_sum,
@@ -496,6 +649,8 @@ class STOK():
 
         return firstwall
 
+    @cached_builder("containment_parameters", "solenoid_parameters",
+                    "port_parameters", "limiter_parameters")
     def limiter_backwall(self) -> cq.Workplane:
         """limiter_backwall : Creates the back of the limiter
         from the firstwall onwards parameters are controlled via
@@ -506,9 +661,7 @@ class STOK():
         """
 
         # First we create a box with the correct dimensions.
-        outer_sum = 0.0
-        for i in range(self.containment_parameters.nr_layers):
-            outer_sum = outer_sum + self.containment_parameters.layers[i].upper_lower_outer
+        outer_sum = float(self.layer_table.total_upper_lower_outer)
         firstwall_torus: cq.Workplane = self.create_torus(
             inner_r=self.containment_parameters.outer_radius-outer_sum +
                 self.limiter_parameters.firstwall_thickness,
@@ -521,6 +674,7 @@ class STOK():
 
         return backwall
 
+    @cached_builder("containment_parameters", "solenoid_parameters", "limb_parameters")
     def bounding_box(self) -> cq.Workplane:
         """bounding_box : Creates the bounding box of the
         reactor parameters accessed form the SolenoidParameters
@@ -548,8 +702,12 @@ class STOK():
 
         bounding_box = bounding_box_outer.cut(bounding_box_inner)
 
+        if self.sector is not None:
+            bounding_box = self.sector.clip(bounding_box)
+
         return bounding_box
 
+    @traced()
     def sphere_pair(self) -> Tuple[cq.Workplane, cq.Workplane]:
         """sphere_pair : Creates spheres, that represent spherical
         detectors, that are used with the limbs parameters are accessed
@@ -575,6 +733,7 @@ class STOK():
 
         return sphere_right, sphere_left
 
+    @traced()
     def sphere_pair_array(self) -> List[List[cq.Workplane]]:
         """sphere_pair_array : Creates an array of sphere pairs.
 
@@ -582,21 +741,60 @@ class STOK():
             List[Tuple[cq.Workplane, cq.Workplane]]: the sphere pair array.
         """
 
+        # The pair is built once and rotated for every limb.
+        sphere_right, sphere_left = self.sphere_pair()
         sphere_pair_array: List[List[cq.Workplane]] = []
         for i in range(self.limb_parameters.nr_limbs):
             sphere_pair_array.append([
-                self.sphere_pair()[0].rotate(
+                sphere_right.rotate(
                     (0, 0, 1),
                     (0, 0, -1),
                     i*360/self.limb_parameters.nr_limbs + 22.5),
-                self.sphere_pair()[1].rotate(
+                sphere_left.rotate(
                     (0, 0, 1),
                     (0, 0, -1),
                     i*360/self.limb_parameters.nr_limbs + 22.5)
             ])
 
+        if self.sector is not None:
+            # Only the spheres that reach into the sector are kept.
+            sphere_pair_array = [
+                [self.sector.clip(sphere) for sphere in pair if self.sector.overlaps(sphere.val())]
+                for pair in sphere_pair_array]
+            sphere_pair_array = [pair for pair in sphere_pair_array if pair]
+
         return sphere_pair_array
 
+    @traced()
+    def sphere_instances(self) -> Instanced:
+        """sphere_instances : The spheres of sphere_pair_array as a single
+        sphere at the origin and the placement of every copy, in the same
+        order as the flattened pair array.
+
+        Raises:
+            ValueError: if the instance has a sector.
+
+        Returns:
+            Instanced: the sphere and its copies.
+        """
+        self._require_full_reactor("sphere_instances")
+
+        sphere: cq.Workplane = cq.Workplane("XY").sphere(self.limb_parameters.sphere_radius)
+        radius = self.limb_parameters.limb_radius + self.containment_parameters.outer_radius
+        offset = self.limb_parameters.sphere_radius + \
+            self.limb_parameters.limb_dimensions.limb_width/2
+
+        transforms: List[Transform] = []
+        for i in range(self.limb_parameters.nr_limbs):
+            # sphere_pair_array rotates clockwise, seen from +Z.
+            angle = -(i*360/self.limb_parameters.nr_limbs + 22.5)
+            for side in (offset, -offset):
+                center = Transform(angle=angle).apply([[radius, side, 0.0]])[0]
+                transforms.append(Transform(angle=angle, translation=tuple(center.tolist())))
+
+        return Instanced(sphere, tuple(transforms))
+
+    @cached_builder("containment_parameters", "solenoid_parameters")
     def plasma_source(self) -> cq.Workplane:
         """plasma_source : Creates the plasma source parameters are
         located in the ContainmentParameters class.
@@ -609,14 +807,8 @@ class STOK():
             cadquery.cq.Workplane: the plasma source.
         """
 
-        inner_r: float = self.solenoid_parameters.solenoid_radius
-        outer_r: float = self.containment_parameters.outer_radius
-        height: float = self.containment_parameters.containment_height
-
-        for i in range(self.containment_parameters.nr_layers):
-            inner_r = inner_r + self.containment_parameters.layers[i].inner
-            outer_r = outer_r - self.containment_parameters.layers[i].upper_lower_outer
-            height = height - self.containment_parameters.layers[i].upper_lower_outer*2
+        # The space inside the innermost layer.
+        inner_r, outer_r, height = self.chamber
 
         smaller_torus = self.create_torus(
             inner_r=inner_r+self.containment_parameters.layers[-1].
@@ -636,13 +828,9 @@ class STOK():
             Tuple[float, float]: the inner and outer radius.
         """
 
-        inner_sum: float = 0.0
-        outer_sum: float = 0.0
-
-        # First we calculate the summ of all thicknesess for the inner and outer radius.
-        for i in range(self.containment_parameters.nr_layers):
-            inner_sum = inner_sum + self.containment_parameters.layers[i].inner
-            outer_sum = outer_sum + self.containment_parameters.layers[i].upper_lower_outer
+        # First we take the summ of all thicknesess for the inner and outer radius.
+        inner_sum: float = float(self.layer_table.total_inner)
+        outer_sum: float = float(self.layer_table.total_upper_lower_outer)
 
         # Then we add the radius of the containment to each
         inner_sum = inner_sum + self.solenoid_parameters.solenoid_radius
@@ -650,6 +838,8 @@ class STOK():
 
         return inner_sum, outer_sum
 
+    @cached_builder("containment_parameters", "solenoid_parameters",
+                    "divertor_parameters")
     def divertor_cutter(self) -> cq.Workplane:
         """divertor_cutter : Creates the containment cuting component
         for divertor placement, its parameters are contained in the
@@ -672,6 +862,8 @@ class STOK():
 
         return cutter_torus
 
+    @cached_builder("containment_parameters", "solenoid_parameters",
+                    "divertor_parameters")
     def divertor_firstwall(self) -> cq.Workplane:
         """divertor_firstwall : The firstwall of the divertor - i.e.
         the plasma facing component.
@@ -700,6 +892,8 @@ class STOK():
 
         return firstwall_torus
 
+    @cached_builder("containment_parameters", "solenoid_parameters",
+                    "divertor_parameters")
     def divertor_backwall(self) -> cq.Workplane:
         """divertor_backwall : The backwall of the divertor - i.e.
         the component behind the plasma facing component.
@@ -730,67 +924,331 @@ class STOK():
         return backwall_torus
 
     def export_to_stl(self,
-                    the_solid: str,
+                    the_solid: Union[str, cq.Workplane, cq.Shape],
                     max_triangle_size: float,
                     filename: str,
-                    exp_factor) -> None:
-        # TODO: gmsh/model/occ/importShapesNativePointer for direct CQ to OCC,
-        # no step conversion needed mby sorta kinda doesnt work.
-        """export_to_stl : Exports a step file as an stl file.
+                    exp_factor=None,
+                    transfer: str = "auto",
+                    binary: bool = False,
+                    component: Optional[str] = None,
+                    check: bool = False) -> Optional[MeshReport]:
+        """export_to_stl : Exports a component or a step file as an stl file.
+        With a mesh_cache, a component meshed before with the same options is
+        written from the cache, see stok.meshing.BatchExporter.export.
 
         Args:
-            the_solid (str): the step file to be exported.
+            the_solid (str, cq.Workplane or cq.Shape): the component, or the
+            step file to be exported. Components are handed to gmsh in memory.
             max_triangle_size (float): the maximum size of the side of a triangle.
             filename (str): the name of the file.
+            exp_factor: deprecated, a value other than None gives a
+            FutureWarning, see stok.meshing.set_mesh_options.
+            transfer (str): how components are handed to gmsh, "auto", "pointer"
+            or "brep", see stok.meshing.import_shape.
+            binary (bool): write a binary stl file, see stok.meshing.write_stl.
+            component (str, optional): the builder the mesh policy is taken
+            from, see stok.meshing.MESH_POLICIES. Defaults to the filename.
+            check (bool): check that the stl file is watertight and encloses
+            the volume of the component, see stok.stl_check.
+        Returns:
+            MeshReport or None: the check of the stl file, if asked for.
         """
-        cpus = os.cpu_count()
+        _warn_exp_factor(exp_factor)
+        if self.mesh_cache is not None:
+            with BatchExporter(max_triangle_size, None, transfer=transfer, binary=binary,
+                               chamber=self.chamber, mesh_cache=self.mesh_cache) as exporter:
+                exporter.export(the_solid, filename, component=component)
+            return check_written_stl(filename, the_solid) if check else None
+
+        policy = policy_for(filename if component is None else component)
 
         gmsh.initialize()
-        gmsh.model.add("member")
+        try:
+            gmsh.model.add("member")
+
+            with span("export_to_stl", "export", filename=filename):
+                # Import the component as a OCCT shape.
+                with span("import", "export"):
+                    import_shape(the_solid, transfer=transfer)
+
+                # Push the solid to the gmsh model.
+                with span("synchronize", "export"):
+                    gmsh.model.occ.synchronize()
+
+                apply_mesh_policy(policy, max_triangle_size, self.chamber)
+
+                # Generate surface mesh.
+                with span("generate", "export") as current:
+                    gmsh.model.mesh.generate(2)
+                    triangles = triangle_count()
+                    current.set(triangles=triangles)
+                check_triangle_budget(policy, triangles, filename)
+
+                # Write the mesh to file.
+                with span("write", "export", binary=binary):
+                    write_stl(filename, binary)
+        finally:
+            gmsh.finalize()
+
+        return check_written_stl(filename, the_solid) if check else None
+
+    def export_instances_to_stl(self,
+                                instanced: Instanced,
+                                max_triangle_size: float,
+                                filename: str,
+                                exp_factor=None,
+                                transfer: str = "auto",
+                                binary: bool = False,
+                                copies: bool = True,
+                                component: Optional[str] = None,
+                                check: bool = False) -> Dict[str, Any]:
+        """export_instances_to_stl : Exports a repeated component, such as
+        transformer_limb_instances or sphere_instances, by meshing its
+        prototype once.
 
-        # Import the step file as a OCCT shape.
-        gmsh.model.occ.importShapes(the_solid)
+        Args:
+            instanced (Instanced): the prototype and its copies.
+            max_triangle_size (float): the maximum size of the side of a triangle.
+            filename (str): the name of the file, copy i is written to name_i.stl.
+            exp_factor: deprecated, see export_to_stl.
+            transfer (str): how the prototype is handed to gmsh, see export_to_stl.
+            binary (bool): write binary stl files, see export_to_stl.
+            copies (bool): write every copy, otherwise only the prototype is
+            written and the copies are placed by the Serpent cards.
+            component (str, optional): the builder the mesh policy is taken
+            from, defaults to the filename.
+            check (bool): check every stl file, see export_to_stl.
 
-        # Push the solid to the gmsh model.
-        gmsh.model.occ.synchronize()
+        Returns:
+            Dict[str, Any]: the timings and files, see
+            stok.meshing.BatchExporter.export_instances, and in "serpent" the
+            trans cards of the copies, for universes named after the file.
+        """
 
-        if "containment" in filename:
-            gmsh.option.setNumber("Mesh.MeshSizeMin", max_triangle_size)
-            #gmsh.option.setNumber("Mesh.MeshSizeMax", 1000)
-            gmsh.model.mesh.field.add("MathEval", 1)
-            gmsh.model.mesh.field.setString(1, "F", f"(x^2+y^2)^({exp_factor})/10")
+        _warn_exp_factor(exp_factor)
+        with BatchExporter(max_triangle_size, None, transfer=transfer,
+                           binary=binary, chamber=self.chamber, check=check) as exporter:
+            report = exporter.export_instances(instanced, filename, copies=copies,
+                                               component=component)
+        universe = os.path.splitext(os.path.basename(filename))[0]
+        report["serpent"] = instanced.serpent_cards(universe)
+        return report
+
+    def export_many_to_stl(self,
+                           components: Mapping[str, Union[str, cq.Workplane, cq.Shape]],
+                           max_triangle_size: float,
+                           exp_factor=None,
+                           mesh_options: Optional[Mapping[str, Mapping[str, Any]]] = None,
+                           transfer: str = "auto",
+                           binary: bool = False,
+                           check: bool = False) -> List[Dict[str, Any]]:
+        """export_many_to_stl : Exports several components as stl files in a
+        single gmsh session.
 
-            gmsh.model.mesh.field.add("Min", 7)
-            gmsh.model.mesh.field.setNumbers(7, "FieldsList", [1])
+        Args:
+            components (Mapping[str, ...]): the stl filename of every component
+            and the component or its step file.
+            max_triangle_size (float): the maximum size of the side of a triangle.
+            exp_factor: deprecated, see export_to_stl.
+            mesh_options (Mapping[str, Mapping[str, Any]], optional): per
+            filename keyword arguments of BatchExporter.export, e.g. a
+            max_triangle_size, component or policy.
+            transfer (str): how components are handed to gmsh, see export_to_stl.
+            binary (bool): write binary stl files, see export_to_stl.
+            check (bool): check every stl file, see export_to_stl.
 
-            gmsh.model.mesh.field.setAsBackgroundMesh(7)
+        Returns:
+            List[Dict[str, Any]]: the timings and triangle count of each component.
+        """
 
-            # We have to set these to avoid wierd errors.
-            gmsh.option.setNumber("Mesh.MeshSizeExtendFromBoundary", 0)
-            gmsh.option.setNumber("Mesh.MeshSizeFromPoints", 0)
-            gmsh.option.setNumber("Mesh.MeshSizeFromCurvature", 0)
+        mesh_options = {} if mesh_options is None else mesh_options
+        reports: List[Dict[str, Any]] = []
+        _warn_exp_factor(exp_factor)
+        with BatchExporter(max_triangle_size, None, transfer=transfer,
+                           binary=binary, chamber=self.chamber, check=check,
+                           mesh_cache=self.mesh_cache) as exporter:
+            for filename, the_solid in components.items():
+                reports.append(exporter.export(the_solid, filename,
+                                               **mesh_options.get(filename, {})))
+        return reports
+
+    def export_tuned_to_stl(self,
+                            components: Mapping[str, Union[str, cq.Workplane, cq.Shape]],
+                            max_triangle_size: float,
+                            triangle_budget: Optional[int] = None,
+                            max_deviation: Optional[float] = None,
+                            tuning_options: Optional[Mapping[str, Mapping[str, Any]]] = None,
+                            transfer: str = "auto",
+                            binary: bool = False,
+                            check: bool = False) -> List[Dict[str, Any]]:
+        """export_tuned_to_stl : Exports several components as stl files, each
+        with the triangle size that keeps to its triangle budget and the
+        maximum chordal deviation, see stok.meshing.tune_mesh. Only the triangle
+        size and the curvature refinement are tuned, exp_factor does nothing.
 
-        elif ("transformer" or "bbox") in filename:
-            gmsh.option.setNumber("Mesh.MeshSizeMax", max_triangle_size)
+        Args:
+            components (Mapping[str, ...]): the stl filename of every component
+            and the component or its step file.
+            max_triangle_size (float): the size the search starts from, the
+            first meshes are 4 and 2 times coarser.
+            triangle_budget (int, optional): the budget of every component,
+            defaults to the budget of its mesh policy.
+            max_deviation (float, optional): the largest chordal deviation in mm.
+            tuning_options (Mapping[str, Mapping[str, Any]], optional): per
+            filename keyword arguments of BatchExporter.export_tuned, e.g. a
+            triangle_budget, max_deviation or component.
+            transfer (str): how components are handed to gmsh, see export_to_stl.
+            binary (bool): write binary stl files, see export_to_stl.
+            check (bool): check every stl file, see export_to_stl.
 
-        else:
-            #gmsh.option.setNumber("Mesh.MeshSizeMax", 1000)
-            gmsh.option.setNumber("Mesh.MeshSizeFromCurvature", 20)
+        Returns:
+            List[Dict[str, Any]]: the timings, triangle count and, in "tuning",
+            the chosen settings and achieved deviation of each component.
+        """
 
-        # Finally, let's specify a global mesh size and mesh the partitioned model:
-        #gmsh.option.setNumber("Mesh.MeshSizeMin", 3)
-        gmsh.option.setNumber("Mesh.MeshSizeMax", max_triangle_size)
+        tuning_options = {} if tuning_options is None else tuning_options
+        reports: List[Dict[str, Any]] = []
+        with BatchExporter(max_triangle_size, None, transfer=transfer, binary=binary,
+                           chamber=self.chamber, check=check) as exporter:
+            for filename, the_solid in components.items():
+                options = {"triangle_budget": triangle_budget, "max_deviation": max_deviation,
+                           **tuning_options.get(filename, {})}
+                reports.append(exporter.export_tuned(the_solid, filename, **options))
+        return reports
+
+    def export_pipelined_to_stl(self,
+                                components: Sequence[str],
+                                directory: str,
+                                max_triangle_size: float,
+                                exp_factor=None,
+                                cores: Optional[int] = None,
+                                mesh_threads: Optional[int] = None,
+                                binary: bool = False,
+                                check: bool = False) -> Iterator[Dict[str, Any]]:
+        """export_pipelined_to_stl : Builds and meshes the components
+        concurrently in worker processes and yields the report of every stl
+        file as it is written, see stok.pipeline.export_pipelined. The
+        geometry cache directory of the instance, if any, is shared with the
+        workers.
 
-        # Set nr of cores to run on.
-        gmsh.option.setNumber("General.NumThreads", cpus)
+        Args:
+            components (Sequence[str]): the STOK builders to export.
+            directory (str): where the stl files are written, one per part.
+            max_triangle_size (float): the maximum size of the side of a triangle.
+            exp_factor: deprecated, see export_to_stl.
+            cores (int, optional): the core budget, defaults to the cpu count.
+            mesh_threads (int, optional): the gmsh threads of every mesh task.
+            binary (bool): write binary stl files, see export_to_stl.
+            check (bool): check every stl file, see export_to_stl.
+
+        Yields:
+            Dict[str, Any]: the report of every stl file, in the order they
+            are written.
+        """
+        _warn_exp_factor(exp_factor)
+        cache_dir = None if self.geometry_cache is None else self.geometry_cache.directory
+        yield from export_pipelined(
+            (self.containment_parameters, self.solenoid_parameters, self.port_parameters,
+             self.limb_parameters, self.limiter_parameters, self.divertor_parameters),
+            components, directory, max_triangle_size, cores=cores,
+            mesh_threads=mesh_threads, binary=binary, check=check, sector=self.sector,
+            cache_dir=cache_dir)
+
+    def export_conformal_to_stl(self,
+                                components: List[str],
+                                directory: str,
+                                max_triangle_size: float,
+                                exp_factor=None,
+                                transfer: str = "auto",
+                                binary: bool = False,
+                                check: bool = False) -> Dict[str, Any]:
+        """export_conformal_to_stl : Meshes the parts of several components in
+        one gmsh model and writes an stl file for every part. Surfaces shared
+        by two parts, like the interfaces of the containment layers, are
+        meshed once, so neighbouring stl files have no gaps or overlaps
+        between them and the interfaces are not meshed twice.
 
-        # Type of meshing algorithm.
-        gmsh.option.setNumber("Mesh.Algorithm", 6)
-        gmsh.option.setNumber("Mesh.AngleToleranceFacetOverlap", 0.1)
+        Args:
+            components (List[str]): the STOK builders to export, e.g.
+            ["containment_with_divertor_and_ports", "divertor_firstwall",
+            "divertor_backwall"]. The mesh policy of the first one is used.
+            directory (str): where the stl files are written.
+            max_triangle_size (float): the maximum size of the side of a triangle.
+            exp_factor: deprecated, see export_to_stl.
+            transfer (str): how components are handed to gmsh, see export_to_stl.
+            binary (bool): write binary stl files, see export_to_stl.
+            check (bool): check every stl file, see export_to_stl.
 
-        # Generate surface mesh.
-        gmsh.model.mesh.generate(2)
+        Returns:
+            Dict[str, Any]: the timings and triangle counts, see
+            stok.meshing.BatchExporter.export_conformal.
+        """
+
+        os.makedirs(directory, exist_ok=True)
+        solids: Dict[str, cq.Workplane] = {}
+        for component in components:
+            for name, part in named_parts(component, getattr(self, component)()):
+                solids[os.path.join(directory, name + ".stl")] = part
+
+        _warn_exp_factor(exp_factor)
+        with BatchExporter(max_triangle_size, None, transfer=transfer,
+                           binary=binary, chamber=self.chamber, check=check) as exporter:
+            return exporter.export_conformal(solids, component=components[0])
+
+    def export_sector_to_stl(self,
+                             components: List[str],
+                             directory: str,
+                             max_triangle_size: float,
+                             exp_factor=None,
+                             universe: str = "sector",
+                             binary: bool = False,
+                             check: bool = False) -> Dict[str, Any]:
+        """export_sector_to_stl : Builds and exports the sector of every
+        component and writes sector.json, with the rotations and the Serpent
+        cards needed to use the sector for the full reactor.
+
+        Args:
+            components (List[str]): the STOK builders to export.
+            directory (str): where the stl files and sector.json are written.
+            max_triangle_size (float): the maximum size of the side of a triangle.
+            exp_factor: deprecated, see export_to_stl.
+            universe (str): the Serpent universe name used in the cards.
+            binary (bool): write binary stl files, see export_to_stl.
+            check (bool): check every stl file, see export_to_stl. The result
+            is added to sector.json.
+
+        Raises:
+            ValueError: if the instance has no sector, see sector_view.
+
+        Returns:
+            Dict[str, Any]: the contents of sector.json.
+        """
 
-        # Write the mesh to file.
-        gmsh.write(filename)
-        gmsh.finalize()
+        if self.sector is None:
+            raise ValueError("export_sector_to_stl needs a sector, use sector_view first.")
+
+        os.makedirs(directory, exist_ok=True)
+        files: Dict[str, str] = {}
+        solids: Dict[str, cq.Workplane] = {}
+        for component in components:
+            for name, part in named_parts(component, getattr(self, component)()):
+                files[name] = os.path.join(directory, name + ".stl")
+                solids[files[name]] = part
+
+        _warn_exp_factor(exp_factor)
+        reports = self.export_many_to_stl(solids, max_triangle_size, None,
+                                          binary=binary, check=check)
+
+        manifest = self.sector.manifest(files)
+        manifest["triangles"] = {report["filename"]: report["triangles"] for report in reports}
+        if check:
+            manifest["checks"] = {report["filename"]: report["check"] for report in reports}
+        manifest["serpent"] = {
+            "periodic": serpent_symmetry_card(self.sector, universe, "periodic"),
+            "reflective": serpent_symmetry_card(self.sector, universe, "reflective"),
+            "replication": serpent_rotation_cards(self.sector, universe)}
+
+        with open(os.path.join(directory, "sector.json"), "w", encoding="utf8") as file:
+            json.dump(manifest, file, indent=2)
+
+        return manifest
@@ -0,0 +1,313 @@
+"""Studies of many STOK designs in one file: a base design and a table of
+variants, with the names of the ConfigValues fields, or limb_radius as in
+LimbParameters, like stok-sweep --grid. The table is read and
+validated once into one array per field, and the configuration, parameters
+or STOK object of a variant are only created when asked for. Like
+stok.config and stok.parameters, this module does not load cadquery or gmsh.
+
+JSON and TOML files hold a "base" mapping, or the path of a configuration
+file, and "variants", either as a list of mappings or as a mapping of
+equally long columns:
+
+    {"base": {"nr_ports": 16},
+     "variants": {"divertor_width": [300, 400], "limiter_gap": [10, 15]}}
+
+CSV files have one variant per row and a header with the field names, the
+base is passed to load_study. Layers are given as [[upper_lower_outer, inner],
+...], in CSV as JSON text. Configuration files in the positional format are
+studies of a single design.
+"""
+import csv
+import json
+import math
+import os
+from dataclasses import dataclass
+from typing import Any, Dict, Iterator, List, Mapping, Sequence, Tuple, Union
+
+import numpy as np
+
+from .config import CONFIG_FIELDS, ConfigValues, _to_layer, config_from_mapping, load_config
+
+# Fields that have to be whole numbers of at least one.
+_COUNT_FIELDS = ("nr_ports", "nr_limbs")
+
+# Fields that are not numbers.
+_OTHER_FIELDS = ("layers", "nr_layers")
+
+# Names of the parameter dataclasses that are not ConfigValues fields, they
+# are turned into those by config_from_mapping.
+_PARAMETER_FIELDS = ("nr_layers", "limb_radius")
+
+
+def _read_toml(path: str) -> Dict[str, Any]:
+    """_read_toml : Reads a TOML file with tomllib, or tomli before Python 3.11."""
+    try:
+        import tomllib  # pylint: disable=import-outside-toplevel
+    except ImportError:
+        try:
+            import tomli as tomllib  # pylint: disable=import-outside-toplevel
+        except ImportError as error:
+            raise ImportError("Reading TOML studies needs Python 3.11 or the tomli "
+                              "package, use JSON or CSV instead.") from error
+    with open(path, "rb") as file:
+        return tomllib.load(file)
+
+
+def _read_csv(path: str) -> Dict[str, List[Any]]:
+    """_read_csv : Reads the columns of a CSV file, layers are parsed as JSON."""
+    with open(path, "r", encoding="utf8", newline="") as file:
+        rows = list(csv.reader(file))
+    if not rows:
+        return {}
+    header = [name.strip() for name in rows[0]]
+    body = [row for row in rows[1:] if any(cell.strip() for cell in row)]
+    if any(len(row) != len(header) for row in body):
+        raise ValueError(f"Every row of {path} needs {len(header)} values.")
+    columns: Dict[str, List[Any]] = {name: [row[i] for row in body]
+                                     for i, name in enumerate(header)}
+    if "layers" in columns:
+        columns["layers"] = [json.loads(cell) if cell.strip() else None
+                             for cell in columns["layers"]]
+    return columns
+
+
+def _columns(variants: Union[Sequence[Mapping[str, Any]], Mapping[str, Sequence[Any]]]
+             ) -> Tuple[Dict[str, List[Any]], int]:
+    """_columns : Turns a list of mappings or a mapping of columns into columns.
+
+    Returns:
+        Tuple[Dict[str, List[Any]], int]: the columns and the number of variants.
+    """
+
+    if isinstance(variants, Mapping):
+        lengths = {name: len(values) for name, values in variants.items()}
+        if len(set(lengths.values())) > 1:
+            raise ValueError(f"The variant columns have different lengths: {lengths}")
+        return {name: list(values) for name, values in variants.items()}, \
+            next(iter(lengths.values()), 0)
+
+    names = sorted({name for row in variants for name in row})
+    # Missing values are filled in from the base later.
+    return {name: [row.get(name) for row in variants] for name in names}, len(variants)
+
+
+@dataclass(frozen=True, eq=False)
+class Study:
+    """A base design and the changed values of every variant, one array per
+    changed field. Missing values of a variant are taken from the base.
+
+    Args:
+        base: ConfigValues -> the base design.
+        columns: Dict[str, np.ndarray] -> the values of every variant, float64
+        for lengths, int64 for counts and object arrays of Layer tuples for
+        the layers.
+        size: int -> the number of variants, a study without a variant table
+        has the base as its single variant.
+    """
+    base: ConfigValues
+    columns: Dict[str, np.ndarray]
+    size: int
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __iter__(self) -> Iterator[ConfigValues]:
+        return (self.config(i) for i in range(self.size))
+
+    def overrides(self, index: int) -> Dict[str, Any]:
+        """overrides : The values a variant changes, as plain Python values
+        that can be written as JSON, the layers as (upper_lower_outer, inner)
+        pairs.
+
+        Args:
+            index (int): the variant.
+
+        Returns:
+            Dict[str, Any]: the values, with the ConfigValues names.
+        """
+        output = {name: column[index].item() for name, column in self.columns.items()
+                  if name != "layers" and not (name == "limb_radius" and
+                                               math.isnan(column[index]))}
+        if "layers" in self.columns:
+            output["layers"] = [(layer.upper_lower_outer, layer.inner)
+                                for layer in self.columns["layers"][index]]
+        return output
+
+    def variants(self) -> List[Dict[str, Any]]:
+        """variants : The overrides of every variant, e.g. for run_sweep
+        with the base of the study.
+
+        Returns:
+            List[Dict[str, Any]]: one mapping per variant.
+        """
+        return [self.overrides(i) for i in range(self.size)]
+
+    def config(self, index: int) -> ConfigValues:
+        """config : The configuration values of a variant.
+
+        Args:
+            index (int): the variant.
+
+        Returns:
+            ConfigValues: the values.
+        """
+        return config_from_mapping(self.overrides(index), base=self.base)
+
+    def parameters(self, index: int) -> Tuple:
+        """parameters : The parameter dataclasses of a variant.
+
+        Args:
+            index (int): the variant.
+
+        Returns:
+            Tuple: the parameters, as passed to STOK.
+        """
+        from .parameters import parameters_from_config  # pylint: disable=import-outside-toplevel
+
+        return parameters_from_config(self.config(index))
+
+    def reactor(self, index: int, **kwargs: Any):
+        """reactor : The STOK object of a variant, this loads cadquery and gmsh.
+
+        Args:
+            index (int): the variant.
+            kwargs: passed to STOK, e.g. a geometry_cache.
+
+        Returns:
+            STOK: the reactor.
+        """
+        from .stok_modules import STOK  # pylint: disable=import-outside-toplevel
+
+        return STOK(self.parameters(index), **kwargs)
+
+
+def _base_values(base: Union[str, Mapping[str, Any], ConfigValues, None]) -> ConfigValues:
+    """_base_values : Loads a base design, mappings are applied over the
+    bundled STOK_CONFIG."""
+    if base is None or isinstance(base, str):
+        return load_config(base)
+    if isinstance(base, ConfigValues):
+        return base
+    return config_from_mapping(base, base=load_config())
+
+
+def study_from_variants(variants: Union[Sequence[Mapping[str, Any]],
+                                        Mapping[str, Sequence[Any]], None],
+                        base: Union[str, Mapping[str, Any], ConfigValues, None] = None,
+                        source: str = "") -> Study:
+    """study_from_variants : Validates a table of variants into a Study.
+
+    Args:
+        variants (Sequence[Mapping] or Mapping[str, Sequence], optional): the
+        variants as a list of mappings or as columns, None for a study of the
+        base alone.
+        base (str, Mapping, ConfigValues, optional): the base design, a
+        configuration file, a mapping over the bundled design or loaded values.
+        Defaults to the bundled STOK_CONFIG.
+        source (str): where the variants come from, used in the errors.
+
+    Raises:
+        KeyError: if a field is unknown.
+        ValueError: if a value is not a number, is negative or a count is not
+        a whole number of at least one, or the layers do not match nr_layers.
+
+    Returns:
+        Study: the study.
+    """
+
+    base_values = _base_values(base)
+    if variants is None:
+        return Study(base=base_values, columns={}, size=1)
+
+    raw, size = _columns(variants)
+    where = f" in {source}" if source else ""
+    # The file a variant comes from is the study, not a field of the variant.
+    unknown = set(raw) - (set(CONFIG_FIELDS) - {"conf_path"} | set(_PARAMETER_FIELDS))
+    if unknown:
+        raise KeyError(f"Unknown configuration keys{where}: {sorted(unknown)}")
+
+    # A missing limb_radius is NaN, so the limb_distance of the variant is kept.
+    defaults = dict(base_values.as_dict(), limb_radius=math.nan)
+    columns: Dict[str, np.ndarray] = {}
+    for name, values in raw.items():
+        if name in _OTHER_FIELDS:
+            continue
+        values = [defaults[name] if value is None or value == "" else value for value in values]
+        try:
+            column = np.asarray(values, dtype=np.float64)
+        except (TypeError, ValueError) as error:
+            raise ValueError(f"{name} has values that are not numbers{where}.") from error
+        bad = ~np.isfinite(column) | (column < 0)
+        if name == "limb_radius":
+            bad &= ~np.isnan(column)
+        if name in _COUNT_FIELDS:
+            bad |= (column < 1) | (column != np.round(column))
+        if np.any(bad):
+            row = int(np.argmax(bad))
+            expected = "a whole number of at least 1" if name in _COUNT_FIELDS \
+                else "a non-negative number"
+            raise ValueError(f"{name} of variant {row}{where} is {values[row]!r}, "
+                             f"expected {expected}.")
+        columns[name] = column.astype(np.int64) if name in _COUNT_FIELDS else column
+
+    if "layers" in raw:
+        layers = np.empty(size, dtype=object)
+        for i, value in enumerate(raw["layers"]):
+            value = defaults["layers"] if value is None else value
+            layers[i] = tuple(_to_layer(layer) for layer in value)
+            if any(min(layer.upper_lower_outer, layer.inner) < 0 for layer in layers[i]):
+                raise ValueError(f"The layers of variant {i}{where} have a negative thickness.")
+        columns["layers"] = layers
+    if "nr_layers" in raw:
+        nr_layers = [len(layers) for layers in columns.get("layers", [defaults["layers"]]*size)]
+        for i, (value, expected) in enumerate(zip(raw["nr_layers"], nr_layers)):
+            if value not in (None, "") and int(float(value)) != expected:
+                raise ValueError(f"nr_layers of variant {i}{where} is {value} but "
+                                 f"{expected} layers were given.")
+
+    return Study(base=base_values, columns=columns, size=size)
+
+
+def load_study(path: str, base: Union[str, Mapping[str, Any], ConfigValues, None] = None
+               ) -> Study:
+    """load_study : Reads a study from a JSON, TOML or CSV file, or a single
+    design from a configuration file in the positional format.
+
+    Args:
+        path (str): the file, the format is taken from the extension.
+        base (str, Mapping, ConfigValues, optional): the base design, used when
+        the file has none (CSV files never do). A base in the file is applied
+        over it, paths in the file are relative to the file.
+
+    Raises:
+        KeyError: if a field is unknown.
+        ValueError: if a value is invalid, see study_from_variants.
+
+    Returns:
+        Study: the study.
+    """
+
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".csv":
+        return study_from_variants(_read_csv(path), base, source=path)
+
+    if extension not in (".json", ".toml"):
+        return study_from_variants(None, load_config(path), source=path)
+
+    if extension == ".json":
+        with open(path, "r", encoding="utf8") as file:
+            content = json.load(file)
+    else:
+        content = _read_toml(path)
+
+    unknown = set(content) - {"base", "variants"}
+    if unknown:
+        raise KeyError(f"Unknown sections in {path}: {sorted(unknown)}, "
+                       f"expected base and variants.")
+
+    file_base = content.get("base")
+    if isinstance(file_base, str):
+        base = load_config(os.path.join(os.path.dirname(os.path.abspath(path)), file_base))
+    elif file_base is not None:
+        base = config_from_mapping(file_base, base=_base_values(base))
+    return study_from_variants(content.get("variants"), base, source=path)
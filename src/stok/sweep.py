@@ -0,0 +1,263 @@
+"""Parameter sweeps over many STOK variants. Every variant is built and
+exported in its own worker process, since neither gmsh nor OCC is thread
+safe, and a manifest with the timings of every variant is written at the end.
+
+Example:
+    python -m stok.sweep --output sweep_out --grid "nr_ports=[8, 16]" \\
+        --grid "divertor_width=[300, 400]" --max-triangle-size 200
+"""
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import sys
+import time
+import traceback
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Mapping, Optional, Sequence, Union
+
+from .config import ConfigValues, config_from_mapping, load_config
+
+DEFAULT_COMPONENTS = ("containment_with_divertor_and_ports", "transformer_limbs",
+                      "limiter_firstwall", "limiter_backwall", "divertor_firstwall",
+                      "divertor_backwall", "central_solenoid", "bounding_box")
+
+
+def grid(**axes: Sequence[Any]) -> List[Dict[str, Any]]:
+    """grid : Creates the overrides for every combination of the given values.
+
+    Args:
+        axes: the values to try for each ConfigValues name.
+
+    Returns:
+        List[Dict[str, Any]]: one override mapping per variant.
+    """
+    names = list(axes)
+    return [dict(zip(names, values)) for values in itertools.product(*axes.values())]
+
+
+def run_variant(base: ConfigValues, overrides: Mapping[str, Any], directory: str,
+                components: Sequence[str], max_triangle_size: float,
+                exp_factor: Optional[float] = None, cache_dir: Optional[str] = None,
+                binary: bool = False, check: bool = False,
+                mesh_cache_dir: Optional[str] = None) -> Dict[str, Any]:
+    """run_variant : Builds and exports the components of a single variant.
+    This runs inside the worker processes.
+
+    Args:
+        base (ConfigValues): the base design.
+        overrides (Mapping[str, Any]): the values changed in this variant.
+        directory (str): where the STL files of the variant are written.
+        components (Sequence[str]): the STOK builders to run.
+        max_triangle_size (float): passed to export_to_stl.
+        exp_factor (float, optional): deprecated, see export_to_stl.
+        cache_dir (str, optional): a geometry cache directory shared by the workers.
+        binary (bool): write binary STL files.
+        check (bool): check that every STL file is watertight, the status
+        becomes "leaky" if one is not.
+        mesh_cache_dir (str, optional): a mesh cache directory shared by the
+        workers, components a variant leaves unchanged are not meshed again.
+
+    Returns:
+        Dict[str, Any]: the manifest entry of the variant.
+    """
+
+    # Imported here so the coordinating process never loads cadquery or gmsh.
+    from .geometry_cache import GeometryCache  # pylint: disable=import-outside-toplevel
+    from .mesh_cache import MeshCache  # pylint: disable=import-outside-toplevel
+    from .meshing import BatchExporter  # pylint: disable=import-outside-toplevel
+    from .stok_modules import (STOK, named_parts,  # pylint: disable=import-outside-toplevel
+                               parameters_from_config)
+
+    entry: Dict[str, Any] = {"overrides": dict(overrides), "directory": directory,
+                             "status": "ok", "components": {}, "files": []}
+    start = time.perf_counter()
+    try:
+        os.makedirs(directory, exist_ok=True)
+        cache = GeometryCache(cache_dir) if cache_dir is not None else None
+        mesh_cache = MeshCache(mesh_cache_dir) if mesh_cache_dir is not None else None
+        reactor = STOK(parameters_from_config(config_from_mapping(overrides, base=base)),
+                       geometry_cache=cache)
+
+        # One gmsh session is used for all components of the variant.
+        with BatchExporter(max_triangle_size, exp_factor, binary=binary,
+                           chamber=reactor.chamber, check=check,
+                           mesh_cache=mesh_cache) as exporter:
+            for component in components:
+                timing = {"build": 0.0, "export": 0.0, "triangles": 0}
+                tic = time.perf_counter()
+                parts = named_parts(component, getattr(reactor, component)())
+                timing["build"] = time.perf_counter() - tic
+
+                tic = time.perf_counter()
+                for name, part in parts:
+                    stl_file = os.path.join(directory, name + ".stl")
+                    report = exporter.export(part, stl_file, component=component)
+                    timing["triangles"] += report["triangles"]
+                    entry["files"].append(stl_file)
+                    if check:
+                        entry.setdefault("checks", {})[stl_file] = report["check"]
+                        if not report["check"]["watertight"]:
+                            entry["status"] = "leaky"
+                timing["export"] = time.perf_counter() - tic
+                entry["components"][component] = timing
+    except Exception:  # pylint: disable=broad-except
+        # A failing variant should not stop the rest of the sweep.
+        entry["status"] = "failed"
+        entry["error"] = traceback.format_exc()
+
+    entry["wall_time"] = time.perf_counter() - start
+    return entry
+
+
+def run_sweep(variants: Sequence[Mapping[str, Any]],
+              output_dir: str,
+              base: Union[str, Mapping[str, Any], ConfigValues, None] = None,
+              components: Sequence[str] = DEFAULT_COMPONENTS,
+              max_triangle_size: float = 200.0,
+              exp_factor: Optional[float] = None,
+              workers: Optional[int] = None,
+              cache_dir: Optional[str] = None,
+              binary: bool = False,
+              check: bool = False,
+              mesh_cache_dir: Optional[str] = None) -> Dict[str, Any]:
+    """run_sweep : Builds and exports every variant over a process pool and
+    writes manifest.json to the output directory.
+
+    Args:
+        variants (Sequence[Mapping[str, Any]]): the overrides of each variant,
+        with the ConfigValues names, e.g. the output of grid().
+        output_dir (str): every variant is written to its own subdirectory.
+        base (str, Mapping, ConfigValues, optional): the base design, defaults
+        to the bundled STOK_CONFIG.
+        components (Sequence[str]): the STOK builders to run for each variant.
+        max_triangle_size (float): passed to export_to_stl.
+        exp_factor (float, optional): deprecated, a value other than None
+        gives a FutureWarning, see export_to_stl.
+        workers (int, optional): the number of processes, defaults to the cpu count.
+        cache_dir (str, optional): a geometry cache directory shared by the workers.
+        binary (bool): write binary STL files, about five times smaller than ascii.
+        check (bool): check that every STL file is watertight, variants with a
+        leaky file get the status "leaky".
+        mesh_cache_dir (str, optional): a mesh cache directory shared by the workers.
+
+    Returns:
+        Dict[str, Any]: the manifest.
+    """
+
+    if exp_factor is not None:
+        # Warned here once, not in every worker.
+        warnings.warn("exp_factor does nothing and will be removed, leave it as None.",
+                      FutureWarning, stacklevel=2)
+
+    if base is None or isinstance(base, str):
+        base_values = load_config(base)
+    elif isinstance(base, ConfigValues):
+        base_values = base
+    else:
+        base_values = config_from_mapping(base)
+
+    # Check every variant before starting any work.
+    for overrides in variants:
+        config_from_mapping(overrides, base=base_values)
+
+    os.makedirs(output_dir, exist_ok=True)
+    directories = [os.path.join(output_dir, f"variant_{i:04d}") for i in range(len(variants))]
+
+    start = time.perf_counter()
+    # gmsh and OCC do not like being forked, so the workers are spawned.
+    with ProcessPoolExecutor(max_workers=workers,
+                             mp_context=multiprocessing.get_context("spawn")) as executor:
+        futures = [executor.submit(run_variant, base_values, overrides, directory,
+                                   tuple(components), max_triangle_size, None,
+                                   cache_dir, binary, check, mesh_cache_dir)
+                   for overrides, directory in zip(variants, directories)]
+        entries = [future.result() for future in futures]
+
+    manifest = {"base": base_values.as_dict(),
+                "components": list(components),
+                "max_triangle_size": max_triangle_size,
+                "binary": binary,
+                "check": check,
+                "workers": workers or os.cpu_count(),
+                "wall_time": time.perf_counter() - start,
+                "variants": entries}
+
+    with open(os.path.join(output_dir, "manifest.json"), "w", encoding="utf8") as file:
+        json.dump(manifest, file, indent=2)
+
+    return manifest
+
+
+def _parse_assignment(text: str) -> Any:
+    """_parse_assignment : Splits a NAME=JSON command line argument."""
+    name, _, value = text.partition("=")
+    if not value:
+        raise argparse.ArgumentTypeError(f"Expected NAME=VALUE, got {text!r}.")
+    return name.strip(), json.loads(value)
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    """main : The command line entry point of the sweep, exits with status 1
+    if a variant failed."""
+
+    parser = argparse.ArgumentParser(description="Run a STOK parameter sweep.")
+    parser.add_argument("--config", default=None,
+                        help="base configuration file, defaults to the bundled one")
+    parser.add_argument("--output", required=True, help="output directory")
+    parser.add_argument("--grid", action="append", default=[], type=_parse_assignment,
+                        metavar="NAME=[VALUES]",
+                        help="values to sweep over as a JSON list, can be repeated")
+    parser.add_argument("--variants", default=None,
+                        help="JSON file with a list of override mappings")
+    parser.add_argument("--study", default=None,
+                        help="JSON, TOML or CSV study with a base and a table of variants, "
+                             "see stok.study")
+    parser.add_argument("--components", nargs="+", default=list(DEFAULT_COMPONENTS))
+    parser.add_argument("--max-triangle-size", type=float, required=True)
+    parser.add_argument("--exp-factor", type=float, default=None,
+                        help="deprecated, does nothing")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--cache-dir", default=None,
+                        help="geometry cache directory shared by the workers")
+    parser.add_argument("--mesh-cache-dir", default=None,
+                        help="mesh cache directory shared by the workers")
+    parser.add_argument("--binary", action="store_true", help="write binary STL files")
+    parser.add_argument("--check", action="store_true",
+                        help="check that every STL file is watertight")
+    args = parser.parse_args(argv)
+
+    base: Union[str, ConfigValues, None] = args.config
+    variants: List[Dict[str, Any]] = []
+    if args.study is not None:
+        # Studies need NumPy, which plain sweeps do not.
+        from .study import load_study  # pylint: disable=import-outside-toplevel
+
+        study = load_study(args.study, base=args.config)
+        base = study.base
+        variants.extend(study.variants())
+    if args.variants is not None:
+        with open(args.variants, "r", encoding="utf8") as file:
+            variants.extend(json.load(file))
+    if args.grid:
+        variants.extend(grid(**dict(args.grid)))
+    if not variants:
+        variants.append({})
+
+    manifest = run_sweep(variants, args.output, base=base,
+                         components=args.components,
+                         max_triangle_size=args.max_triangle_size,
+                         exp_factor=args.exp_factor, workers=args.workers,
+                         cache_dir=args.cache_dir, binary=args.binary,
+                         check=args.check, mesh_cache_dir=args.mesh_cache_dir)
+
+    failed = [entry for entry in manifest["variants"] if entry["status"] != "ok"]
+    print(f"{len(manifest['variants'])} variants in {manifest['wall_time']:.1f} s, "
+          f"{len(failed)} failed.")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
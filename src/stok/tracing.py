@@ -0,0 +1,257 @@
+"""Opt-in timing spans for the STOK builders, their boolean operations and
+the gmsh export phases. Tracing is off by default, then every span is a
+shared no-op object and costs a global lookup and a call.
+
+    with tracing() as tracer:
+        reactor.containment_with_divertor_and_ports()
+    tracer.to_chrome_trace("trace.json")
+"""
+import contextlib
+import csv
+import functools
+import json
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+
+class Span:
+    """One timed region, times are in seconds from the start of the tracer.
+
+    Args:
+        name (str): the name of the region, e.g. the builder.
+        category (str): "builder", "boolean" or "export".
+        start (float): the start time.
+        depth (int): the number of enclosing spans.
+        thread (int): the thread the span ran in.
+        attributes (Dict[str, Any]): counts and other values of the span.
+    """
+    __slots__ = ("name", "category", "start", "duration", "depth", "thread", "attributes")
+
+    def __init__(self, name: str, category: str, start: float, depth: int, thread: int,
+                 attributes: Dict[str, Any]) -> None:
+        self.name = name
+        self.category = category
+        self.start = start
+        self.duration = 0.0
+        self.depth = depth
+        self.thread = thread
+        self.attributes = attributes
+
+    def set(self, **attributes: Any) -> None:
+        """set : Adds attributes to the span."""
+        self.attributes.update(attributes)
+
+
+class _NullSpan:
+    """The span handed out while tracing is off."""
+
+    def __enter__(self) -> "_NullSpan":
+        return self
+
+    def __exit__(self, *exc_info) -> bool:
+        return False
+
+    def set(self, **attributes: Any) -> None:
+        """set : Does nothing."""
+
+
+_NULL_SPAN = _NullSpan()
+
+# The tracer that records the spans, None while tracing is off.
+_ACTIVE: Optional["Tracer"] = None
+
+
+class Tracer:
+    """Records nested spans, from any number of threads."""
+
+    def __init__(self) -> None:
+        self.spans: List[Span] = []
+        self._origin = time.perf_counter()
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def span(self, name: str, category: str = "", **attributes: Any) -> Iterator[Span]:
+        """span : Times the enclosed block.
+
+        Args:
+            name (str): the name of the span.
+            category (str): the category of the span.
+            attributes: initial attributes of the span.
+
+        Yields:
+            Span: the span, attributes can be added while it is open.
+        """
+        depth = getattr(self._local, "depth", 0)
+        current = Span(name, category, time.perf_counter() - self._origin, depth,
+                       threading.get_ident(), attributes)
+        self._local.depth = depth + 1
+        try:
+            yield current
+        finally:
+            current.duration = time.perf_counter() - self._origin - current.start
+            self._local.depth = depth
+            with self._lock:
+                self.spans.append(current)
+
+    def totals(self) -> Dict[Tuple[str, str], Tuple[int, float]]:
+        """totals : The number of calls and total time of every span name.
+
+        Returns:
+            Dict[Tuple[str, str], Tuple[int, float]]: the count and seconds by
+            category and name.
+        """
+        totals: Dict[Tuple[str, str], Tuple[int, float]] = {}
+        for current in self.spans:
+            count, total = totals.get((current.category, current.name), (0, 0.0))
+            totals[(current.category, current.name)] = (count + 1, total + current.duration)
+        return totals
+
+    def to_chrome_trace(self, filename: str) -> None:
+        """to_chrome_trace : Writes the spans in the Chrome trace event format,
+        which chrome://tracing and Perfetto can open.
+
+        Args:
+            filename (str): the name of the JSON file.
+        """
+        pid = os.getpid()
+        events = [{"name": current.name, "cat": current.category, "ph": "X",
+                   "ts": current.start*1e6, "dur": current.duration*1e6,
+                   "pid": pid, "tid": current.thread, "args": current.attributes}
+                  for current in sorted(self.spans, key=lambda item: item.start)]
+        with open(filename, "w", encoding="utf8") as file:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, file)
+
+    def to_csv(self, filename: str) -> None:
+        """to_csv : Writes the spans as a flat table, one row per span with a
+        column for every attribute.
+
+        Args:
+            filename (str): the name of the CSV file.
+        """
+        spans = sorted(self.spans, key=lambda item: item.start)
+        keys = sorted({key for current in spans for key in current.attributes})
+        with open(filename, "w", encoding="utf8", newline="") as file:
+            writer = csv.writer(file)
+            writer.writerow(["name", "category", "thread", "depth", "start", "duration"] + keys)
+            for current in spans:
+                writer.writerow([current.name, current.category, current.thread, current.depth,
+                                 f"{current.start:.6f}", f"{current.duration:.6f}"] +
+                                [current.attributes.get(key, "") for key in keys])
+
+
+def tracing_enabled() -> bool:
+    """tracing_enabled : Checks if spans are being recorded."""
+    return _ACTIVE is not None
+
+
+def span(name: str, category: str = "", **attributes: Any):
+    """span : Times the enclosed block if tracing is on.
+
+    Args:
+        name (str): the name of the span.
+        category (str): the category of the span.
+        attributes: initial attributes of the span.
+
+    Returns:
+        A context manager that yields the span, or a no-op stand-in.
+    """
+    if _ACTIVE is None:
+        return _NULL_SPAN
+    return _ACTIVE.span(name, category, **attributes)
+
+
+def shape_counts(result: Any) -> Dict[str, int]:
+    """shape_counts : The number of solids and faces in a builder output.
+
+    Args:
+        result: a workplane, shape, or a (nested) list of them.
+
+    Returns:
+        Dict[str, int]: the solid and face counts.
+    """
+    counts = {"solids": 0, "faces": 0}
+    pending = [result]
+    while pending:
+        item = pending.pop()
+        if isinstance(item, (list, tuple)):
+            pending.extend(item)
+        elif hasattr(item, "vals"):
+            pending.extend(item.vals())
+        elif hasattr(item, "Faces"):
+            counts["solids"] += len(item.Solids())
+            counts["faces"] += len(item.Faces())
+    return counts
+
+
+def traced(category: str = "builder") -> Callable:
+    """traced : Decorates a method so every call is a span, with the shape
+    counts of its output.
+
+    Args:
+        category (str): the category of the spans.
+    """
+
+    def decorator(method: Callable) -> Callable:
+        @functools.wraps(method)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            if _ACTIVE is None:
+                return method(*args, **kwargs)
+            with _ACTIVE.span(method.__name__, category) as current:
+                result = method(*args, **kwargs)
+                current.set(**shape_counts(result))
+            return result
+
+        return wrapper
+
+    return decorator
+
+
+def _traced_boolean(name: str, method: Callable) -> Callable:
+    """_traced_boolean : Wraps a boolean operation of cq.Shape."""
+    @functools.wraps(method)
+    def wrapper(self, *args: Any, **kwargs: Any) -> Any:
+        with span(name, "boolean", operands=1 + len(args)):
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+def _patch_booleans() -> List[Tuple[type, str, Callable]]:
+    """_patch_booleans : Times every OCC boolean operation. The Workplane
+    operations all end in these, so each boolean is recorded exactly once."""
+    import cadquery as cq  # pylint: disable=import-outside-toplevel
+
+    originals = []
+    for cls in (cq.Shape, cq.Compound):
+        for name in ("cut", "fuse", "intersect"):
+            if name in cls.__dict__:
+                originals.append((cls, name, cls.__dict__[name]))
+                setattr(cls, name, _traced_boolean(name, cls.__dict__[name]))
+    return originals
+
+
+@contextlib.contextmanager
+def tracing(tracer: Optional[Tracer] = None) -> Iterator[Tracer]:
+    """tracing : Records spans for the enclosed block.
+
+    Args:
+        tracer (Tracer, optional): the tracer to add the spans to, a new one
+        by default.
+
+    Yields:
+        Tracer: the tracer.
+    """
+    global _ACTIVE  # pylint: disable=global-statement
+
+    tracer = Tracer() if tracer is None else tracer
+    previous = _ACTIVE
+    originals = _patch_booleans() if previous is None else []
+    _ACTIVE = tracer
+    try:
+        yield tracer
+    finally:
+        _ACTIVE = previous
+        for cls, name, method in originals:
+            setattr(cls, name, method)
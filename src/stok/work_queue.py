@@ -0,0 +1,533 @@
+"""A job queue in a shared directory, to spread sweep variants over cluster
+nodes that only share a filesystem. Every job is a JSON file that moves
+between directories by atomic renames, so exactly one worker can claim it:
+
+    pending/  jobs waiting for a worker
+    leased/   claimed jobs, the file time is the heartbeat of the worker
+    failed/   jobs that failed max_attempts times
+    results/  the record of every finished job
+    outputs/  the stl files of every finished job
+
+Jobs are named by the hash of everything that changes their output, so a
+job whose result is recorded is never run again. Leases that are not renewed
+within lease_timeout, because the worker died, are put back into pending/,
+and a queue is resumed after a crash by starting workers on it again. The
+clocks of the nodes should agree to well within lease_timeout.
+
+Example:
+    stok-queue queue_dir submit --grid "nr_ports=[8, 16]" --max-triangle-size 200
+    stok-queue queue_dir work            # on every node, or --local 4 on one box
+    stok-queue queue_dir status
+"""
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import shutil
+import socket
+import time
+import traceback
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, List, Mapping, Optional, Sequence, Union
+
+from .config import ConfigValues, config_from_mapping, load_config
+from .sweep import DEFAULT_COMPONENTS, _parse_assignment, grid
+
+# The subdirectories of a queue.
+_STATES = ("pending", "leased", "failed", "results", "outputs")
+
+# Job fields that do not change the output and are left out of the hash.
+_UNHASHED = ("id", "attempts", "worker", "errors", "submitted", "exp_factor")
+
+
+def job_hash(job: Mapping[str, Any]) -> str:
+    """job_hash : The hash of everything that changes the output of a job.
+
+    Args:
+        job (Mapping[str, Any]): the job.
+
+    Returns:
+        str: the hex digest.
+    """
+    spec = {key: value for key, value in job.items() if key not in _UNHASHED}
+    spec["base"] = {key: value for key, value in spec.get("base", {}).items()
+                    if key != "conf_path"}
+    payload = json.dumps(spec, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf8")).hexdigest()
+
+
+def _write_json(path: str, content: Mapping[str, Any]) -> None:
+    """_write_json : Writes a file under a temporary name first, so other
+    nodes never read it half written."""
+    temporary = f"{path}.{socket.gethostname()}.{os.getpid()}.tmp"
+    with open(temporary, "w", encoding="utf8") as file:
+        json.dump(content, file, indent=2)
+    os.replace(temporary, path)
+
+
+def _read_json(path: str) -> Optional[Dict[str, Any]]:
+    """_read_json : Reads a file, None if it was moved away in the meantime."""
+    try:
+        with open(path, "r", encoding="utf8") as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return None
+
+
+class WorkQueue:
+    """A job queue in a directory, see the module documentation.
+
+    Args:
+        directory (str): the queue directory, created if missing.
+        lease_timeout (float): the seconds after the last heartbeat at which a
+        job is taken away from its worker.
+        max_attempts (int): the number of times a job is run before it is
+        moved to failed/.
+    """
+
+    def __init__(self, directory: str, lease_timeout: float = 300.0,
+                 max_attempts: int = 3) -> None:
+        self.directory = directory
+        self.lease_timeout = lease_timeout
+        self.max_attempts = max_attempts
+        for state in _STATES:
+            os.makedirs(os.path.join(directory, state), exist_ok=True)
+
+    def _path(self, state: str, job_id: str) -> str:
+        return os.path.join(self.directory, state, job_id + ".json")
+
+    def _ids(self, state: str) -> List[str]:
+        return sorted(name[:-5] for name in os.listdir(os.path.join(self.directory, state))
+                      if name.endswith(".json"))
+
+    def output_dir(self, job_id: str) -> str:
+        """output_dir : Where the stl files of a finished job are."""
+        return os.path.join(self.directory, "outputs", job_id)
+
+    def result(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """result : The record of a finished job, None if it has not finished."""
+        return _read_json(self._path("results", job_id))
+
+    def submit(self, job: Mapping[str, Any]) -> str:
+        """submit : Adds a job, unless the same job is finished, queued or
+        running already.
+
+        Args:
+            job (Mapping[str, Any]): the job, see submit_sweep for the fields.
+
+        Returns:
+            str: the id of the job, its hash.
+        """
+        job_id = job_hash(job)
+        if not any(os.path.exists(self._path(state, job_id))
+                   for state in ("pending", "leased", "results")):
+            _write_json(self._path("pending", job_id),
+                        dict(job, id=job_id, attempts=0, errors=[], submitted=time.time()))
+        return job_id
+
+    def submit_sweep(self, variants: Sequence[Mapping[str, Any]],
+                     base: Union[str, Mapping[str, Any], ConfigValues, None] = None,
+                     components: Sequence[str] = DEFAULT_COMPONENTS,
+                     max_triangle_size: float = 200.0,
+                     exp_factor: Optional[float] = None,
+                     binary: bool = False,
+                     check: bool = False) -> List[str]:
+        """submit_sweep : Adds one job per variant, like stok.sweep.run_sweep.
+
+        Args:
+            variants (Sequence[Mapping[str, Any]]): the overrides of each variant.
+            base (str, Mapping, ConfigValues, optional): the base design,
+            defaults to the bundled STOK_CONFIG.
+            components (Sequence[str]): the STOK builders to run for each variant.
+            max_triangle_size (float): passed to export_to_stl.
+            exp_factor (float, optional): deprecated, see stok.sweep.run_sweep.
+            binary (bool): write binary STL files.
+            check (bool): check that every STL file is watertight.
+
+        Raises:
+            KeyError: if a variant has an unknown key.
+
+        Returns:
+            List[str]: the job ids, in the order of the variants.
+        """
+
+        if exp_factor is not None:
+            warnings.warn("exp_factor does nothing and will be removed, leave it as None.",
+                          FutureWarning, stacklevel=2)
+
+        if base is None or isinstance(base, str):
+            base_values = load_config(base)
+        elif isinstance(base, ConfigValues):
+            base_values = base
+        else:
+            base_values = config_from_mapping(base)
+
+        # Check every variant before submitting any.
+        for overrides in variants:
+            config_from_mapping(overrides, base=base_values)
+
+        base_dict = base_values.as_dict()
+        return [self.submit({"base": base_dict, "overrides": dict(overrides),
+                             "components": list(components),
+                             "max_triangle_size": max_triangle_size,
+                             "binary": binary, "check": check})
+                for overrides in variants]
+
+    def claim(self, worker: str) -> Optional[Dict[str, Any]]:
+        """claim : Takes the next pending job. The rename from pending/ to
+        leased/ succeeds for a single worker only.
+
+        Args:
+            worker (str): the name of the worker.
+
+        Returns:
+            Dict[str, Any] or None: the job, None if nothing is pending.
+        """
+
+        for job_id in self._ids("pending"):
+            leased = self._path("leased", job_id)
+            try:
+                os.rename(self._path("pending", job_id), leased)
+                # The rename keeps the time of the pending file, which must
+                # not count as an old heartbeat.
+                os.utime(leased)
+            except FileNotFoundError:
+                # Another worker was faster.
+                continue
+            job = _read_json(leased)
+            if job is None:
+                continue
+            if self.result(job_id) is not None:
+                # Finished by a worker whose lease had expired.
+                self._remove(leased)
+                continue
+            job["worker"] = worker
+            _write_json(leased, job)
+            return job
+        return None
+
+    def heartbeat(self, job: Mapping[str, Any]) -> bool:
+        """heartbeat : Renews the lease of a job.
+
+        Args:
+            job (Mapping[str, Any]): the job.
+
+        Returns:
+            bool: False if the lease was lost, the job was given to another
+            worker after lease_timeout without a heartbeat.
+        """
+        try:
+            os.utime(self._path("leased", job["id"]))
+        except FileNotFoundError:
+            return False
+        return True
+
+    def complete(self, job: Mapping[str, Any], result: Mapping[str, Any],
+                 output: Optional[str] = None) -> None:
+        """complete : Records a finished job.
+
+        Args:
+            job (Mapping[str, Any]): the job.
+            result (Mapping[str, Any]): the record, written to results/.
+            output (str, optional): the directory the job wrote to, it is
+            moved to output_dir unless another worker finished first.
+        """
+
+        job_id = job["id"]
+        record = dict(result, id=job_id, worker=job.get("worker"), attempts=job["attempts"] + 1)
+        if output is not None:
+            final = self.output_dir(job_id)
+            try:
+                os.rename(output, final)
+            except OSError:
+                # The same job finished twice, the first output is kept.
+                shutil.rmtree(output, ignore_errors=True)
+            def moved(path: str) -> str:
+                return os.path.join(final, os.path.relpath(path, output))
+            record["files"] = [moved(path) for path in result.get("files", [])]
+            if "checks" in result:
+                record["checks"] = {moved(path): check for path, check in result["checks"].items()}
+            record["directory"] = final
+        if self.result(job_id) is None:
+            _write_json(self._path("results", job_id), record)
+        self._release(job)
+
+    def fail(self, job: Mapping[str, Any], error: str) -> bool:
+        """fail : Records a failed attempt, the job is queued again until it
+        failed max_attempts times.
+
+        Args:
+            job (Mapping[str, Any]): the job.
+            error (str): the error of the attempt.
+
+        Returns:
+            bool: True if the job will be run again.
+        """
+        if not self._release(job):
+            # The lease expired and the job was queued again already.
+            return True
+        return self._retry(job, error)
+
+    def _retry(self, job: Mapping[str, Any], error: str) -> bool:
+        """_retry : Moves a job that is not leased anymore back to pending/,
+        or to failed/ after max_attempts."""
+        job = dict(job, attempts=job["attempts"] + 1,
+                   errors=list(job.get("errors", [])) + [error])
+        job.pop("worker", None)
+        retry = job["attempts"] < self.max_attempts
+        _write_json(self._path("pending" if retry else "failed", job["id"]), job)
+        return retry
+
+    def _release(self, job: Mapping[str, Any]) -> bool:
+        """_release : Removes the lease of a job, if it is still ours.
+
+        Returns:
+            bool: True if the lease was ours.
+        """
+        leased = self._path("leased", job["id"])
+        current = _read_json(leased)
+        if current is None or current.get("worker") != job.get("worker"):
+            return False
+        self._remove(leased)
+        return True
+
+    def _scratch(self, job: Mapping[str, Any]) -> str:
+        """_scratch : The directory a leased job is written to before complete."""
+        return os.path.join(self.directory, "outputs", f"{job['id']}.{job.get('worker')}.tmp")
+
+    @staticmethod
+    def _remove(path: str) -> None:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def requeue_expired(self) -> int:
+        """requeue_expired : Puts jobs whose lease was not renewed within
+        lease_timeout back into pending/, or into failed/ after max_attempts.
+        Any worker can do this, the rename to a private name makes sure every
+        expired lease is handled once.
+
+        Returns:
+            int: the number of expired leases.
+        """
+
+        expired = 0
+        now = time.time()
+        leased_dir = os.path.join(self.directory, "leased")
+        for name in os.listdir(leased_dir):
+            if name.endswith(".tmp"):
+                continue
+            path = os.path.join(leased_dir, name)
+            try:
+                if now - os.stat(path).st_mtime < self.lease_timeout:
+                    continue
+                # Also picks up the leftovers of a worker that died while reaping.
+                reaping = f"{path}.{socket.gethostname()}.{os.getpid()}.reaping"
+                os.rename(path, reaping)
+            except FileNotFoundError:
+                continue
+            job = _read_json(reaping)
+            if job is not None and "id" in job:
+                # The files of the worker, which most likely died.
+                shutil.rmtree(self._scratch(job), ignore_errors=True)
+                self._retry(job, f"lease of {job.get('worker')} expired")
+                expired += 1
+            self._remove(reaping)
+        return expired
+
+    def status(self) -> Dict[str, int]:
+        """status : The number of jobs in every state.
+
+        Returns:
+            Dict[str, int]: pending, leased, failed and finished jobs.
+        """
+        return {"pending": len(self._ids("pending")), "leased": len(self._ids("leased")),
+                "failed": len(self._ids("failed")), "finished": len(self._ids("results"))}
+
+
+def _run_job(job: Mapping[str, Any], directory: str) -> Dict[str, Any]:
+    """_run_job : Runs a job in the worker's child process, see stok.sweep.run_variant."""
+
+    from .sweep import run_variant  # pylint: disable=import-outside-toplevel
+
+    return run_variant(config_from_mapping(job["base"]), job["overrides"], directory,
+                       tuple(job["components"]), job["max_triangle_size"],
+                       binary=job["binary"], check=job["check"])
+
+
+def _discard(executor: ProcessPoolExecutor) -> None:
+    """_discard : Shuts an executor down without waiting for its running
+    task, whose child process is stopped."""
+    # The running task cannot be cancelled, stop its process instead.
+    for process in list((executor._processes or {}).values()):  # pylint: disable=protected-access
+        process.terminate()
+    executor.shutdown(wait=False)
+
+
+def run_worker(directory: str, worker: Optional[str] = None, lease_timeout: float = 300.0,
+               heartbeat: float = 30.0, max_attempts: int = 3, poll: float = 5.0,
+               exit_when_empty: bool = True) -> int:
+    """run_worker : Runs jobs until the queue is empty. Every job runs in a
+    child process, so the worker keeps renewing its lease while OCC holds
+    the interpreter, and notices when the child dies.
+
+    Args:
+        directory (str): the queue directory.
+        worker (str, optional): the name of the worker, defaults to host-pid.
+        lease_timeout (float): see WorkQueue.
+        heartbeat (float): the seconds between lease renewals, well below
+        lease_timeout.
+        max_attempts (int): see WorkQueue.
+        poll (float): the seconds to wait when there is no pending job.
+        exit_when_empty (bool): stop once no job is pending or leased,
+        otherwise wait for new jobs forever.
+
+    Returns:
+        int: the number of jobs this worker finished.
+    """
+
+    queue = WorkQueue(directory, lease_timeout, max_attempts)
+    worker = f"{socket.gethostname()}-{os.getpid()}" if worker is None else worker
+    context = multiprocessing.get_context("spawn")
+    executor = ProcessPoolExecutor(max_workers=1, mp_context=context)
+    finished = 0
+    try:
+        while True:
+            queue.requeue_expired()
+            job = queue.claim(worker)
+            if job is None:
+                status = queue.status()
+                if exit_when_empty and not status["pending"] and not status["leased"]:
+                    return finished
+                time.sleep(poll)
+                continue
+
+            output = queue._scratch(job)  # pylint: disable=protected-access
+            future = executor.submit(_run_job, job, output)
+            entry: Optional[Dict[str, Any]] = None
+            error = ""
+            lost = False
+            while True:
+                try:
+                    entry = future.result(timeout=heartbeat)
+                    break
+                except FutureTimeout:
+                    if not queue.heartbeat(job):
+                        # The lease expired and the job was requeued, another
+                        # worker owns it now.
+                        lost = True
+                        if not future.cancel():
+                            _discard(executor)
+                            executor = ProcessPoolExecutor(max_workers=1, mp_context=context)
+                        break
+                except BrokenProcessPool:
+                    error = "the worker process died"
+                    executor.shutdown(wait=False)
+                    executor = ProcessPoolExecutor(max_workers=1, mp_context=context)
+                    break
+                except Exception:  # pylint: disable=broad-except
+                    error = traceback.format_exc()
+                    break
+
+            if lost:
+                shutil.rmtree(output, ignore_errors=True)
+            elif entry is not None and entry["status"] != "failed":
+                queue.complete(job, entry, output)
+                finished += 1
+            else:
+                shutil.rmtree(output, ignore_errors=True)
+                queue.fail(job, entry["error"] if entry is not None else error)
+    finally:
+        executor.shutdown(wait=True)
+
+
+def run_local(directory: str, workers: int, **kwargs: Any) -> int:
+    """run_local : Runs several workers on this machine, in place of nodes.
+
+    Args:
+        directory (str): the queue directory.
+        workers (int): the number of worker processes.
+        kwargs: passed to run_worker.
+
+    Returns:
+        int: the number of jobs finished.
+    """
+    with ProcessPoolExecutor(max_workers=workers,
+                             mp_context=multiprocessing.get_context("spawn")) as executor:
+        futures = [executor.submit(run_worker, directory, **kwargs) for _ in range(workers)]
+        return sum(future.result() for future in futures)
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    """main : The command line entry point of the queue."""
+
+    parser = argparse.ArgumentParser(description="A STOK job queue in a shared directory.")
+    parser.add_argument("directory", help="the queue directory")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    submit = commands.add_parser("submit", help="add sweep variants as jobs")
+    submit.add_argument("--config", default=None,
+                        help="base configuration file, defaults to the bundled one")
+    submit.add_argument("--grid", action="append", default=[], type=_parse_assignment,
+                        metavar="NAME=[VALUES]",
+                        help="values to sweep over as a JSON list, can be repeated")
+    submit.add_argument("--study", default=None, help="a study file, see stok.study")
+    submit.add_argument("--components", nargs="+", default=list(DEFAULT_COMPONENTS))
+    submit.add_argument("--max-triangle-size", type=float, required=True)
+    submit.add_argument("--exp-factor", type=float, default=None,
+                        help="deprecated, does nothing")
+    submit.add_argument("--binary", action="store_true", help="write binary STL files")
+    submit.add_argument("--check", action="store_true",
+                        help="check that every STL file is watertight")
+
+    work = commands.add_parser("work", help="run jobs until the queue is empty")
+    work.add_argument("--local", type=int, default=1,
+                      help="the number of worker processes on this machine")
+    work.add_argument("--lease-timeout", type=float, default=300.0)
+    work.add_argument("--heartbeat", type=float, default=30.0)
+    work.add_argument("--max-attempts", type=int, default=3)
+    work.add_argument("--forever", action="store_true", help="wait for new jobs")
+
+    commands.add_parser("status", help="count the jobs in every state")
+    args = parser.parse_args(argv)
+
+    if args.command == "submit":
+        base: Union[str, ConfigValues, None] = args.config
+        variants: List[Dict[str, Any]] = []
+        if args.study is not None:
+            from .study import load_study  # pylint: disable=import-outside-toplevel
+
+            study = load_study(args.study, base=args.config)
+            base = study.base
+            variants.extend(study.variants())
+        if args.grid:
+            variants.extend(grid(**dict(args.grid)))
+        if not variants:
+            variants.append({})
+        ids = WorkQueue(args.directory).submit_sweep(
+            variants, base=base, components=args.components,
+            max_triangle_size=args.max_triangle_size, exp_factor=args.exp_factor,
+            binary=args.binary, check=args.check)
+        print(f"{len(ids)} jobs, {len(set(ids))} distinct.")
+    elif args.command == "work":
+        options = {"lease_timeout": args.lease_timeout, "heartbeat": args.heartbeat,
+                   "max_attempts": args.max_attempts, "exit_when_empty": not args.forever}
+        if args.local > 1:
+            finished = run_local(args.directory, args.local, **options)
+        else:
+            finished = run_worker(args.directory, **options)
+        print(f"{finished} jobs finished.")
+
+    status = WorkQueue(args.directory).status()
+    print(", ".join(f"{count} {state}" for state, count in status.items()))
+    return 1 if status["failed"] else 0
+
+
+if __name__ == "__main__":
+    import sys
+    sys.exit(main())